@@ -1 +1,17 @@
 from django.contrib import admin
+from .models import BloodRequest, Donation
+
+
+# __str__ of both models reads the related user's username, so join it in
+@admin.register(BloodRequest)
+class BloodRequestAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "status", "district"]
+    list_filter = ["status", "blood_group"]
+    list_select_related = ["requester"]
+    raw_id_fields = ["requester"]
+
+
+@admin.register(Donation)
+class DonationAdmin(admin.ModelAdmin):
+    list_select_related = ["donor"]
+    raw_id_fields = ["donor"]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BloodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blood'
+
+    def ready(self):
+        # Connects the rollup signal receivers
+        from . import stats  # noqa: F401
@@ -0,0 +1,59 @@
+from django.db import transaction
+from functools import partial
+from rest_framework import serializers
+from rokto_dan.bulk import BulkImporter
+from user.bulk import resolve_usernames
+from user.cache import invalidate_user_dashboard
+from user.constants import BLOOD_GROUP
+from user.models import DonorProfile
+from .models import Donation
+from .stats import record_bulk_change
+
+# Column order for donation exports; imports accept the same columns
+DONATION_EXPORT_FIELDS = ["donor__username", "blood_group", "donation_date", "details"]
+
+
+class DonationImportSerializer(serializers.Serializer):
+    username = serializers.CharField()
+    blood_group = serializers.ChoiceField(choices=BLOOD_GROUP)
+    donation_date = serializers.DateField()
+    details = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class DonationImporter(BulkImporter):
+    serializer_class = DonationImportSerializer
+
+    def build(self, valid_rows):
+        user_ids = resolve_usernames(valid_rows)
+        instances, errors = [], {}
+        for index, data in valid_rows:
+            donor_id = user_ids.get(data["username"])
+            if donor_id is None:
+                errors[index] = {"username": ["Unknown user."]}
+                continue
+            instances.append(
+                Donation(
+                    donor_id=donor_id,
+                    blood_group=data["blood_group"],
+                    donation_date=data["donation_date"],
+                    details=data.get("details"),
+                )
+            )
+        return instances, errors
+
+    def save(self, instances):
+        Donation.objects.bulk_create(instances)
+        # bulk_create sends no post_save, so fold the donations into the
+        # donors' eligibility here, with one UPDATE for the chunk
+        latest = {}
+        for donation in instances:
+            date = donation.donation_date
+            latest[donation.donor_id] = max(date, latest.get(donation.donor_id, date))
+        DonorProfile.objects.record_donations(latest)
+        record_bulk_change(
+            Donation,
+            [],
+            [(d.donor_id, d.blood_group, d.donation_date) for d in instances],
+        )
+        for donor_id in latest:
+            transaction.on_commit(partial(invalidate_user_dashboard, donor_id))
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from user.constants import BLOOD_COMPATIBILITY
+
+
+class Subscription:
+    """A connected donor waiting for blood requests they could satisfy."""
+
+    def __init__(self, user_id, blood_group, district):
+        self.user_id = user_id
+        self.blood_group = blood_group
+        self.district = district.upper()
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.BLOOD_EVENTS_QUEUE_SIZE)
+
+    def deliver(self, event):
+        """
+        Hand ``event`` to the subscriber's event loop; safe from any thread.
+        False once that loop is closed and the subscriber can't be reached.
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Event loop is closed: its connection went away unsubscribed
+            return False
+        return True
+
+    def _put(self, event):
+        # A client that stopped reading loses events rather than memory
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+
+class InProcessBackend:
+    """
+    Fan-out to subscribers connected to this process.
+
+    Subscribers are indexed by (blood group, district) so publishing touches
+    only the donors who can satisfy the request, not every open connection.
+    Another backend (e.g. Redis pub/sub across workers) only needs the same
+    subscribe / unsubscribe / publish methods and is selected with the
+    BLOOD_EVENTS_BACKEND setting.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(lambda: defaultdict(set))
+
+    def subscribe(self, subscription):
+        with self.lock:
+            self.subscribers[subscription.blood_group][subscription.district].add(
+                subscription
+            )
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            districts = self.subscribers[subscription.blood_group]
+            districts[subscription.district].discard(subscription)
+            if not districts[subscription.district]:
+                del districts[subscription.district]
+
+    def count(self):
+        with self.lock:
+            return sum(
+                len(subscriptions)
+                for districts in self.subscribers.values()
+                for subscriptions in districts.values()
+            )
+
+    def recipients(self, blood_group, district, requester_id):
+        district = district.upper()
+        with self.lock:
+            for donor_group in BLOOD_COMPATIBILITY.get(blood_group, []):
+                districts = self.subscribers.get(donor_group, {})
+                # Requests without a district go to every compatible donor
+                groups = (
+                    [districts.get(district, ())] if district else districts.values()
+                )
+                for subscriptions in groups:
+                    for subscription in subscriptions:
+                        if subscription.user_id != requester_id:
+                            yield subscription
+
+    def publish(self, event):
+        """``event`` is a dict with blood_group, district, requester and data."""
+        recipients = list(
+            self.recipients(event["blood_group"], event["district"], event["requester"])
+        )
+        delivered = 0
+        for subscription in recipients:
+            if subscription.deliver(event["data"]):
+                delivered += 1
+            else:
+                self.unsubscribe(subscription)
+        return delivered
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.BLOOD_EVENTS_BACKEND)()
+
+
+def publish_blood_request(blood_request):
+    """Push a new request, as an SSE frame, to the donors who can satisfy it."""
+    from .serializers import BloodRequestSerializer
+
+    data = json.dumps(BloodRequestSerializer(blood_request).data, cls=DjangoJSONEncoder)
+    return get_backend().publish(
+        {
+            "blood_group": blood_request.blood_group,
+            "district": blood_request.district,
+            "requester": blood_request.requester_id,
+            "data": f"id: {blood_request.pk}\nevent: blood_request\ndata: {data}\n\n",
+        }
+    )
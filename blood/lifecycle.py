@@ -0,0 +1,195 @@
+"""
+Request lifecycle: expire overdue requests and archive old rows.
+
+Pending requests still open ``BLOOD_REQUEST_EXPIRE_AFTER_DAYS`` after their
+date become ``expired``. Closed requests (fulfilled, canceled, expired) and
+donations older than ``BLOOD_ARCHIVE_AFTER_DAYS`` move to the
+ArchivedBloodRequest/ArchivedDonation tables, so the tables every listing
+and dashboard reads stay small.
+
+Both steps work in keyset batches, each one transaction: the batch's rows
+are locked and read once, then changed with one set-based statement, and
+the rollups and cached dashboards are told about it since no signals are
+sent. ``manage.py run_lifecycle`` runs them once or in a loop;
+``start_scheduler`` runs them periodically inside a server process, and a
+ScheduledRun row makes sure only one of the server processes does so per
+interval.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from user.cache import invalidate_pending_dashboards, invalidate_user_dashboard
+from .models import (
+    ArchivedBloodRequest,
+    ArchivedDonation,
+    BloodRequest,
+    Donation,
+    ScheduledRun,
+    archiving,
+)
+from .stats import record_bulk_change
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ("fulfilled", "canceled", "expired")
+# The ScheduledRun claimed for one interval by the process that runs the
+# lifecycle, so server workers with a scheduler each do not all repeat it
+SCHEDULED_RUN = "blood.lifecycle"
+
+
+def invalidate_dashboards(user_ids, pending=False):
+    for user_id in set(user_ids):
+        invalidate_user_dashboard(user_id)
+    if pending:
+        invalidate_pending_dashboards()
+
+
+def expire_overdue_requests(today=None, batch_size=1000):
+    """Mark pending requests past their date (plus the grace) as expired."""
+    cutoff = (today or timezone.localdate()) - datetime.timedelta(
+        days=settings.BLOOD_REQUEST_EXPIRE_AFTER_DAYS
+    )
+    # request_status_date_idx
+    overdue = BloodRequest.objects.filter(status="pending", request_date__lt=cutoff)
+    expired = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                overdue.select_for_update()
+                .order_by("pk")
+                .values_list("pk", "requester_id", "district", "blood_group")[
+                    :batch_size
+                ]
+            )
+            if not rows:
+                return expired
+            BloodRequest.objects.filter(pk__in=[row[0] for row in rows]).update(
+                status="expired", updated_at=timezone.now()
+            )
+            record_bulk_change(
+                BloodRequest,
+                [(district, group, "pending") for _, _, district, group in rows],
+                [(district, group, "expired") for _, _, district, group in rows],
+            )
+            transaction.on_commit(
+                partial(invalidate_dashboards, [row[1] for row in rows], pending=True)
+            )
+        expired += len(rows)
+
+
+def archive(model, archive_model, queryset, owner_field, batch_size):
+    """
+    Move the rows of ``queryset`` into ``archive_model``: a bulk INSERT of
+    the batch, then one DELETE. Returns the number of rows moved.
+    """
+    fields = [field.attname for field in model._meta.concrete_fields]
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                queryset.select_for_update().order_by("pk").values(*fields)[:batch_size]
+            )
+            if not rows:
+                return moved
+            archive_model.objects.bulk_create(archive_model(**row) for row in rows)
+            # The delete signals leave rollups and eligibility alone: the
+            # rows still count, from the archive
+            token = archiving.set(True)
+            try:
+                model.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            finally:
+                archiving.reset(token)
+            transaction.on_commit(
+                partial(invalidate_dashboards, [row[owner_field] for row in rows])
+            )
+        moved += len(rows)
+
+
+def archive_requests(before, batch_size=1000):
+    closed = BloodRequest.objects.filter(
+        status__in=CLOSED_STATUSES, request_date__lt=before
+    )
+    return archive(
+        BloodRequest, ArchivedBloodRequest, closed, "requester_id", batch_size
+    )
+
+
+def archive_donations(before, batch_size=1000):
+    old = Donation.objects.filter(donation_date__lt=before)
+    return archive(Donation, ArchivedDonation, old, "donor_id", batch_size)
+
+
+def run_lifecycle(today=None, batch_size=1000):
+    """Expire, then archive; returns the number of rows each step changed."""
+    today = today or timezone.localdate()
+    before = today - datetime.timedelta(days=settings.BLOOD_ARCHIVE_AFTER_DAYS)
+    return {
+        "expired": expire_overdue_requests(today, batch_size),
+        "archived_requests": archive_requests(before, batch_size),
+        "archived_donations": archive_donations(before, batch_size),
+    }
+
+
+def claim_run(name, interval):
+    """
+    Start run ``name`` unless one started within ``interval`` seconds. One
+    conditional UPDATE, so of processes racing for the same run exactly one
+    gets it, on any database and whatever cache each process has.
+    """
+    ScheduledRun.objects.get_or_create(name=name)
+    now = timezone.now()
+    due = Q(started_at__isnull=True) | Q(
+        started_at__lte=now - datetime.timedelta(seconds=interval)
+    )
+    return ScheduledRun.objects.filter(due, name=name).update(started_at=now) == 1
+
+
+def run_scheduled(interval):
+    """
+    Run the lifecycle unless another process did within ``interval``
+    seconds; returns its counts, or None when it was skipped.
+    """
+    if not claim_run(SCHEDULED_RUN, interval):
+        return None
+    return run_lifecycle()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(interval=None):
+    """
+    Run the lifecycle every ``interval`` (default BLOOD_LIFECYCLE_INTERVAL)
+    seconds in a daemon thread of this process; started once per process,
+    and not at all when the interval is 0.
+    """
+    global _scheduler
+    interval = settings.BLOOD_LIFECYCLE_INTERVAL if interval is None else interval
+    with _scheduler_lock:
+        if _scheduler is not None or not interval:
+            return _scheduler
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    counts = run_scheduled(interval)
+                    if counts and any(counts.values()):
+                        logger.info("Request lifecycle: %s", counts)
+                except Exception:
+                    logger.exception("Request lifecycle run failed")
+                finally:
+                    close_old_connections()
+
+        _scheduler = threading.Thread(target=loop, name="blood-lifecycle", daemon=True)
+        _scheduler.start()
+        return _scheduler
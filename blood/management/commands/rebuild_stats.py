@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from blood.stats import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the supply/demand and donation rollups from the request, "
+        "donor and donation tables."
+    )
+
+    def handle(self, *args, **options):
+        supply_demand, donations = rebuild_rollups()
+        self.stdout.write(
+            f"Rebuilt {supply_demand} supply/demand and {donations} donation rollups"
+        )
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from blood.lifecycle import run_lifecycle
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire pending blood requests whose date has passed and move old "
+        "closed requests and donations to the archive tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=3600.0)
+
+    def handle(self, *args, **options):
+        while True:
+            counts = run_lifecycle(batch_size=options["batch_size"])
+            self.stdout.write(
+                "Expired {expired} requests, archived {archived_requests} "
+                "requests and {archived_donations} donations.".format(**counts)
+            )
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,46 @@
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Value, When
+from user.models import DonorProfile
+from .models import BloodCompatibility
+
+
+def match_donors(blood_request, limit=10):
+    """
+    Return the top ``limit`` donors who can give to ``blood_request``.
+
+    Donors are ranked by compatibility preference (identical group first), then
+    by whether they live in the request's district, then by how long ago they
+    last donated (never first). Eligibility is the denormalized
+    ``eligible_from`` range, so everything runs as one query over
+    ``donor_match_idx``.
+    """
+    compatible = BloodCompatibility.objects.filter(
+        recipient_group=blood_request.blood_group
+    )
+    same_district = Value(1)
+    if blood_request.district:
+        same_district = Case(
+            When(district__iexact=blood_request.district, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+
+    donors = (
+        DonorProfile.objects.select_related("user")
+        .eligible()
+        .filter(blood_group__in=compatible.values("donor_group"))
+        .exclude(user_id=blood_request.requester_id)
+        .annotate(
+            compatibility=Subquery(
+                compatible.filter(donor_group=OuterRef("blood_group")).values(
+                    "preference"
+                )[:1]
+            ),
+            same_district=same_district,
+        )
+    )
+    return donors.order_by(
+        "compatibility",
+        "same_district",
+        F("last_donation_date").asc(nulls_first=True),
+        "id",
+    )[:limit]
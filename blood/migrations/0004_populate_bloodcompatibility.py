@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Frozen copy of user.constants.BLOOD_COMPATIBILITY at the time of writing
+BLOOD_COMPATIBILITY = {
+    "A+": ["A+", "A-", "O+", "O-"],
+    "A-": ["A-", "O-"],
+    "B+": ["B+", "B-", "O+", "O-"],
+    "B-": ["B-", "O-"],
+    "O+": ["O+", "O-"],
+    "O-": ["O-"],
+    "AB+": ["AB+", "AB-", "A+", "A-", "B+", "B-", "O+", "O-"],
+    "AB-": ["AB-", "A-", "B-", "O-"],
+}
+
+
+def populate(apps, schema_editor):
+    BloodCompatibility = apps.get_model("blood", "BloodCompatibility")
+    BloodCompatibility.objects.bulk_create(
+        BloodCompatibility(
+            recipient_group=recipient, donor_group=donor, preference=preference
+        )
+        for recipient, donors in BLOOD_COMPATIBILITY.items()
+        for preference, donor in enumerate(donors)
+    )
+
+
+def clear(apps, schema_editor):
+    apps.get_model("blood", "BloodCompatibility").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blood", "0003_bloodrequest_district_bloodcompatibility"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, clear),
+    ]
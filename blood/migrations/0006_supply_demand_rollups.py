@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blood", "0005_bloodrequest_request_status_group_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DonationRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("district", models.CharField(max_length=100)),
+                ("blood_group", models.CharField(max_length=4)),
+                ("day", models.DateField()),
+                ("donations", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["day"], name="donation_rollup_day_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("district", "blood_group", "day"),
+                        name="donation_rollup_key",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="SupplyDemandRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("district", models.CharField(max_length=100)),
+                ("blood_group", models.CharField(max_length=4)),
+                ("pending_requests", models.IntegerField(default=0)),
+                ("available_donors", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("district", "blood_group"),
+                        name="supply_demand_rollup_key",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blood", "0008_bloodrequest_location"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bloodrequest",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("fulfilled", "Fulfilled"),
+                    ("canceled", "Canceled"),
+                    ("expired", "Expired"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="ArchivedBloodRequest",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("blood_group", models.CharField(max_length=4)),
+                ("district", models.CharField(blank=True, default="", max_length=100)),
+                ("request_date", models.DateField()),
+                ("status", models.CharField(max_length=20)),
+                ("details", models.TextField(blank=True, null=True)),
+                ("latitude", models.FloatField(blank=True, null=True)),
+                ("longitude", models.FloatField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "requester",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_requests",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["requester", "request_date"],
+                        name="archived_request_requester_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedDonation",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("blood_group", models.CharField(max_length=4)),
+                ("donation_date", models.DateField()),
+                ("details", models.TextField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "donor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_donations",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["donor", "donation_date"],
+                        name="archived_donation_donor_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blood", "0009_request_lifecycle"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bloodrequest",
+            index=models.Index(
+                fields=["-request_date", "-id"], name="request_date_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="donation",
+            index=models.Index(
+                fields=["-donation_date", "-id"], name="donation_date_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blood", "0010_list_ordering_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduledRun",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("started_at", models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
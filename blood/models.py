@@ -1,5 +1,14 @@
-from django.db import models
+from contextvars import ContextVar
+from functools import partial
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from user.constants import BLOOD_GROUP
+from user.models import DonorProfile
+from .events import publish_blood_request
+from user.cache import invalidate_user_dashboard, invalidate_pending_dashboards
 
 
 class BloodRequest(models.Model):
@@ -7,6 +16,7 @@ class BloodRequest(models.Model):
         User, on_delete=models.CASCADE, related_name="requests"
     )
     blood_group = models.CharField(max_length=4)
+    district = models.CharField(max_length=100, blank=True, default="")
     request_date = models.DateField()
     status = models.CharField(
         max_length=20,
@@ -14,9 +24,41 @@ class BloodRequest(models.Model):
             ("pending", "Pending"),
             ("fulfilled", "Fulfilled"),
             ("canceled", "Canceled"),
+            # Still pending when its date passed; see blood.lifecycle
+            ("expired", "Expired"),
         ],
     )
     details = models.TextField(blank=True, null=True)
+    # Where the blood is needed; nearby donors are found from here
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
+    # Validator for conditional GETs; .update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "blood_group", "request_date"],
+                name="request_status_group_idx",
+            ),
+            # Dashboard "pending_requests" ordered by date
+            models.Index(
+                fields=["status", "request_date"], name="request_status_date_idx"
+            ),
+            models.Index(
+                fields=["requester", "request_date"], name="request_requester_date_idx"
+            ),
+            # BloodRequestPagination's ordering, so every page is one seek
+            models.Index(fields=["-request_date", "-id"], name="request_date_id_idx"),
+        ]
 
     def __str__(self):
         return f"Request by {self.requester.username} for {self.blood_group} on {self.request_date}"
@@ -27,6 +69,200 @@ class Donation(models.Model):
     blood_group = models.CharField(max_length=4)
     donation_date = models.DateField()
     details = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["donor", "donation_date"], name="donation_donor_date_idx"
+            ),
+            # DonationPagination's ordering
+            models.Index(fields=["-donation_date", "-id"], name="donation_date_id_idx"),
+        ]
 
     def __str__(self):
         return f"Donation by {self.donor.username} of {self.blood_group} on {self.donation_date}"
+
+
+class ArchivedBloodRequest(models.Model):
+    """
+    A closed BloodRequest moved out of the hot table by blood.lifecycle,
+    with its original id and columns.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    requester = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="archived_requests"
+    )
+    blood_group = models.CharField(max_length=4)
+    district = models.CharField(max_length=100, blank=True, default="")
+    request_date = models.DateField()
+    status = models.CharField(max_length=20)
+    details = models.TextField(blank=True, null=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["requester", "request_date"],
+                name="archived_request_requester_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Archived request {self.pk} ({self.status})"
+
+
+class ArchivedDonation(models.Model):
+    """A Donation moved out of the hot table by blood.lifecycle."""
+
+    id = models.BigIntegerField(primary_key=True)
+    donor = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="archived_donations"
+    )
+    blood_group = models.CharField(max_length=4)
+    donation_date = models.DateField()
+    details = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The donor's latest donation, for rebuild_eligibility
+            models.Index(
+                fields=["donor", "donation_date"], name="archived_donation_donor_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Archived donation {self.pk}"
+
+
+class ScheduledRun(models.Model):
+    """When a job run by every server process (blood.lifecycle) last started."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    started_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.started_at}"
+
+
+class BloodCompatibility(models.Model):
+    """Precomputed ABO/Rh table: which donor groups can give to a recipient group."""
+
+    recipient_group = models.CharField(max_length=4, choices=BLOOD_GROUP)
+    donor_group = models.CharField(max_length=4, choices=BLOOD_GROUP)
+    # 0 for an identical group, higher values are less preferred substitutes
+    preference = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient_group", "donor_group"],
+                name="blood_compatibility_unique_pair",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.donor_group} -> {self.recipient_group}"
+
+
+class SupplyDemandRollup(models.Model):
+    """
+    Pending requests and available donors per district and blood group.
+
+    Maintained incrementally by blood.stats; ``manage.py rebuild_stats``
+    recomputes it. Districts are stored upper-cased.
+    """
+
+    district = models.CharField(max_length=100)
+    blood_group = models.CharField(max_length=4)
+    pending_requests = models.IntegerField(default=0)
+    available_donors = models.IntegerField(default=0)
+
+    key_fields = ("district", "blood_group")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["district", "blood_group"], name="supply_demand_rollup_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.district} {self.blood_group}"
+
+
+class DonationRollup(models.Model):
+    """Donations per day, blood group and district of the donor's profile."""
+
+    district = models.CharField(max_length=100)
+    blood_group = models.CharField(max_length=4)
+    day = models.DateField()
+    donations = models.IntegerField(default=0)
+
+    key_fields = ("district", "blood_group", "day")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["district", "blood_group", "day"], name="donation_rollup_key"
+            )
+        ]
+        indexes = [models.Index(fields=["day"], name="donation_rollup_day_idx")]
+
+    def __str__(self):
+        return f"{self.district} {self.blood_group} {self.day}"
+
+
+# Set while blood.lifecycle moves rows to the archive tables: their deletes
+# change no rollup, eligibility or dashboard, so the receivers skip them
+archiving = ContextVar("archiving", default=False)
+
+
+def invalidate_request_dashboards(requester_id):
+    invalidate_user_dashboard(requester_id)
+    invalidate_pending_dashboards()
+
+
+# Keep cached dashboards in step with the rows they were built from. Bumping
+# only after commit stops a concurrent read from caching uncommitted state.
+@receiver([post_save, post_delete], sender=BloodRequest)
+def request_changed(sender, instance, **kwargs):
+    if archiving.get():
+        return
+    transaction.on_commit(partial(invalidate_request_dashboards, instance.requester_id))
+
+
+# Notify connected donors about new requests once they are committed
+@receiver(post_save, sender=BloodRequest)
+def request_created(sender, instance, created, **kwargs):
+    if created and instance.status == "pending":
+        # The request is saved either way; a failed push must not fail it
+        transaction.on_commit(partial(publish_blood_request, instance), robust=True)
+
+
+@receiver([post_save, post_delete], sender=Donation)
+def donation_changed(sender, instance, **kwargs):
+    if archiving.get():
+        return
+    transaction.on_commit(partial(invalidate_user_dashboard, instance.donor_id))
+
+
+# Runs inside the transaction that writes the donation, so a donor's
+# eligibility never disagrees with their committed donations
+@receiver([post_save, post_delete], sender=Donation)
+def donation_recorded(sender, instance, created=False, **kwargs):
+    if archiving.get():
+        return
+    if created:
+        DonorProfile.objects.record_donations(
+            {instance.donor_id: instance.donation_date}
+        )
+    else:
+        # An edited or deleted donation may have been the latest one
+        DonorProfile.objects.filter(user_id=instance.donor_id).rebuild_eligibility()
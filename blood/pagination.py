@@ -0,0 +1,9 @@
+from rokto_dan.pagination import KeysetPagination
+
+
+class BloodRequestPagination(KeysetPagination):
+    ordering = ("-request_date", "-id")
+
+
+class DonationPagination(KeysetPagination):
+    ordering = ("-donation_date", "-id")
@@ -1,14 +1,70 @@
 from rest_framework import serializers
-from .models import BloodRequest, Donation
+from user.constants import BLOOD_GROUP
+from user.serializers import DonorProfileSerializer, LocationMixin
+from .models import BloodRequest, Donation, SupplyDemandRollup
 
 
-class BloodRequestSerializer(serializers.ModelSerializer):
+class BloodRequestSerializer(LocationMixin, serializers.ModelSerializer):
     class Meta:
         model = BloodRequest
-        fields = ["id", "requester", "blood_group", "request_date", "status", "details"]
+        fields = [
+            "id",
+            "requester",
+            "blood_group",
+            "district",
+            "request_date",
+            "status",
+            "details",
+            "latitude",
+            "longitude",
+        ]
 
 
 class DonationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Donation
         fields = ["id", "donor", "blood_group", "donation_date", "details"]
+
+
+# Serializer for the donation details sent when accepting a request
+class AcceptRequestSerializer(serializers.Serializer):
+    donation_date = serializers.DateField()
+    details = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class DonorMatchSerializer(DonorProfileSerializer):
+    compatibility = serializers.IntegerField(read_only=True)
+
+    class Meta(DonorProfileSerializer.Meta):
+        fields = DonorProfileSerializer.Meta.fields + ["compatibility"]
+
+
+# Query parameters of the stats endpoint
+class BloodStatsQuerySerializer(serializers.Serializer):
+    district = serializers.CharField(required=False)
+    blood_group = serializers.ChoiceField(choices=BLOOD_GROUP, required=False)
+    period = serializers.ChoiceField(choices=["day", "week"], default="day")
+    days = serializers.IntegerField(min_value=1, max_value=366, default=28)
+
+    def validate_district(self, value):
+        # Rollups store districts upper-cased
+        return value.upper()
+
+    def to_internal_value(self, data):
+        data = data.copy()
+        if "blood_group" in data:
+            data["blood_group"] = data["blood_group"].upper()
+        return super().to_internal_value(data)
+
+
+class SupplyDemandRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SupplyDemandRollup
+        fields = ["district", "blood_group", "pending_requests", "available_donors"]
+
+
+class DonationRollupSerializer(serializers.Serializer):
+    district = serializers.CharField()
+    blood_group = serializers.CharField()
+    period = serializers.DateField()
+    donations = serializers.IntegerField()
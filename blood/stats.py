@@ -0,0 +1,262 @@
+"""
+Supply/demand rollups kept current on every write.
+
+Each tracked row contributes to rollup counters: a pending BloodRequest adds
+one to ``pending_requests`` of its (district, blood group), an available
+DonorProfile one to ``available_donors``, and a Donation one to its day in
+DonationRollup. Saves and deletes apply the difference between the row's
+contributions before and after the write, in the same transaction. Writes
+that send no signals (``.update()``, ``bulk_create``) call
+``record_bulk_change`` themselves.
+
+Donations are counted under the donor's district at the time they are
+recorded; ``rebuild_rollups`` uses the donor's current district. Archiving
+(blood.lifecycle) moves rows without changing any counter: expired and
+closed requests count towards nothing, and archived donations keep their
+day.
+"""
+
+import operator
+from collections import Counter, defaultdict
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Case, Count, DateField, F, Q, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from user.models import DonorProfile
+from .models import (
+    ArchivedDonation,
+    BloodRequest,
+    Donation,
+    DonationRollup,
+    SupplyDemandRollup,
+    archiving,
+)
+
+# The fields of each model that its rollup contributions depend on
+TRACKED_FIELDS = {
+    BloodRequest: ("district", "blood_group", "status"),
+    DonorProfile: ("district", "blood_group", "is_available"),
+    Donation: ("donor_id", "blood_group", "donation_date"),
+}
+
+
+def rollup_district(district):
+    return (district or "").upper()
+
+
+def donor_districts(user_ids):
+    return {
+        user_id: rollup_district(district)
+        for user_id, district in DonorProfile.objects.filter(
+            user_id__in=user_ids
+        ).values_list("user_id", "district")
+    }
+
+
+def contributions(model, states):
+    """Yield the (rollup, key, counter) each state tuple adds one to."""
+    if model is BloodRequest:
+        for district, blood_group, status in states:
+            if status == "pending":
+                key = (rollup_district(district), blood_group)
+                yield SupplyDemandRollup, key, "pending_requests"
+    elif model is DonorProfile:
+        for district, blood_group, is_available in states:
+            if is_available:
+                key = (rollup_district(district), blood_group)
+                yield SupplyDemandRollup, key, "available_donors"
+    elif model is Donation:
+        states = list(states)
+        # Donors without a profile are counted under the empty district
+        districts = donor_districts({donor_id for donor_id, _, _ in states})
+        for donor_id, blood_group, day in states:
+            key = (districts.get(donor_id, ""), blood_group, day)
+            yield DonationRollup, key, "donations"
+
+
+def apply_one(rollup, key, changes):
+    lookup = dict(zip(rollup.key_fields, key))
+    increments = {field: F(field) + n for field, n in changes.items()}
+    if not rollup.objects.filter(**lookup).update(**increments):
+        row, created = rollup.objects.get_or_create(**lookup, defaults=changes)
+        if not created:
+            # Created concurrently between the UPDATE and the INSERT
+            rollup.objects.filter(pk=row.pk).update(**increments)
+
+
+def apply_many(rollup, changes):
+    """
+    Two queries for any number of keys: insert the missing rows at zero
+    (rows inserted concurrently are left alone), then add every delta with
+    one conditional UPDATE.
+    """
+    counters = {field for fields in changes.values() for field in fields}
+    rollup.objects.bulk_create(
+        [rollup(**dict(zip(rollup.key_fields, key))) for key in changes],
+        ignore_conflicts=True,
+    )
+    conditions = {key: Q(**dict(zip(rollup.key_fields, key))) for key in changes}
+    rollup.objects.filter(reduce(operator.or_, conditions.values())).update(
+        **{
+            field: F(field)
+            + Case(
+                *(
+                    When(conditions[key], then=Value(fields[field]))
+                    for key, fields in changes.items()
+                    if fields.get(field)
+                ),
+                default=Value(0),
+            )
+            for field in counters
+        }
+    )
+
+
+def apply(deltas):
+    """Add ``{(rollup, key): Counter(counter=n)}`` to the rollup rows."""
+    by_rollup = defaultdict(dict)
+    for (rollup, key), changes in deltas.items():
+        changes = {field: n for field, n in changes.items() if n}
+        if changes:
+            by_rollup[rollup][key] = changes
+    for rollup, changes in by_rollup.items():
+        if len(changes) == 1:
+            apply_one(rollup, *next(iter(changes.items())))
+        else:
+            apply_many(rollup, changes)
+
+
+def record_bulk_change(model, old_states, new_states):
+    """Move rollups from ``old_states`` to ``new_states`` of ``model`` rows."""
+    deltas = defaultdict(Counter)
+    for rollup, key, field in contributions(model, old_states):
+        deltas[rollup, key][field] -= 1
+    for rollup, key, field in contributions(model, new_states):
+        deltas[rollup, key][field] += 1
+    apply(deltas)
+
+
+def snapshot(instance):
+    """Tracked values already loaded on ``instance``, or None if deferred."""
+    fields = TRACKED_FIELDS[type(instance)]
+    if all(field in instance.__dict__ for field in fields):
+        return tuple(instance.__dict__[field] for field in fields)
+    return None
+
+
+def stored_state(instance):
+    fields = TRACKED_FIELDS[type(instance)]
+    return type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_init)
+def remember_state(sender, instance, **kwargs):
+    if sender in TRACKED_FIELDS and not instance._state.adding:
+        instance._rollup_state = snapshot(instance)
+
+
+@receiver(pre_save)
+def state_before_save(sender, instance, **kwargs):
+    if sender not in TRACKED_FIELDS:
+        return
+    if instance._state.adding:
+        instance._rollup_old_state = None
+    else:
+        old = getattr(instance, "_rollup_state", None)
+        instance._rollup_old_state = old or stored_state(instance)
+
+
+@receiver(post_save)
+def update_rollups(sender, instance, **kwargs):
+    if sender not in TRACKED_FIELDS:
+        return
+    old = instance._rollup_old_state
+    new = snapshot(instance) or stored_state(instance)
+    if old != new:
+        record_bulk_change(sender, [old] if old else [], [new])
+    instance._rollup_state = new
+
+
+@receiver(pre_delete)
+def state_before_delete(sender, instance, **kwargs):
+    if sender not in TRACKED_FIELDS or archiving.get():
+        return
+    if getattr(instance, "_rollup_state", None) is None:
+        instance._rollup_state = stored_state(instance)
+
+
+@receiver(post_delete)
+def remove_from_rollups(sender, instance, **kwargs):
+    if sender not in TRACKED_FIELDS or archiving.get():
+        return
+    if instance._rollup_state is not None:
+        record_bulk_change(sender, [instance._rollup_state], [])
+
+
+def rollup_counts():
+    """
+    Every rollup counter, recomputed from the source tables with one grouped
+    aggregate query (a UNION ALL of the groupings). Archived donations still
+    count towards their day.
+    """
+
+    def grouped(queryset, counter, district="district", day=None):
+        # Aliased so every branch of the UNION has the same columns
+        day = F(day) if day else Cast(Value(None), DateField())
+        return (
+            queryset.values(
+                group_district=F(district), group=F("blood_group"), group_day=day
+            )
+            .annotate(total=Count("pk"))
+            .annotate(counter=Value(counter))
+            .values_list("counter", "group_district", "group", "group_day", "total")
+        )
+
+    pending = grouped(BloodRequest.objects.filter(status="pending"), "pending_requests")
+    donors = grouped(DonorProfile.objects.filter(is_available=True), "available_donors")
+    donations, archived = (
+        grouped(
+            model.objects.all(),
+            "donations",
+            district="donor__donor_profile__district",
+            day="donation_date",
+        )
+        for model in (Donation, ArchivedDonation)
+    )
+    return pending.union(donors, donations, archived, all=True)
+
+
+def rebuild_rollups():
+    """Replace both rollup tables with freshly computed counts."""
+    supply_demand = defaultdict(Counter)
+    donations = Counter()
+    for counter, district, blood_group, day, total in rollup_counts():
+        key = (rollup_district(district), blood_group)
+        if counter == "donations":
+            donations[key + (day,)] += total
+        else:
+            supply_demand[key][counter] += total
+
+    with transaction.atomic():
+        SupplyDemandRollup.objects.all().delete()
+        DonationRollup.objects.all().delete()
+        SupplyDemandRollup.objects.bulk_create(
+            SupplyDemandRollup(district=district, blood_group=blood_group, **counts)
+            for (district, blood_group), counts in supply_demand.items()
+        )
+        DonationRollup.objects.bulk_create(
+            DonationRollup(
+                district=district, blood_group=blood_group, day=day, donations=total
+            )
+            for (district, blood_group, day), total in donations.items()
+        )
+    return len(supply_demand), len(donations)
@@ -1,3 +1,791 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import threading
+import time
+from base64 import urlsafe_b64encode
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import AsyncRequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase, force_authenticate
+from user.models import DonorProfile
+from .events import Subscription, get_backend, publish_blood_request
+from .lifecycle import SCHEDULED_RUN, run_lifecycle, run_scheduled
+from .matching import match_donors
+from .models import (
+    ArchivedBloodRequest,
+    ArchivedDonation,
+    BloodRequest,
+    Donation,
+    DonationRollup,
+    ScheduledRun,
+    SupplyDemandRollup,
+)
+from .stats import rebuild_rollups, rollup_counts
+from .views import AsyncDonorMatchAPIView
+
+
+class DonorMatchingTests(APITestCase):
+    def setUp(self):
+        self.requester = User.objects.create_user("patient")
+        self.blood_request = BloodRequest.objects.create(
+            requester=self.requester,
+            blood_group="A+",
+            district="Dhaka",
+            request_date=datetime.date.today(),
+            status="pending",
+        )
+        self.client.force_authenticate(self.requester)
+
+    def create_donor(self, username, blood_group, district="Dhaka", **kwargs):
+        user = User.objects.create_user(username)
+        return DonorProfile.objects.create(
+            user=user,
+            blood_group=blood_group,
+            district=district,
+            donor_type="regular",
+            **kwargs,
+        )
+
+    def test_only_compatible_eligible_donors_are_matched(self):
+        recent = datetime.date.today() - datetime.timedelta(days=10)
+        self.create_donor("a_pos", "A+")
+        self.create_donor("o_neg", "O-")
+        self.create_donor("b_pos", "B+")
+        self.create_donor("busy", "A+", is_available=False)
+        self.create_donor("recent", "A+", date_of_donation=recent)
+
+        usernames = [donor.user.username for donor in match_donors(self.blood_request)]
+
+        self.assertEqual(usernames, ["a_pos", "o_neg"])
+
+    def test_ranking_prefers_identical_group_then_district(self):
+        self.create_donor("o_pos_local", "O+")
+        self.create_donor("a_pos_far", "A+", district="Sylhet")
+        self.create_donor("a_pos_local", "A+")
+
+        usernames = [donor.user.username for donor in match_donors(self.blood_request)]
+
+        self.assertEqual(usernames, ["a_pos_local", "a_pos_far", "o_pos_local"])
+
+    def test_matches_endpoint_runs_a_single_donor_query(self):
+        for i in range(15):
+            self.create_donor(f"donor{i}", "A-")
+        url = reverse("blood_requests-list-matches", args=[self.blood_request.pk])
+
+        # One query for the request itself, one for the ranked donors
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"limit": 5})
+
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]["compatibility"], 1)
+
+    async def test_async_matches_view_matches_viewset_action(self):
+        for i, group in enumerate(["A+", "O-", "A-", "O+", "B+"] * 3):
+            await sync_to_async(self.create_donor)(f"donor{i}", group)
+        url = reverse("blood_requests-list-matches", args=[self.blood_request.pk])
+        expected = await sync_to_async(self.client.get)(url, {"limit": 8})
+
+        request = AsyncRequestFactory().get(url, {"limit": 8})
+        force_authenticate(request, self.requester)
+        view = AsyncDonorMatchAPIView.as_view()
+        response = await view(request, pk=self.blood_request.pk)
+
+        self.assertEqual(response.data, expected.data)
+        response = await view(request, pk=0)
+        self.assertEqual(response.status_code, 404)
+
+
+class DonorEligibilityTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("donor")
+        self.profile = DonorProfile.objects.create(
+            user=self.user, blood_group="O-", district="Dhaka", donor_type="regular"
+        )
+
+    def assertLastDonation(self, date):
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.last_donation_date, date)
+        self.assertEqual(
+            self.profile.eligible_from,
+            date + datetime.timedelta(days=90) if date else datetime.date.min,
+        )
+
+    def donate(self, date):
+        return Donation.objects.create(
+            donor=self.user, blood_group="O-", donation_date=date
+        )
+
+    def test_recorded_donations_only_move_eligibility_forward(self):
+        latest = self.donate(datetime.date(2024, 5, 1))
+        self.assertLastDonation(datetime.date(2024, 5, 1))
+        self.donate(datetime.date(2024, 3, 1))
+        self.assertLastDonation(datetime.date(2024, 5, 1))
+
+        latest.delete()
+        self.assertLastDonation(datetime.date(2024, 3, 1))
+
+    def test_accepting_a_request_starts_the_cooldown(self):
+        requester = User.objects.create_user("patient")
+        blood_request = BloodRequest.objects.create(
+            requester=requester,
+            blood_group="A+",
+            request_date=datetime.date.today(),
+            status="pending",
+        )
+        self.client.force_authenticate(self.user)
+        self.client.post(
+            reverse("accept_request", args=[blood_request.pk]),
+            {"donation_date": datetime.date.today()},
+        )
+
+        self.assertLastDonation(datetime.date.today())
+        self.assertFalse(DonorProfile.objects.eligible().exists())
+        response = self.client.get(reverse("donor-list"), {"eligible": "false"})
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], [self.profile.pk]
+        )
+
+    def test_profile_created_later_picks_up_recorded_donations(self):
+        user = User.objects.create_user("late")
+        Donation.objects.create(
+            donor=user, blood_group="A+", donation_date=datetime.date(2024, 2, 1)
+        )
+        profile = DonorProfile.objects.create(
+            user=user,
+            blood_group="A+",
+            district="Dhaka",
+            donor_type="regular",
+            date_of_donation=datetime.date(2024, 1, 1),
+        )
+        self.assertEqual(profile.last_donation_date, datetime.date(2024, 2, 1))
+
+    def test_corrected_date_of_donation_moves_eligibility_back(self):
+        self.donate(datetime.date(2024, 3, 1))
+        url = reverse("donor-detail", args=[self.profile.pk])
+        self.client.force_authenticate(self.user)
+        self.client.patch(url, {"date_of_donation": "2030-01-01"})
+        self.assertLastDonation(datetime.date(2030, 1, 1))
+
+        # Mistyped: back to the latest date anything records
+        self.client.patch(url, {"date_of_donation": "2024-01-01"})
+        self.assertLastDonation(datetime.date(2024, 3, 1))
+        self.client.patch(url, {"date_of_donation": "2024-04-01"})
+        self.assertLastDonation(datetime.date(2024, 4, 1))
+        self.client.patch(url, {"date_of_donation": None}, format="json")
+        self.assertLastDonation(datetime.date(2024, 3, 1))
+
+    def test_latest_donations_are_looked_up_without_a_join(self):
+        for day in (1, 2, 3):
+            self.donate(datetime.date(2024, 3, day))
+            ArchivedDonation.objects.create(
+                id=100 + day,
+                donor=self.user,
+                blood_group="O-",
+                donation_date=datetime.date(2023, 1, day),
+                updated_at=timezone.now(),
+            )
+        self.profile.date_of_donation = datetime.date(2020, 1, 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.profile.save()
+        # Not a row for every pair of recorded and archived donations
+        self.assertFalse(any("JOIN" in query["sql"] for query in queries))
+        self.assertLastDonation(datetime.date(2024, 3, 3))
+
+    def test_rebuild_repairs_profiles_in_bulk(self):
+        self.donate(datetime.date(2024, 5, 1))
+        DonorProfile.objects.update(
+            last_donation_date=None, eligible_from=datetime.date.min
+        )
+
+        out = io.StringIO()
+        call_command("rebuild_eligibility", stdout=out)
+
+        self.assertIn("Repaired 1", out.getvalue())
+        self.assertLastDonation(datetime.date(2024, 5, 1))
+
+
+class AcceptRequestAPIViewTests(APITestCase):
+    def setUp(self):
+        self.requester = User.objects.create_user("patient")
+        self.donor = User.objects.create_user("donor")
+        self.blood_request = BloodRequest.objects.create(
+            requester=self.requester,
+            blood_group="B+",
+            request_date=datetime.date.today(),
+            status="pending",
+        )
+        self.url = reverse("accept_request", args=[self.blood_request.pk])
+
+    def test_accept_records_donation_and_fulfils_request(self):
+        self.client.force_authenticate(self.donor)
+
+        response = self.client.post(self.url, {"donation_date": "2024-05-01"})
+
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, "fulfilled")
+        donation = Donation.objects.get()
+        self.assertEqual((donation.donor, donation.blood_group), (self.donor, "B+"))
+
+    def test_cannot_accept_own_request(self):
+        self.client.force_authenticate(self.requester)
+        response = self.client.post(self.url, {"donation_date": "2024-05-01"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Donation.objects.exists())
+
+    def test_missing_donation_date_is_rejected_before_any_write(self):
+        self.client.force_authenticate(self.donor)
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 400)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, "pending")
+
+    @override_settings(THROTTLE_RATES={"accept_user": "1/min"})
+    def test_accepts_are_throttled_per_user(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_authenticate(self.donor)
+        self.assertEqual(self.client.post(self.url, {}).status_code, 400)
+
+        response = self.client.post(self.url, {"donation_date": "2024-05-01"})
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(Donation.objects.exists())
+
+        self.client.force_authenticate(User.objects.create_user("other"))
+        response = self.client.post(self.url, {"donation_date": "2024-05-01"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ConcurrentAcceptTests(TransactionTestCase):
+    donors = 20
+
+    def test_parallel_accepts_create_exactly_one_donation(self):
+        requester = User.objects.create_user("patient")
+        blood_request = BloodRequest.objects.create(
+            requester=requester,
+            blood_group="O+",
+            request_date=datetime.date.today(),
+            status="pending",
+        )
+        donors = [User.objects.create_user(f"donor{i}") for i in range(self.donors)]
+        url = reverse("accept_request", args=[blood_request.pk])
+        barrier = threading.Barrier(self.donors)
+        statuses = []
+
+        def accept(donor):
+            client = APIClient()
+            client.force_authenticate(donor)
+            barrier.wait()
+            try:
+                # SQLite reports a concurrent writer as "database is locked";
+                # a real client would retry, so do the same here.
+                for _ in range(50):
+                    try:
+                        response = client.post(url, {"donation_date": "2024-05-01"})
+                    except OperationalError:
+                        time.sleep(0.01)
+                        continue
+                    statuses.append(response.status_code)
+                    return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=[donor]) for donor in donors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # In-memory SQLite can report "locked" on a COMMIT that did go
+        # through, so the winner's retry may see a 404; the rows are the truth.
+        self.assertLessEqual(statuses.count(200), 1)
+        self.assertTrue(set(statuses) <= {200, 404, 409})
+        self.assertEqual(Donation.objects.count(), 1)
+        blood_request.refresh_from_db()
+        self.assertEqual(blood_request.status, "fulfilled")
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("viewer")
+        self.client.force_authenticate(self.user)
+        # Many rows share a request_date, so the id tie-breaker matters
+        BloodRequest.objects.bulk_create(
+            BloodRequest(
+                requester=self.user,
+                blood_group="A+",
+                request_date=datetime.date(2024, 1, 1 + i % 3),
+                status="pending",
+            )
+            for i in range(55)
+        )
+        self.expected = list(
+            BloodRequest.objects.order_by("-request_date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_next_links_walk_every_row_once_in_order(self):
+        seen, url = [], reverse("blood_requests-list-list") + "?page_size=10"
+        while url:
+            # The page, whose rows the list's ETag is built from
+            with self.assertNumQueries(1):
+                page = self.client.get(url).data
+            seen.extend(row["id"] for row in page["results"])
+            url = page["next"]
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_link_returns_the_preceding_page(self):
+        first = self.client.get(reverse("blood_requests-list-list")).data
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+        self.assertEqual(back["results"], first["results"])
+
+    def test_page_size_is_capped(self):
+        BloodRequest.objects.bulk_create(
+            BloodRequest(
+                requester=self.user,
+                blood_group="O+",
+                request_date=datetime.date(2024, 2, 1),
+                status="pending",
+            )
+            for _ in range(60)
+        )
+        response = self.client.get(
+            reverse("blood_requests-list-list"), {"page_size": 100000}
+        )
+        self.assertEqual(len(response.data["results"]), 100)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("donations-list-list"), {"cursor": "bad"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_position_is_rejected(self):
+        url = reverse("blood_requests-list-list")
+        for position in (["not-a-date", 1], ["2024-01-01", "x"], [[], {}]):
+            cursor = urlsafe_b64encode(json.dumps({"p": position}).encode()).decode()
+            response = self.client.get(url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+
+class DonationBulkImportTests(APITestCase):
+    def test_jsonl_import_uses_one_insert_per_chunk(self):
+        admin = User.objects.create_user("admin", is_staff=True)
+        User.objects.bulk_create(User(username=f"donor{i}") for i in range(50))
+        self.client.force_authenticate(admin)
+        body = "".join(
+            f'{{"username": "donor{i}", "blood_group": "A+",'
+            f' "donation_date": "2024-01-{1 + i % 28:02d}"}}\n'
+            for i in range(50)
+        )
+
+        # Username lookup, then SAVEPOINT, INSERT, eligibility UPDATE, donor
+        # districts, rollup INSERT and UPDATE, RELEASE
+        with self.assertNumQueries(8):
+            response = self.client.generic(
+                "POST",
+                reverse("donations-list-bulk-import"),
+                body,
+                content_type="application/x-ndjson",
+            )
+
+        self.assertEqual(response.data, {"imported": 50, "errors": []})
+        self.assertEqual(Donation.objects.count(), 50)
+
+
+class BloodRequestConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.requester = User.objects.create_user("patient")
+        self.donor = User.objects.create_user("donor")
+        DonorProfile.objects.create(
+            user=self.donor, blood_group="O-", district="Dhaka", donor_type="regular"
+        )
+        self.blood_request = BloodRequest.objects.create(
+            requester=self.requester,
+            blood_group="A+",
+            request_date=datetime.date(2024, 5, 1),
+            status="pending",
+        )
+        self.client.force_authenticate(self.donor)
+
+    def test_accepting_changes_list_and_detail_etags(self):
+        urls = [
+            reverse("blood_requests-list-list") + "?status=pending",
+            reverse("blood_requests-list-detail", args=[self.blood_request.pk]),
+            reverse("donor-list"),
+        ]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        # Claims the request with .update() and records the donor's donation
+        self.client.post(
+            reverse("accept_request", args=[self.blood_request.pk]),
+            {"donation_date": "2024-05-02"},
+        )
+
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+
+class StatsRollupTests(APITestCase):
+    def setUp(self):
+        self.requester = User.objects.create_user("patient")
+        self.donor = User.objects.create_user("donor")
+        self.profile = DonorProfile.objects.create(
+            user=self.donor, blood_group="O-", district="Dhaka", donor_type="regular"
+        )
+
+    def rollups(self):
+        return (
+            set(
+                SupplyDemandRollup.objects.exclude(
+                    pending_requests=0, available_donors=0
+                ).values_list(
+                    "district", "blood_group", "pending_requests", "available_donors"
+                )
+            ),
+            set(
+                DonationRollup.objects.exclude(donations=0).values_list(
+                    "district", "blood_group", "day", "donations"
+                )
+            ),
+        )
+
+    def assertRollupsMatchRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_writes_keep_rollups_equal_to_a_rebuild(self):
+        requests = [
+            BloodRequest.objects.create(
+                requester=self.requester,
+                blood_group=group,
+                district=district,
+                request_date=datetime.date(2024, 5, 1),
+                status="pending",
+            )
+            for group, district in [("A+", "Dhaka"), ("A+", "dhaka"), ("B-", "")]
+        ]
+        self.client.force_authenticate(self.donor)
+        self.client.post(
+            reverse("accept_request", args=[requests[0].pk]),
+            {"donation_date": "2024-05-02"},
+        )
+        requests[2].district = "Sylhet"
+        requests[2].save()
+        requests[1].delete()
+        self.profile.is_available = False
+        self.profile.save()
+        Donation.objects.create(
+            donor=self.requester, blood_group="A+", donation_date=datetime.date.today()
+        )
+
+        self.assertEqual(
+            self.rollups(),
+            (
+                {("SYLHET", "B-", 1, 0)},
+                {
+                    ("DHAKA", "A+", datetime.date(2024, 5, 2), 1),
+                    ("", "A+", datetime.date.today(), 1),
+                },
+            ),
+        )
+        self.assertRollupsMatchRebuild()
+
+    def test_rebuild_aggregates_in_one_query(self):
+        with self.assertNumQueries(1):
+            list(rollup_counts())
+
+    def test_stats_endpoint_reads_only_rollups(self):
+        for day in [1, 2, 9]:
+            Donation.objects.create(
+                donor=self.donor,
+                blood_group="O-",
+                donation_date=datetime.date.today() - datetime.timedelta(days=day),
+            )
+        self.client.force_authenticate(self.donor)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("blood_stats"), {"district": "dhaka", "blood_group": "o-"}
+            )
+
+        self.assertEqual(
+            response.data["supply_demand"],
+            [
+                {
+                    "district": "DHAKA",
+                    "blood_group": "O-",
+                    "pending_requests": 0,
+                    "available_donors": 1,
+                }
+            ],
+        )
+        self.assertEqual(
+            [row["donations"] for row in response.data["donations"]], [1, 1, 1]
+        )
+        for query in queries.captured_queries:
+            self.assertIn("rollup", query["sql"])
+
+        response = self.client.get(reverse("blood_stats"), {"period": "week"})
+        self.assertEqual(sum(row["donations"] for row in response.data["donations"]), 3)
+
+
+class RequestLifecycleTests(APITestCase):
+    rollups = StatsRollupTests.rollups
+    assertRollupsMatchRebuild = StatsRollupTests.assertRollupsMatchRebuild
+
+    def setUp(self):
+        cache.clear()
+        self.today = datetime.date(2025, 6, 1)
+        self.requester = User.objects.create_user("patient")
+        self.donor = User.objects.create_user("donor")
+        self.profile = DonorProfile.objects.create(
+            user=self.donor, blood_group="O-", district="Dhaka", donor_type="regular"
+        )
+
+    def request(self, days_ago, status="pending"):
+        return BloodRequest.objects.create(
+            requester=self.requester,
+            blood_group="A+",
+            district="Dhaka",
+            request_date=self.today - datetime.timedelta(days=days_ago),
+            status=status,
+        )
+
+    def test_overdue_requests_expire_in_batches(self):
+        overdue = [self.request(days) for days in (1, 2, 3)]
+        current = self.request(0)
+        self.client.force_authenticate(self.requester)
+        self.client.get(reverse("user_dashboard"))
+        before = BloodRequest.objects.get(pk=overdue[0].pk).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                counts = run_lifecycle(today=self.today, batch_size=2)
+
+        self.assertEqual(counts["expired"], 3)
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "blood_bloodrequest"')
+        ]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            set(
+                BloodRequest.objects.filter(status="expired").values_list(
+                    "pk", flat=True
+                )
+            ),
+            {request.pk for request in overdue},
+        )
+        self.assertEqual(BloodRequest.objects.get(pk=current.pk).status, "pending")
+        self.assertGreater(
+            BloodRequest.objects.get(pk=overdue[0].pk).updated_at, before
+        )
+        self.assertEqual(
+            self.rollups()[0], {("DHAKA", "A+", 1, 0), ("DHAKA", "O-", 0, 1)}
+        )
+        self.assertRollupsMatchRebuild()
+        # The cached dashboard was dropped
+        response = self.client.get(reverse("user_dashboard"))
+        statuses = [row["status"] for row in response.data["my_requests"]["results"]]
+        self.assertEqual(statuses.count("expired"), 3)
+
+    def test_old_closed_rows_move_to_the_archive(self):
+        with self.settings(BLOOD_ARCHIVE_AFTER_DAYS=30):
+            closed = self.request(40, status="fulfilled")
+            recent = self.request(10, status="fulfilled")
+            overdue = self.request(40)
+            old = Donation.objects.create(
+                donor=self.donor,
+                blood_group="O-",
+                donation_date=self.today - datetime.timedelta(days=31),
+            )
+            Donation.objects.create(
+                donor=self.donor,
+                blood_group="O-",
+                donation_date=self.today - datetime.timedelta(days=45),
+            )
+            eligible = DonorProfile.objects.get(pk=self.profile.pk).eligible_from
+            rollups = self.rollups()
+
+            counts = run_lifecycle(today=self.today)
+
+        self.assertEqual(
+            counts, {"expired": 1, "archived_requests": 2, "archived_donations": 2}
+        )
+        self.assertEqual(
+            list(BloodRequest.objects.values_list("pk", flat=True)), [recent.pk]
+        )
+        self.assertEqual(
+            set(ArchivedBloodRequest.objects.values_list("pk", "status")),
+            {(closed.pk, "fulfilled"), (overdue.pk, "expired")},
+        )
+        self.assertFalse(Donation.objects.exists())
+        self.assertEqual(
+            ArchivedDonation.objects.get(pk=old.pk).donation_date, old.donation_date
+        )
+        # Archiving changes neither the statistics nor donor eligibility
+        self.assertEqual(self.rollups()[1], rollups[1])
+        self.assertRollupsMatchRebuild()
+        DonorProfile.objects.rebuild_eligibility()
+        self.assertEqual(
+            DonorProfile.objects.get(pk=self.profile.pk).eligible_from, eligible
+        )
+
+    def test_command_runs_the_lifecycle(self):
+        self.request(400)
+        output = io.StringIO()
+
+        call_command("run_lifecycle", stdout=output)
+
+        self.assertIn("Expired 1 requests", output.getvalue())
+        self.assertEqual(ArchivedBloodRequest.objects.get().status, "expired")
+
+    def test_scheduled_run_skips_while_another_ran_recently(self):
+        self.request(1)
+        # Another process, with a cache of its own, started a run just now
+        ScheduledRun.objects.create(name=SCHEDULED_RUN, started_at=timezone.now())
+        cache.clear()
+
+        self.assertIsNone(run_scheduled(60))
+        self.assertFalse(BloodRequest.objects.filter(status="expired").exists())
+
+        ScheduledRun.objects.update(
+            started_at=timezone.now() - datetime.timedelta(seconds=61)
+        )
+        self.assertEqual(run_scheduled(60)["expired"], 1)
+        self.assertIsNone(run_scheduled(60))
+
+
+class BloodRequestStreamTests(TransactionTestCase):
+    # The ASGI handler runs queries outside the test's transaction
+    def setUp(self):
+        self.requester = User.objects.create_user("patient")
+        self.donor = User.objects.create_user("donor")
+        DonorProfile.objects.create(
+            user=self.donor, blood_group="O-", district="Dhaka", donor_type="regular"
+        )
+        self.token = Token.objects.create(user=self.donor)
+        self.url = reverse("blood_request_stream")
+
+    def create_request(self, blood_group, district):
+        return BloodRequest.objects.create(
+            requester=self.requester,
+            blood_group=blood_group,
+            district=district,
+            request_date=datetime.date.today(),
+            status="pending",
+        )
+
+    def get_ticket(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        response = client.post(reverse("blood_request_stream_ticket"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.token.key, response.data["ticket"])
+        return response.data["ticket"]
+
+    async def test_matching_requests_are_pushed_to_connected_donor(self):
+        ticket = await sync_to_async(self.get_ticket)()
+        communicator = ApplicationCommunicator(
+            get_asgi_application(),
+            {
+                "type": "http",
+                "method": "GET",
+                "path": self.url,
+                "query_string": f"ticket={ticket}".encode(),
+                "headers": [],
+            },
+        )
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(timeout=5)
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"Content-Type", b"text/event-stream"), start["headers"])
+        body = await communicator.receive_output(timeout=5)
+        self.assertEqual(body["body"], b"retry: 10000\n\n")
+        self.assertEqual(get_backend().count(), 1)
+
+        elsewhere = await sync_to_async(self.create_request)("A+", "Sylhet")
+        matching = await sync_to_async(self.create_request)("AB+", "dhaka")
+        self.assertEqual(await sync_to_async(publish_blood_request)(elsewhere), 0)
+        self.assertEqual(await sync_to_async(publish_blood_request)(matching), 1)
+
+        body = await communicator.receive_output(timeout=5)
+        self.assertTrue(body["body"].startswith(f"id: {matching.pk}\n".encode()))
+        self.assertIn(b"event: blood_request", body["body"])
+
+        # Disconnecting the client unsubscribes it
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(timeout=5)
+        self.assertEqual(get_backend().count(), 0)
+
+    def test_stream_needs_asgi(self):
+        self.client.force_login(self.donor)
+        self.assertEqual(self.client.get(self.url).status_code, 501)
+        self.assertEqual(get_backend().count(), 0)
+
+    def test_closed_subscriber_does_not_fail_new_requests(self):
+        async def subscribe():
+            subscription = Subscription(self.donor.pk, "O-", "Dhaka")
+            get_backend().subscribe(subscription)
+            return subscription
+
+        # Left behind by a stream whose event loop has closed, as under WSGI
+        subscription = async_to_sync(subscribe)()
+        self.addCleanup(get_backend().unsubscribe, subscription)
+        self.assertEqual(get_backend().count(), 1)
+        client = APIClient()
+        client.force_authenticate(self.requester)
+        response = client.post(
+            reverse("blood_requests-list-list"),
+            {
+                "requester": self.requester.pk,
+                "blood_group": "A+",
+                "district": "Dhaka",
+                "request_date": "2030-01-01",
+                "status": "pending",
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_backend().count(), 0)
+
+    async def test_stream_takes_tickets_not_tokens_in_the_query_string(self):
+        response = await self.async_client.get(self.url, {"token": self.token.key})
+        self.assertEqual(response.status_code, 401)
+        ticket = await sync_to_async(self.get_ticket)()
+        response = await self.async_client.get(self.url, {"ticket": ticket + "x"})
+        self.assertEqual(response.status_code, 401)
+        # Expired a second after the maximum age
+        later = time.time() + settings.BLOOD_EVENTS_TICKET_MAX_AGE + 1
+        with mock.patch("django.core.signing.time.time", return_value=later):
+            response = await self.async_client.get(self.url, {"ticket": ticket})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_requires_an_available_donor(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        requester_token = await Token.objects.acreate(user=self.requester)
+        response = await self.async_client.get(
+            self.url, headers={"Authorization": f"Token {requester_token.key}"}
+        )
+        self.assertEqual(response.status_code, 403)
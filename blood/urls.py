@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
@@ -10,6 +11,18 @@ router.register(
 router.register("donations", views.DonationViewSet, basename="donations-list")
 
 urlpatterns = [
+    # Before the router so "stream" is not taken for a blood request id
+    path(
+        "blood_requests/stream/",
+        views.blood_request_stream,
+        name="blood_request_stream",
+    ),
+    path(
+        "blood_requests/stream/ticket/",
+        views.BloodRequestStreamTicketAPIView.as_view(),
+        name="blood_request_stream_ticket",
+    ),
+    path("stats/", views.BloodStatsAPIView.as_view(), name="blood_stats"),
     path("", include(router.urls)),
     path(
         "blood_requests/accept/<int:request_id>/",
@@ -17,3 +30,12 @@ urlpatterns = [
         name="accept_request",
     ),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns.insert(
+        0,
+        path(
+            "blood_requests/<int:pk>/matches/",
+            views.AsyncDonorMatchAPIView.as_view(),
+        ),
+    )
@@ -1,51 +1,314 @@
+import asyncio
+import datetime
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signing import BadSignature, TimestampSigner
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed, NotFound
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import BloodRequest, Donation
-from .serializers import BloodRequestSerializer, DonationSerializer
+from .models import (
+    BloodRequest,
+    Donation,
+    DonationRollup,
+    SupplyDemandRollup,
+    invalidate_request_dashboards,
+)
+from .events import Subscription, get_backend
+from .stats import record_bulk_change
+from user.authentication import CachedTokenAuthentication
+from user.models import DonorProfile
+from .serializers import (
+    AcceptRequestSerializer,
+    BloodRequestSerializer,
+    BloodStatsQuerySerializer,
+    DonationRollupSerializer,
+    SupplyDemandRollupSerializer,
+    DonationSerializer,
+    DonorMatchSerializer,
+)
+from .matching import match_donors
+from .pagination import BloodRequestPagination, DonationPagination
+from .bulk import DONATION_EXPORT_FIELDS, DonationImporter
+from rokto_dan.asyncviews import AsyncAPIView
+from rokto_dan.bulk import BulkImportExportMixin
+from rokto_dan.conditional import ConditionalGetMixin
+from rokto_dan.throttling import UserThrottle
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 
 
-class BloodRequestViewSet(viewsets.ModelViewSet):
+def get_match_limit(request):
+    """``?limit=`` clamped to 1..50; raises ValueError if not an integer."""
+    limit = int(request.query_params.get("limit", 10))
+    return max(min(limit, 50), 1)
+
+
+def invalid_limit_response():
+    return Response(
+        {"error": "limit must be an integer."},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+class BloodRequestViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = BloodRequest.objects.all()
     serializer_class = BloodRequestSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BloodRequestPagination
+    filterset_fields = ["status", "blood_group"]
 
     def perform_create(self, serializer):
         serializer.save(requester=self.request.user)
 
+    @action(detail=True, methods=["get"])
+    def matches(self, request, pk=None):
+        """Ranked list of available donors compatible with this request."""
+        try:
+            limit = get_match_limit(request)
+        except ValueError:
+            return invalid_limit_response()
+        donors = match_donors(self.get_object(), limit=limit)
+        return Response(DonorMatchSerializer(donors, many=True).data)
+
+
+# ASGI variant of BloodRequestViewSet.matches
+class AsyncDonorMatchAPIView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, pk):
+        try:
+            limit = get_match_limit(request)
+        except ValueError:
+            return invalid_limit_response()
+        blood_request = await BloodRequest.objects.filter(pk=pk).afirst()
+        if blood_request is None:
+            raise NotFound()
+        donors = [donor async for donor in match_donors(blood_request, limit=limit)]
+        return Response(DonorMatchSerializer(donors, many=True).data)
+
 
-class DonationViewSet(viewsets.ModelViewSet):
+class DonationViewSet(
+    ConditionalGetMixin, BulkImportExportMixin, viewsets.ModelViewSet
+):
     queryset = Donation.objects.all()
     serializer_class = DonationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DonationPagination
+    importer_class = DonationImporter
+    export_fields = DONATION_EXPORT_FIELDS
+    export_filename = "donations"
 
 
 class AcceptRequestAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserThrottle]
+    throttle_scope = "accept"
 
     def post(self, request, request_id):
-        blood_request = get_object_or_404(BloodRequest, id=request_id, status="pending")
-        if blood_request.requester == request.user:
-            return Response(
-                {"error": "You cannot accept your own request."},
-                status=status.HTTP_400_BAD_REQUEST,
+        serializer = AcceptRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            blood_request = get_object_or_404(
+                BloodRequest.objects.select_for_update().only(
+                    "id", "requester_id", "blood_group", "district"
+                ),
+                id=request_id,
+                status="pending",
             )
+            if blood_request.requester_id == request.user.id:
+                return Response(
+                    {"error": "You cannot accept your own request."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
-        # Create a new donation record
-        Donation.objects.create(
-            donor=request.user,
-            blood_group=blood_request.blood_group,
-            donation_date=request.data.get("donation_date"),
-            details=request.data.get("details"),
-        )
+            # Conditional UPDATE ... WHERE status = 'pending' is the actual
+            # guard: on backends without row locks (SQLite) two accepts can both
+            # read the request as pending, but only one of them claims it.
+            claimed = BloodRequest.objects.filter(
+                id=request_id, status="pending"
+            ).update(status="fulfilled", updated_at=timezone.now())
+            if not claimed:
+                return Response(
+                    {"error": "This request has already been accepted."},
+                    status=status.HTTP_409_CONFLICT,
+                )
 
-        # Update the request status
-        blood_request.status = "fulfilled"
-        blood_request.save()
+            # Like the dashboards, the rollups are not told about .update()
+            key = (blood_request.district, blood_request.blood_group)
+            record_bulk_change(BloodRequest, [(*key, "pending")], [(*key, "fulfilled")])
+
+            # Create a new donation record
+            Donation.objects.create(
+                donor=request.user,
+                blood_group=blood_request.blood_group,
+                donation_date=serializer.validated_data["donation_date"],
+                details=serializer.validated_data.get("details"),
+            )
+            # .update() skips post_save, so invalidate dashboards explicitly
+            transaction.on_commit(
+                partial(invalidate_request_dashboards, blood_request.requester_id)
+            )
 
         return Response(
             {"message": "Request accepted and donation recorded"},
             status=status.HTTP_200_OK,
         )
+
+
+class BloodStatsAPIView(APIView):
+    """
+    Supply/demand per district and blood group, read only from the rollups.
+
+    ``?district=`` and ``?blood_group=`` narrow the result, ``?period=week``
+    groups donations by week instead of day and ``?days=`` (default 28, at
+    most 366) sets how far back donations go.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = BloodStatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = {
+            field: params.validated_data[field]
+            for field in ("district", "blood_group")
+            if field in params.validated_data
+        }
+        since = timezone.localdate() - datetime.timedelta(
+            days=params.validated_data["days"] - 1
+        )
+
+        supply_demand = SupplyDemandRollup.objects.filter(**filters).order_by(
+            "district", "blood_group"
+        )
+        donations = DonationRollup.objects.filter(**filters, day__gte=since)
+        if params.validated_data["period"] == "week":
+            donations = donations.annotate(period=TruncWeek("day"))
+        else:
+            donations = donations.annotate(period=F("day"))
+        donations = (
+            donations.values("district", "blood_group", "period")
+            .annotate(donations=Sum("donations"))
+            .order_by("period", "district", "blood_group")
+        )
+        return Response(
+            {
+                "supply_demand": SupplyDemandRollupSerializer(
+                    supply_demand, many=True
+                ).data,
+                "donations": DonationRollupSerializer(donations, many=True).data,
+            }
+        )
+
+
+# EventSource cannot send headers, so browsers authenticate the stream with
+# a ticket in the query string instead of their API token, which would end
+# up in access logs and browser history. A ticket names its user, is signed
+# for this one purpose and expires after BLOOD_EVENTS_TICKET_MAX_AGE seconds.
+STREAM_TICKET_SALT = "blood.stream-ticket"
+
+
+class BloodRequestStreamTicketAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        signer = TimestampSigner(salt=STREAM_TICKET_SALT)
+        return Response(
+            {
+                "ticket": signer.sign(str(request.user.pk)),
+                "expires_in": settings.BLOOD_EVENTS_TICKET_MAX_AGE,
+            }
+        )
+
+
+async def authenticate_stream(request):
+    """
+    A ``?ticket=`` from BloodRequestStreamTicketAPIView or a token in the
+    Authorization header, falling back to the session.
+    """
+    ticket = request.GET.get("ticket")
+    if ticket:
+        try:
+            user_id = TimestampSigner(salt=STREAM_TICKET_SALT).unsign(
+                ticket, max_age=settings.BLOOD_EVENTS_TICKET_MAX_AGE
+            )
+        except BadSignature:
+            raise AuthenticationFailed("Invalid or expired stream ticket.")
+        user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+        if user is None:
+            raise AuthenticationFailed("User inactive or deleted.")
+        return user
+    header = get_authorization_header(request).split()
+    if header and header[0].lower() == b"token" and len(header) == 2:
+        authenticate = CachedTokenAuthentication().authenticate_credentials
+        user, _ = await sync_to_async(authenticate)(header[1].decode())
+        return user
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise AuthenticationFailed()
+    return user
+
+
+async def blood_request_events(subscription):
+    backend = get_backend()
+    backend.subscribe(subscription)
+    try:
+        # Tells EventSource how long to wait before reconnecting
+        yield "retry: 10000\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(
+                    subscription.queue.get(), settings.BLOOD_EVENTS_KEEPALIVE
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        backend.unsubscribe(subscription)
+
+
+# Server-sent events: new pending requests the connected donor can satisfy.
+# Needs ASGI; each idle connection is one suspended coroutine, not a thread.
+# Under WSGI the stream would hold a worker for good, in an event loop that
+# is closed by the time anything is published to it.
+async def blood_request_stream(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "Streaming needs the ASGI server (rokto_dan.asgi)."},
+            status=501,
+        )
+    try:
+        user = await authenticate_stream(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+
+    donor = (
+        await DonorProfile.objects.filter(user=user, is_available=True)
+        .only("blood_group", "district")
+        .afirst()
+    )
+    if donor is None:
+        return JsonResponse(
+            {"error": "Only available donors can subscribe to blood requests."},
+            status=403,
+        )
+
+    subscription = Subscription(user.pk, donor.blood_group, donor.district)
+    response = StreamingHttpResponse(
+        blood_request_events(subscription), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Stop reverse proxies (nginx) from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
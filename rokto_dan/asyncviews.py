@@ -0,0 +1,107 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections, transaction
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines.
+
+    DRF's ``dispatch`` is synchronous, so under ASGI Django runs every DRF view
+    in a worker thread. Here authentication, permission and throttle checks
+    take a single thread hop and the handler itself runs on the event loop,
+    querying through the async ORM. Handlers that are still plain functions,
+    such as DRF's ``options``, are called directly.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def _in_atomic_block(using=None):
+    return transaction.get_connection(using).in_atomic_block
+
+
+def _pooled():
+    """Whether every database hands out connections from a pool."""
+    return all(
+        "pool" in connections[alias].settings_dict.get("OPTIONS", {})
+        for alias in connections
+    )
+
+
+async def run_concurrently(*calls):
+    """
+    Run synchronous ORM calls, given as ``(func, *args)`` tuples, at the same
+    time and return their results in order.
+
+    Django's async ORM sends every query through one shared thread, so
+    ``asyncio.gather`` over async querysets still runs them one after another.
+    Here each call gets a worker thread and a connection of its own from the
+    pool (DATABASE_POOL), handed back afterwards as at the end of a request.
+    Without a pool each of those connections would be opened and closed
+    again, costing more than the queries save, and inside a transaction (e.g.
+    in tests) other connections could not see its uncommitted rows: the calls
+    then run one by one on the shared thread instead.
+    """
+    if not _pooled() or await sync_to_async(_in_atomic_block)():
+        return [await sync_to_async(func)(*args) for func, *args in calls]
+    # Hand the request's own connection back first: requests holding theirs
+    # while waiting for more could take every connection in the pool
+    await sync_to_async(close_old_connections)()
+
+    def call(func, *args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return await asyncio.gather(
+        *(
+            sync_to_async(call, thread_sensitive=False)(*call_args)
+            for call_args in calls
+        )
+    )
+
+
+def read_async(async_view, sync_view):
+    """
+    Serve GET/HEAD with ``async_view`` and every other method with
+    ``sync_view``, so a route's reads run natively under ASGI while its writes
+    keep the existing synchronous code.
+    """
+
+    async def view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            return await async_view(request, *args, **kwargs)
+        return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+    # DRF views enforce CSRF themselves for session authentication
+    view.csrf_exempt = True
+    return view
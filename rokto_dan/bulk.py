@@ -0,0 +1,216 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .renderers import FastJSONRenderer
+
+CSV = "csv"
+JSON = "json"
+JSONL = "jsonl"
+FORMATS = {CSV: "text/csv", JSON: "application/json", JSONL: "application/x-ndjson"}
+
+
+def detect_format(name="", content_type=""):
+    """Pick CSV or JSON Lines from a file name or content type (CSV by default)."""
+    if name.endswith((".jsonl", ".ndjson")) or content_type in (
+        FORMATS[JSONL],
+        "application/jsonl",
+    ):
+        return JSONL
+    return CSV
+
+
+def read_rows(stream, fmt):
+    """
+    Yield one dict per record from a binary file-like object, line by line.
+
+    Empty CSV cells become None so optional fields validate like missing JSON
+    keys. Malformed JSON lines are yielded as None and reported as row errors.
+    A file that can't be read on (not UTF-8, or malformed CSV) raises
+    UnicodeDecodeError or csv.Error partway through.
+    """
+    lines = codecs.iterdecode(stream, "utf-8-sig")
+    if fmt == JSONL:
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+    else:
+        for row in csv.DictReader(lines):
+            yield {key: value if value != "" else None for key, value in row.items()}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class BulkImporter:
+    """
+    Validate rows in chunks and write each chunk with one bulk_create.
+
+    Subclasses set ``serializer_class`` (a plain Serializer used only for
+    validation) and implement ``build(valid_rows)``, which turns validated
+    data into unsaved model instances using a constant number of queries, and
+    ``save(instances)``. Each chunk is written in its own transaction, so a bad
+    row never rolls back rows from other chunks. If the file can't be read to
+    the end, the rows read so far are still imported and the report says
+    where reading stopped.
+    """
+
+    serializer_class = None
+    chunk_size = 500
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or self.chunk_size
+
+    def build(self, valid_rows):
+        """Return (instances, {row index: errors}) for validated rows."""
+        raise NotImplementedError
+
+    def save(self, instances):
+        raise NotImplementedError
+
+    def run(self, rows):
+        created, errors, unreadable = 0, [], []
+        rows = self.readable(rows, unreadable)
+        for chunk_number, chunk in enumerate(chunked(rows, self.chunk_size)):
+            offset = chunk_number * self.chunk_size + 1
+            valid = []
+            for index, row in enumerate(chunk, start=offset):
+                if row is None:
+                    errors.append({"row": index, "errors": ["Malformed record."]})
+                    continue
+                serializer = self.serializer_class(data=row)
+                if serializer.is_valid():
+                    valid.append((index, serializer.validated_data))
+                else:
+                    errors.append({"row": index, "errors": serializer.errors})
+
+            instances, build_errors = self.build(valid)
+            errors.extend(
+                {"row": index, "errors": error}
+                for index, error in sorted(build_errors.items())
+            )
+            if instances:
+                with transaction.atomic():
+                    self.save(instances)
+                created += len(instances)
+        return {"imported": created, "errors": errors + unreadable}
+
+    @staticmethod
+    def readable(rows, unreadable):
+        """``rows`` until the file can't be read on; records why in ``unreadable``."""
+        index = 0
+        try:
+            for index, row in enumerate(rows, start=1):
+                yield row
+        except (UnicodeDecodeError, csv.Error) as exc:
+            unreadable.append(
+                {
+                    "file": f"Unreadable after row {index}, so later rows were "
+                    f"not imported: {exc}"
+                }
+            )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream_rows(queryset, fields, fmt, chunk_size=2000):
+    """
+    Yield CSV, JSON or JSON Lines output for ``queryset.values_list(*fields)``.
+
+    ``iterator(chunk_size=...)`` uses a server-side cursor on Postgres, so
+    only one chunk of rows is in memory at a time.
+    """
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    names = [field.split("__")[-1] for field in fields]
+    if fmt == JSON:
+        # One array, rendered a chunk of rows at a time
+        renderer = FastJSONRenderer()
+        yield b"["
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            rendered = renderer.render([dict(zip(names, row)) for row in chunk])
+            yield (b"," if index else b"") + rendered[1:-1]
+        yield b"]"
+    elif fmt == JSONL:
+        # Rendered like the JSON export's rows, byte for byte
+        renderer = FastJSONRenderer()
+        for row in rows:
+            yield renderer.render(dict(zip(names, row))) + b"\n"
+    else:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class BulkImportExportMixin:
+    """
+    Adds ``POST <list>/import/`` and ``GET <list>/export/`` to a ViewSet.
+
+    Imports take a raw CSV / JSON Lines body (``Content-Type: text/csv`` or
+    ``application/x-ndjson``) or a multipart ``file`` upload and are read line
+    by line. Exports honour the view's filters and stream the rows as CSV,
+    or as ``?type=json`` / ``jsonl``. Both are limited to staff users
+    because they act on other users' records.
+    """
+
+    importer_class = None
+    export_fields = None
+    export_filename = "export"
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_import(self, request, *args, **kwargs):
+        if request.content_type.startswith("multipart/form-data"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                raise ValidationError({"file": "No file was submitted."})
+            stream, fmt = upload, detect_format(name=upload.name)
+        else:
+            stream = request.stream or []
+            fmt = detect_format(content_type=request.content_type.split(";")[0])
+        result = self.importer_class().run(read_rows(stream, fmt))
+        return Response(result, status=status.HTTP_200_OK)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        permission_classes=[IsAdminUser],
+    )
+    def export(self, request, *args, **kwargs):
+        fmt = request.query_params.get("type")
+        if fmt not in FORMATS:
+            fmt = CSV
+        queryset = self.filter_queryset(self.get_queryset()).order_by("pk")
+        response = StreamingHttpResponse(
+            stream_rows(queryset, self.export_fields, fmt), content_type=FORMATS[fmt]
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{self.export_filename}.{fmt}"'
+        )
+        return response
@@ -0,0 +1,95 @@
+"""
+Conditional GET (ETag / Last-Modified) for models with an ``updated_at``.
+
+A single object's validators come from its pk and updated_at. A page of a
+list gets an ETag from the page query itself: the pk and updated_at of every
+row on it, its links and the URL it was asked for (filters, cursor). An
+edit, insert or delete that changes what the page shows changes one of
+those, and the validator costs nothing beyond the bounded page query, with
+only the serializing skipped for a 304. Lists have no Last-Modified: no row
+left on a page records that another was deleted from it.
+"""
+
+import hashlib
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .values import ValuesListMixin
+
+# Selected with the rows of a list page to build its ETag from
+PAGE_COLUMNS = ("pk", "updated_at")
+
+
+def make_validators(request, last_modified, *parts):
+    """Return (ETag, Last-Modified timestamp) for a representation."""
+    # The same rows rendered by another renderer (e.g. the browsable API)
+    # are a different representation
+    renderer = getattr(request, "accepted_renderer", None)
+    key = [*parts, last_modified.isoformat() if last_modified else "-"]
+    key.append(renderer.format if renderer else "")
+    digest = hashlib.md5(
+        ":".join(map(str, key)).encode(), usedforsecurity=False
+    ).hexdigest()
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return quote_etag(digest), timestamp
+
+
+def collection_validators(request, rows, *links):
+    """(ETag, None) for a page of ``rows``, instances or values rows."""
+    key = [request.get_full_path(), *links]
+    for row in rows:
+        key += [row.pk, row.updated_at.isoformat()]
+    return make_validators(request, None, "list", *key)
+
+
+def object_validators(request, instance):
+    return make_validators(request, instance.updated_at, instance.pk)
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 (or 412) response if the client's copy is current, else None."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+class ConditionalGetMixin(ValuesListMixin):
+    """
+    ``list`` and ``retrieve`` for ModelViewSets over models with an
+    ``updated_at``, answering ``304 Not Modified`` to ``If-None-Match`` (and
+    ``If-Modified-Since`` for single objects) without serializing the payload.
+    """
+
+    list_columns = PAGE_COLUMNS
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list_response(
+            *self.fetch_list(self.filter_queryset(self.get_queryset()))
+        )
+
+    def conditional_list_response(self, values, rows, paginated):
+        links = []
+        if paginated:
+            links = [self.paginator.get_next_link(), self.paginator.get_previous_link()]
+        validators = collection_validators(self.request, rows, *links)
+        response = not_modified(self.request, *validators)
+        if response is None:
+            response = self.list_page_response(values, rows, paginated)
+        return set_validators(response, *validators)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        validators = object_validators(request, instance)
+        response = not_modified(request, *validators)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        return set_validators(response, *validators)
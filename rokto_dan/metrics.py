@@ -0,0 +1,159 @@
+"""
+Per-endpoint request metrics in the Prometheus text format.
+
+MetricsMiddleware times every sampled request and counts its database
+queries, labelled with the resolved URL name. The histograms live in this
+process, so each worker serves its own /metrics and Prometheus scrapes and
+sums them like any multi-process exporter.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def format_labels(names, values):
+    pairs = (
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"),
+        )
+        for name, value in zip(names, values)
+    )
+    return ",".join(pairs)
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=("view", "method")):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self.lock = threading.Lock()
+        # label values -> [count per bucket (last one is +Inf), sum]
+        self.series = {}
+
+    def observe(self, label_values, value):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = [
+                (key, list(counts), total)
+                for key, (counts, total) in self.series.items()
+            ]
+        for label_values, counts, total in sorted(series):
+            labels = format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{format_number(bound)}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"{self.name}_sum{{{labels}}} {format_number(total)}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to produce the response, including middleware.",
+    DURATION_BUCKETS,
+    labels=("view", "method", "status"),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries run per request.", QUERY_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in database queries per request.",
+    DURATION_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Response body size; streaming responses are not counted.",
+    SIZE_BUCKETS,
+)
+HISTOGRAMS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_DURATION, RESPONSE_SIZE)
+
+
+class RequestMetrics:
+    """Queries of one request; ``sql`` keeps their text for the slow log."""
+
+    def __init__(self, keep_sql=False):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db_time = 0.0
+        self.sql = [] if keep_sql else None
+
+    def record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            # Async views may query from several threads at once
+            with self.lock:
+                self.queries += 1
+                self.db_time += elapsed
+                if self.sql is not None:
+                    self.sql.append(f"[{elapsed * 1000:.1f}ms] {sql}")
+
+
+# Set by MetricsMiddleware for sampled requests; copied into the threads that
+# sync_to_async runs ORM calls in, so async views are measured too
+current_request = ContextVar("current_request", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """Add ``record_query`` to ``connection.execute_wrappers`` once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+def render():
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, only answered for METRICS_ALLOWED_IPS."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4")
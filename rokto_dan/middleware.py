@@ -0,0 +1,240 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .metrics import (
+    REQUEST_DB_DURATION,
+    REQUEST_DURATION,
+    REQUEST_QUERIES,
+    RESPONSE_SIZE,
+    RequestMetrics,
+    current_request,
+    install_query_recorder,
+)
+from .routers import RoutingState, current_state
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("rokto_dan.slow_requests")
+# Brotli's default, 11, is meant for static files; 5 compresses better than
+# gzip's default at a similar speed
+BROTLI_QUALITY = 5
+
+
+def view_label(request):
+    """The resolved URL name, or the route pattern for unnamed URLs."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.view_name if match.url_name else match.route
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, database queries and response size per endpoint.
+
+    A METRICS_SAMPLE_RATE share of requests is measured; the rest cost one
+    random() call. Requests slower than METRICS_SLOW_REQUEST_MS (when set)
+    are logged to ``rokto_dan.slow_requests`` with their SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened later get the recorder from connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def start(self):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return None
+        metrics = RequestMetrics(keep_sql=bool(settings.METRICS_SLOW_REQUEST_MS))
+        return metrics, current_request.set(metrics)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = self.start()
+        if started is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(started[1])
+        self.finish(started[0], request, response)
+        return response
+
+    async def __acall__(self, request):
+        started = self.start()
+        if started is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(started[1])
+        self.finish(started[0], request, response)
+        return response
+
+    def finish(self, metrics, request, response):
+        elapsed = time.perf_counter() - metrics.started
+        labels = (view_label(request), request.method)
+        REQUEST_DURATION.observe(labels + (str(response.status_code),), elapsed)
+        REQUEST_QUERIES.observe(labels, metrics.queries)
+        REQUEST_DB_DURATION.observe(labels, metrics.db_time)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+
+        threshold = settings.METRICS_SLOW_REQUEST_MS
+        if threshold and elapsed * 1000 >= threshold:
+            logger.warning(
+                "Slow request %s %s (%s): %.1fms, %d queries in %.1fms\n%s",
+                request.method,
+                request.get_full_path(),
+                labels[0],
+                elapsed * 1000,
+                metrics.queries,
+                metrics.db_time * 1000,
+                "\n".join(metrics.sql),
+            )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Track each request for ReplicaRouter, and after a request that wrote,
+    pin its user to the primary. Removed when no replicas are configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(request)
+        token = current_state.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            current_state.reset(token)
+            state.finish()
+
+    async def __acall__(self, request):
+        state = RoutingState(request)
+        token = current_state.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_state.reset(token)
+            state.finish()
+
+
+def preferred_encoding(accept_encoding):
+    """
+    "br" or "gzip", whichever Accept-Encoding rates highest (Brotli on a
+    tie, when it is installed), or None when it accepts neither.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    default = weights.get("*", 0.0)
+    codings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(codings, key=lambda coding: weights.get(coding, default))
+    return best if weights.get(best, default) > 0 else None
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses of at least COMPRESSION_MIN_SIZE bytes, and streamed
+    ones as they stream, with gzip or, when the brotli package is installed
+    and the client takes it, Brotli.
+
+    Event streams are left alone: compressing them would hold events back
+    until enough output built up. So are async streams.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            if response.is_async or response.get("Content-Type", "").startswith(
+                "text/event-stream"
+            ):
+                return response
+        elif len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        coding = preferred_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if coding == "gzip":
+                response.streaming_content = compress_sequence(
+                    response.streaming_content,
+                    max_random_bytes=GZipMiddleware.max_random_bytes,
+                )
+            else:
+                response.streaming_content = brotli_sequence(response.streaming_content)
+            # Not known until the whole body has streamed
+            del response.headers["Content-Length"]
+        else:
+            if coding == "gzip":
+                # Padded with random bytes against BREACH, like GZipMiddleware
+                compressed = compress_string(
+                    response.content, max_random_bytes=GZipMiddleware.max_random_bytes
+                )
+            else:
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # The compressed body is another representation, so a strong ETag
+        # becomes weak; If-None-Match compares ETags weakly and still matches
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = coding
+        return response
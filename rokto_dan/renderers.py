@@ -0,0 +1,64 @@
+"""
+JSON rendered with orjson when it is installed.
+
+orjson writes the same compact UTF-8 JSON as DRF's JSONRenderer several
+times faster. Output it can't write the same way goes to DRF's renderer
+instead: indented (browsable API, ``; indent=``) or ASCII-only output, and
+data orjson refuses, e.g. dict keys that are not strings. So does data with
+NaN or infinite floats, which orjson would write as ``null`` while DRF's
+strict JSON refuses them; the data is only searched for them when the output
+has a ``null``. Values orjson doesn't know are converted by DRF's encoder,
+so lazy strings, Decimals and the like come out as before. The one
+difference left is the notation of floats under 1e-4 or from 1e16 up:
+``0.00001`` rather than ``1e-05``, the same number.
+"""
+
+import math
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def has_non_finite(data):
+    """Whether ``data`` holds a NaN or infinite float or Decimal anywhere."""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, Decimal) and not value.is_finite():
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            rendered = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                # DRF writes UTC datetimes with a "Z" and has no dataclasses
+                option=orjson.OPT_UTC_Z | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"null" in rendered and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like DRF does, so the JSON is a strict JavaScript subset
+        return rendered.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
@@ -0,0 +1,121 @@
+"""
+Send the reads of safe requests to read replicas.
+
+ReplicaRoutingMiddleware attaches a RoutingState to every request while
+replicas are configured. Within a GET, HEAD or OPTIONS request reads go to
+one replica, picked per request; everything else (other requests,
+management commands, the shell) keeps reading from the primary, which takes
+all writes. Once a request writes, its later reads go to the primary, and
+for DATABASE_REPLICA_PIN_SECONDS afterwards so do that user's requests, so
+they read their own writes even while the replicas lag behind. Pins are
+kept in the default cache, which every server process must share (CACHE_URL)
+for them to follow the user from one process to the next.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import LazyObject, empty
+
+PIN_KEY = "db:primary:user:{user_id}"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def authenticated_user_id(request):
+    """
+    The request's user id, or None while it is anonymous or not yet known:
+    reading a lazy ``request.user`` here would run its queries from inside
+    the router.
+    """
+    user = getattr(request, "user", None)
+    if user is None or isinstance(user, LazyObject) and user._wrapped is empty:
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+def pin_user(user_id):
+    cache.set(
+        PIN_KEY.format(user_id=user_id),
+        True,
+        timeout=settings.DATABASE_REPLICA_PIN_SECONDS,
+    )
+
+
+class RoutingState:
+    def __init__(self, request):
+        self.request = request
+        self.replica = random.choice(settings.DATABASE_REPLICAS)
+        self.pinned = request.method not in SAFE_METHODS
+        self.wrote = False
+        # None until the user is known and their pin has been looked up
+        self.user_pinned = None
+
+    def reads_from_primary(self, user_id=None):
+        if self.pinned:
+            return True
+        if self.user_pinned is None:
+            if user_id is None:
+                user_id = authenticated_user_id(self.request)
+            if user_id is None:
+                return False
+            # Set first: a database cache backend reads through this router
+            self.user_pinned = False
+            self.user_pinned = cache.get(PIN_KEY.format(user_id=user_id), False)
+        return self.user_pinned
+
+    def record_write(self):
+        self.pinned = self.wrote = True
+
+    def finish(self):
+        if self.wrote:
+            user_id = authenticated_user_id(self.request)
+            if user_id is not None:
+                pin_user(user_id)
+
+
+# Set by ReplicaRoutingMiddleware; copied into the threads that sync_to_async
+# runs ORM calls in, and shared with them, so a write there pins the request
+current_state = ContextVar("current_routing_state", default=None)
+
+
+def db_for_user(user_id):
+    """
+    The database to read the request's own user from while authenticating
+    them as ``user_id``, before ``request.user`` is known to the router.
+    """
+    state = current_state.get()
+    if state is None or state.reads_from_primary(user_id):
+        return DEFAULT_DB_ALIAS
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current_state.get()
+        if state is None:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # Related rows come from wherever their parent was read
+            return instance._state.db
+        return DEFAULT_DB_ALIAS if state.reads_from_primary() else state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current_state.get()
+        if state is not None:
+            state.record_write()
+        # Also for instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema by replication
+        return db not in settings.DATABASE_REPLICAS
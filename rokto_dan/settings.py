@@ -1,5 +1,6 @@
 import environ
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 
 # Initialize environment variables
@@ -30,12 +31,68 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = env("EMAIL")
 EMAIL_HOST_PASSWORD = env("EMAIL_PASSWORD")
 
-# Database configuration
+# Database configuration. Connections are reused for DATABASE_CONN_MAX_AGE
+# seconds instead of being opened (with TLS, on hosted Postgres) for every
+# request, and checked before reuse so one the server dropped is replaced
+# rather than failing the request. 0 closes them after every request.
+# Behind PgBouncer in transaction mode, set DATABASE_PGBOUNCER so no
+# server-side cursor outlives its transaction.
+CONNECTION_OPTIONS = {
+    "conn_max_age": env.int("DATABASE_CONN_MAX_AGE", default=60),
+    "conn_health_checks": env.bool("DATABASE_CONN_HEALTH_CHECKS", default=True),
+    "disable_server_side_cursors": env.bool("DATABASE_PGBOUNCER", default=False),
+}
 DATABASES = {
-    "default": dj_database_url.config(
-        default=env("DATABASE_URL"),
-    )
+    "default": dj_database_url.config(default=env("DATABASE_URL"), **CONNECTION_OPTIONS)
 }
+# Read replicas, as a comma-separated list of database URLs. Reads in GET,
+# HEAD and OPTIONS requests go to one of them (rokto_dan.routers); writes,
+# and a user's reads for DATABASE_REPLICA_PIN_SECONDS after they write, go
+# to the primary. Under test the replicas mirror the primary. Those pins live
+# in the default cache: with more than one server process it has to be a
+# shared one (CACHE_URL), or a user's next read can land on a process that
+# never saw the pin and go to a lagging replica.
+for index, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), 1):
+    DATABASES[f"replica{index}"] = dj_database_url.parse(url, **CONNECTION_OPTIONS)
+    DATABASES[f"replica{index}"]["TEST"] = {"MIRROR": "default"}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+
+# psycopg 3's connection pool for every Postgres database (Django's
+# postgresql backend; psycopg[binary,pool] in requirements.txt). Suited to
+# ASGI, where each request may run in a different thread and per-thread
+# persistent connections are not reused. The pool owns reuse, so Django's
+# own CONN_MAX_AGE must be 0.
+DATABASE_POOL = env.bool("DATABASE_POOL", default=False)
+if DATABASE_POOL:
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured(
+            "DATABASE_POOL needs psycopg 3 and its pool: "
+            "pip install 'psycopg[binary,pool]'"
+        )
+    for database in DATABASES.values():
+        if database["ENGINE"] == "django.db.backends.postgresql":
+            database["CONN_MAX_AGE"] = 0
+            database.setdefault("OPTIONS", {})["pool"] = {
+                "min_size": env.int("DATABASE_POOL_MIN_SIZE", default=2),
+                "max_size": env.int("DATABASE_POOL_MAX_SIZE", default=10),
+                "timeout": env.int("DATABASE_POOL_TIMEOUT", default=10),
+            }
+DATABASE_ROUTERS = ["rokto_dan.routers.ReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = env.int("DATABASE_REPLICA_PIN_SECONDS", default=10)
+
+# Cache shared by every server process, e.g. CACHE_URL=redis://host:6379/1
+# (needs the redis package). Token lookups, dashboard versions, replica pins,
+# throttle buckets and the lifecycle scheduler all keep state here that one
+# process changes and the others have to see; the default per-process
+# memory cache only holds that together while a single process serves.
+CACHES = {"default": env.cache_url("CACHE_URL", default="locmemcache://")}
+SHARED_CACHE = CACHES["default"]["BACKEND"] not in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
 
 # REST framework settings
 REST_FRAMEWORK = {
@@ -43,10 +100,31 @@ REST_FRAMEWORK = {
         "rest_framework.filters.SearchFilter",
         "django_filters.rest_framework.DjangoFilterBackend",
     ],
-   
-    
+    # Token lookups are cached; session and basic auth stay as before
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "user.authentication.CachedTokenAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+    # Keyset pagination on every list endpoint; clients follow "next"/"previous"
+    # links and may ask for up to KeysetPagination.max_page_size rows.
+    "DEFAULT_PAGINATION_CLASS": "rokto_dan.pagination.KeysetPagination",
+    # JSON written by orjson when it is installed (rokto_dan.renderers)
+    "DEFAULT_RENDERER_CLASSES": [
+        "rokto_dan.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# Responses smaller than this many bytes are not compressed (gzip, or
+# Brotli with the brotli package; rokto_dan.middleware.CompressionMiddleware):
+# they would barely shrink, if at all
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=1024)
+
+# List endpoints read their rows with values_list() rather than through
+# model instances and ModelSerializers (rokto_dan.values); same output
+FAST_LIST_SERIALIZATION = env.bool("FAST_LIST_SERIALIZATION", default=True)
+
 # Application definition
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -64,6 +142,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "rokto_dan.middleware.MetricsMiddleware",
+    "rokto_dan.middleware.ReplicaRoutingMiddleware",
+    "rokto_dan.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -118,3 +199,101 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Seconds a user's dashboard response stays cached; writes to their requests
+# or donations invalidate it earlier, in every process only with a shared
+# cache (CACHE_URL). Multi-worker deployments must configure one, or the
+# other workers serve the stale dashboard for up to this long.
+DASHBOARD_CACHE_TIMEOUT = env.int("DASHBOARD_CACHE_TIMEOUT", default=60)
+
+# Registration emails go through the outbox table; run
+# ``manage.py send_queued_email --loop`` to deliver them.
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int("EMAIL_OUTBOX_MAX_ATTEMPTS", default=5)
+# Seconds before the first retry; doubles on every failed attempt
+EMAIL_OUTBOX_RETRY_DELAY = env.int("EMAIL_OUTBOX_RETRY_DELAY", default=60)
+# Seconds a worker owns a claimed batch before another worker may retry it.
+# Each email's lease is renewed as its send starts, so this must exceed the
+# worst-case time of one delivery (EMAIL_TIMEOUT, if set, bounds it). A batch
+# may take longer: emails whose lease ran out before their turn and were
+# claimed by another worker are skipped, not sent twice.
+EMAIL_OUTBOX_LEASE = env.int("EMAIL_OUTBOX_LEASE", default=300)
+
+# Cache alias and lifetime (seconds) for token -> user id lookups; the user
+# is still read, and checked to be active, on every request. A logout drops
+# the entry only from the cache of the process that handled it, so without a
+# shared cache other processes keep accepting the token until it expires:
+# seconds rather than minutes, then.
+TOKEN_AUTH_CACHE = env("TOKEN_AUTH_CACHE", default="default")
+TOKEN_AUTH_CACHE_TIMEOUT = env.int(
+    "TOKEN_AUTH_CACHE_TIMEOUT", default=300 if SHARED_CACHE else 5
+)
+
+# Server-sent events for new blood requests (/blood/blood_requests/stream/).
+# The in-process backend only reaches clients connected to the same ASGI
+# worker; point this at another backend class to fan out across workers.
+BLOOD_EVENTS_BACKEND = env(
+    "BLOOD_EVENTS_BACKEND", default="blood.events.InProcessBackend"
+)
+# Seconds between keep-alive comments on idle streams
+BLOOD_EVENTS_KEEPALIVE = env.int("BLOOD_EVENTS_KEEPALIVE", default=15)
+# Undelivered events buffered per connection before new ones are dropped
+BLOOD_EVENTS_QUEUE_SIZE = env.int("BLOOD_EVENTS_QUEUE_SIZE", default=100)
+# Seconds a stream ticket (POST /blood/blood_requests/stream/ticket/) may be
+# used to connect for; clients fetch a new one to reconnect
+BLOOD_EVENTS_TICKET_MAX_AGE = env.int("BLOOD_EVENTS_TICKET_MAX_AGE", default=30)
+
+# Token-bucket rates (rokto_dan.throttling) as "<scope>_<ip|user>": "N/period"
+# with period s, min, hour or day; e.g. THROTTLE_RATES="login_ip=60/min,...".
+# Empty or missing rates are not throttled. Buckets live in THROTTLE_CACHE,
+# the default cache unless set: with a per-process cache every worker keeps
+# its own buckets and the effective limit is the rate times the number of
+# workers, so multi-worker deployments need CACHE_URL (or an alias of their
+# own) pointing at a shared backend.
+THROTTLE_RATES = env.dict(
+    "THROTTLE_RATES",
+    default={
+        "login_ip": "30/min",
+        "login_user": "10/min",
+        "register_ip": "20/hour",
+        "register_user": "3/hour",
+        "accept_user": "30/min",
+    },
+)
+THROTTLE_CACHE = env.str("THROTTLE_CACHE", default="default")
+
+# Request lifecycle (blood.lifecycle): pending requests expire this many days
+# after their date, and closed requests and donations older than
+# BLOOD_ARCHIVE_AFTER_DAYS move to the archive tables. Run
+# ``manage.py run_lifecycle --loop``, or set BLOOD_LIFECYCLE_INTERVAL
+# (seconds) to run it in a thread of every server process instead.
+BLOOD_REQUEST_EXPIRE_AFTER_DAYS = env.int("BLOOD_REQUEST_EXPIRE_AFTER_DAYS", default=0)
+BLOOD_ARCHIVE_AFTER_DAYS = env.int("BLOOD_ARCHIVE_AFTER_DAYS", default=365)
+BLOOD_LIFECYCLE_INTERVAL = env.int("BLOOD_LIFECYCLE_INTERVAL", default=0)
+
+# Serve the dashboard, donor list, donor matches and profile reads with async
+# views. Turn on when running under ASGI (rokto_dan.asgi); under WSGI every
+# async view would need its own event loop per request.
+ASYNC_VIEWS = env.bool("ASYNC_VIEWS", default=False)
+# Connections persist per thread, and async views run their queries in
+# threads that come and go, so under ASGI persistent connections pile up
+# instead of being reused. Postgres databases must then be pooled
+# (DATABASE_POOL): without it each request would open its connections anew,
+# TLS and all. Others, e.g. SQLite files, are cheap to open and just stop
+# persisting.
+if ASYNC_VIEWS:
+    for alias, database in DATABASES.items():
+        if "pool" in database.get("OPTIONS", {}):
+            continue
+        if database["ENGINE"] == "django.db.backends.postgresql":
+            raise ImproperlyConfigured(
+                f"ASYNC_VIEWS needs DATABASE_POOL for the {alias!r} database"
+            )
+        database["CONN_MAX_AGE"] = 0
+
+# Request metrics, scraped from /metrics by Prometheus. The share of requests
+# measured (0 turns the middleware into a pass-through) and the addresses
+# allowed to scrape.
+METRICS_SAMPLE_RATE = env.float("METRICS_SAMPLE_RATE", default=1.0)
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"])
+# Log requests slower than this many milliseconds with their SQL; 0 disables
+METRICS_SLOW_REQUEST_MS = env.int("METRICS_SLOW_REQUEST_MS", default=0)
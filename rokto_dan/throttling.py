@@ -0,0 +1,118 @@
+"""
+Token-bucket throttles for the endpoints worth abusing: login, registration
+and accepting requests.
+
+A view names its ``throttle_scope``; THROTTLE_RATES gives each throttle of
+that scope a rate such as ``"5/min"``: a bucket of 5 tokens refilled
+continuously at 5 a minute. Every request takes a token, and while the
+bucket is empty the request is refused with 429 and a Retry-After header.
+AddressThrottle keys buckets by client address, UserThrottle by the
+authenticated user or, on anonymous views, by the username or email the
+request submits, so one account can't be hammered from many addresses.
+
+A bucket is one integer in the THROTTLE_CACHE cache, the time in
+milliseconds at which it will be full again, moved with the cache's atomic
+``incr``/``decr`` (locmem, Redis and memcached are atomic; the database
+cache is not). Checking it costs no database query. The cache has to be
+shared by the server processes (CACHE_URL); each one would otherwise keep
+buckets of its own.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+THROTTLE_KEY = "throttle:{scope}:{kind}:{ident}"
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """``"5/min"`` -> (5 tokens, 60 seconds to refill them all)."""
+    tokens, period = rate.split("/")
+    return int(tokens), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # The kind of client a bucket belongs to; rates are looked up as
+    # THROTTLE_RATES["<scope>_<kind>"]
+    kind = None
+    timer = time.time
+
+    def get_ident_key(self, request, view):
+        """The client's bucket within the scope, or None not to throttle."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        rate = settings.THROTTLE_RATES.get(f"{scope}_{self.kind}") if scope else None
+        if not rate:
+            return True
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        tokens, period = parse_rate(rate)
+        key = THROTTLE_KEY.format(scope=scope, kind=self.kind, ident=ident)
+        return self.take(key, tokens, period * 1000)
+
+    def take(self, key, tokens, period_ms):
+        cache = caches[settings.THROTTLE_CACHE]
+        interval = max(period_ms // tokens, 1)
+        # A bucket is full again one period after it was last empty. Keys
+        # expire a period after they were set or a request was refused, so
+        # an expired key forgets at most one bucket's worth of requests
+        timeout = period_ms // 1000 + 1
+        now = int(self.timer() * 1000)
+        try:
+            full_at = cache.incr(key, interval)
+        except ValueError:
+            if cache.add(key, now + interval, timeout):
+                return True
+            full_at = cache.incr(key, interval)
+        if full_at - interval < now:
+            # The bucket was already full: count from now. Racing requests
+            # may overwrite each other here, which only ever lets one more in
+            full_at = now + interval
+            cache.set(key, full_at, timeout)
+        if full_at - now <= period_ms:
+            return True
+        # Give the token back; the client waits until one has refilled
+        cache.decr(key, interval)
+        cache.touch(key, timeout)
+        self.retry_after = (full_at - period_ms - now) / 1000
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+
+class AddressThrottle(TokenBucketThrottle):
+    kind = "ip"
+
+    def get_ident_key(self, request, view):
+        # REMOTE_ADDR, or X-Forwarded-For as far as NUM_PROXIES allows
+        return self.get_ident(request)
+
+
+class UserThrottle(TokenBucketThrottle):
+    """
+    Buckets per user. Views with a ``throttle_user_field`` are throttled by
+    that submitted field (e.g. the username on login) instead.
+    """
+
+    kind = "user"
+
+    def get_ident_key(self, request, view):
+        field = getattr(view, "throttle_user_field", None)
+        if field is None:
+            user = request.user
+            return user.pk if user and user.is_authenticated else None
+        data = request.data
+        value = data.get(field) if hasattr(data, "get") else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return hashlib.md5(
+            value.strip().lower().encode(), usedforsecurity=False
+        ).hexdigest()
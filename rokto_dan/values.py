@@ -0,0 +1,138 @@
+"""
+List serialization straight from database rows.
+
+For every row, a ModelSerializer builds a model instance, then reads it back
+field object by field object into a new dict. For the plain column fields
+our list endpoints return, ValuesSerializer selects just those columns with
+``values_list()`` and zips each row tuple with the serializer's field names,
+in its order: the same data the serializer produces, at a fraction of the
+cost. Turned off by FAST_LIST_SERIALIZATION.
+"""
+
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Fields whose representation of a column value is the value itself
+PLAIN_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.EmailField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+    serializers.ReadOnlyField,
+)
+
+
+def isoformat(value):
+    return value.isoformat()
+
+
+class ValuesSerializer:
+    def __init__(self, serializer_class):
+        self.names, self.sources, self.converters = [], [], []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if type(field) is serializers.DateField:
+                output_format = getattr(field, "format", api_settings.DATE_FORMAT)
+                if output_format is not None:
+                    if output_format.lower() != ISO_8601:
+                        raise self.unsupported(serializer_class, name, field)
+                    self.converters.append((name, isoformat))
+            elif type(field) is serializers.BigIntegerField:
+                if getattr(
+                    field, "coerce_to_string", api_settings.COERCE_BIGINT_TO_STRING
+                ):
+                    self.converters.append((name, str))
+            elif type(field) not in PLAIN_FIELDS or field.source == "*":
+                raise self.unsupported(serializer_class, name, field)
+            self.names.append(name)
+            self.sources.append(field.source.replace(".", "__"))
+
+    @staticmethod
+    def unsupported(serializer_class, name, field):
+        return ImproperlyConfigured(
+            f"{serializer_class.__name__}.{name} can't be read from "
+            f"values_list(): {type(field).__name__} is not supported."
+        )
+
+    def rows(self, queryset, ordering=()):
+        """
+        ``queryset`` as rows of the serializer's columns, plus any columns of
+        ``ordering`` a keyset paginator reads its cursor from (and any other
+        columns passed along with them).
+        """
+        sources = list(self.sources)
+        for field in ordering:
+            if field.lstrip("-") not in sources:
+                sources.append(field.lstrip("-"))
+        return queryset.values_list(*sources, named=True)
+
+    def to_representation(self, rows):
+        names, converters = self.names, self.converters
+        data = []
+        for row in rows:
+            item = dict(zip(names, row))
+            for name, convert in converters:
+                if item[name] is not None:
+                    item[name] = convert(item[name])
+            data.append(item)
+        return data
+
+
+@cache
+def _values_serializer(serializer_class):
+    return ValuesSerializer(serializer_class)
+
+
+def get_values_serializer(serializer_class):
+    """The ValuesSerializer standing in for ``serializer_class``, or None."""
+    if not settings.FAST_LIST_SERIALIZATION:
+        return None
+    return _values_serializer(serializer_class)
+
+
+class ValuesListMixin:
+    """``list`` for generic views, serialized with a ValuesSerializer."""
+
+    # Columns selected besides the serializer's, e.g. for validators
+    list_columns = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    def list_response(self, queryset):
+        return self.list_page_response(*self.fetch_list(queryset))
+
+    def fetch_list(self, queryset):
+        """(ValuesSerializer or None, the rows to show, whether they're a page)"""
+        values = get_values_serializer(self.get_serializer_class())
+        if values is not None:
+            queryset = self.get_list_rows(values, queryset)
+        page = self.paginate_queryset(queryset)
+        return values, queryset if page is None else page, page is not None
+
+    def list_page_response(self, values, rows, paginated):
+        data = self.serialize_list(values, rows)
+        if not paginated:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def serialize_list(self, values, rows):
+        if values is None:
+            return self.get_serializer(rows, many=True).data
+        return values.to_representation(rows)
+
+    def get_list_rows(self, values, queryset):
+        ordering = ()
+        if hasattr(self.paginator, "get_ordering"):
+            # e.g. DonorSearchFilter orders by relevance
+            ordering = self.paginator.get_ordering(self.request, queryset, self)
+        return values.rows(queryset, (*ordering, *self.list_columns))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rokto_dan.settings')
 
 application = get_wsgi_application()
+
+# Expires and archives blood requests when BLOOD_LIFECYCLE_INTERVAL is set
+from blood.lifecycle import start_scheduler  # noqa: E402
+
+start_scheduler()
@@ -1,7 +1,15 @@
 from django.contrib import admin
-from .models import DonorProfile
+from .models import DonorProfile, OutgoingEmail
 
 # Register your models here.
 # admin.site.register(UserRegister)
-admin.site.register(DonorProfile)
+
+
+@admin.register(DonorProfile)
+class DonorProfileAdmin(admin.ModelAdmin):
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+
+
 # admin.site.register(UserProfile)
+admin.site.register(OutgoingEmail)
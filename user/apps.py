@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        from django.db.models import CharField
+        from django.db.models.functions import Upper
+
+        # Allows ``field__upper=VALUE`` lookups that hit UPPER(field) indexes
+        CharField.register_lookup(Upper)
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rokto_dan.routers import db_for_user
+from .cache import get_cached_token_user_id, set_cached_token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the token lookup on cache hits.
+
+    The TOKEN_AUTH_CACHE cache maps a digest of each token to its user's id
+    for TOKEN_AUTH_CACHE_TIMEOUT seconds; the entry is dropped as soon as the
+    token is deleted (logout), which reaches every server process only when
+    the cache is shared by them (CACHE_URL). The user is read by primary key
+    on every request, so a deactivated or deleted user is refused at once,
+    whether they were saved or changed by a queryset update.
+    """
+
+    def authenticate_credentials(self, key):
+        user_id = get_cached_token_user_id(key)
+        if user_id is None:
+            user, token = super().authenticate_credentials(key)
+            set_cached_token(token)
+            return (user, token)
+        # From the primary while the user is pinned there, e.g. after login
+        user = User.objects.using(db_for_user(user_id)).filter(pk=user_id).first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        return (user, Token(key=key, user=user))
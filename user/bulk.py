@@ -0,0 +1,93 @@
+from django.contrib.auth.models import User
+from rest_framework import serializers
+from blood.stats import TRACKED_FIELDS, record_bulk_change
+from rokto_dan.bulk import BulkImporter
+from .constants import BLOOD_GROUP
+from .models import DonorProfile
+
+# Column order for donor exports; imports accept the same columns
+DONOR_EXPORT_FIELDS = [
+    "user__username",
+    "user__email",
+    "blood_group",
+    "district",
+    "date_of_donation",
+    "donor_type",
+    "is_available",
+]
+
+
+def resolve_usernames(valid_rows):
+    """Map every username in the chunk to a user id with a single query."""
+    usernames = {data["username"] for _, data in valid_rows}
+    return dict(
+        User.objects.filter(username__in=usernames).values_list("username", "id")
+    )
+
+
+class DonorImportSerializer(serializers.Serializer):
+    username = serializers.CharField()
+    blood_group = serializers.ChoiceField(choices=BLOOD_GROUP)
+    district = serializers.CharField(max_length=100)
+    date_of_donation = serializers.DateField(required=False, allow_null=True)
+    donor_type = serializers.CharField(max_length=50)
+    is_available = serializers.BooleanField(required=False, default=True)
+
+
+class DonorImporter(BulkImporter):
+    """Creates donor profiles, or updates them when the user already has one."""
+
+    serializer_class = DonorImportSerializer
+    update_fields = [
+        "blood_group",
+        "district",
+        "date_of_donation",
+        "donor_type",
+        "is_available",
+    ]
+
+    def build(self, valid_rows):
+        user_ids = resolve_usernames(valid_rows)
+        instances, errors, seen = [], {}, set()
+        for index, data in valid_rows:
+            user_id = user_ids.get(data["username"])
+            if user_id is None:
+                errors[index] = {"username": ["Unknown user."]}
+            elif user_id in seen:
+                errors[index] = {"username": ["Duplicate user in the same chunk."]}
+            else:
+                seen.add(user_id)
+                instances.append(
+                    DonorProfile(
+                        user_id=user_id,
+                        **{field: data.get(field) for field in self.update_fields},
+                    )
+                )
+        return instances, errors
+
+    def save(self, instances):
+        user_ids = [instance.user_id for instance in instances]
+        tracked = TRACKED_FIELDS[DonorProfile]
+        old_states = list(
+            DonorProfile.objects.filter(user_id__in=user_ids).values_list(*tracked)
+        )
+        DonorProfile.objects.bulk_create(
+            instances,
+            update_conflicts=True,
+            unique_fields=["user"],
+            # auto_now fills updated_at, but conflicting rows only get the
+            # columns listed here
+            update_fields=self.update_fields + ["updated_at"],
+        )
+        # bulk_create skips save(), which folds in date_of_donation and
+        # donations recorded before the profile existed
+        DonorProfile.objects.filter(user_id__in=user_ids).rebuild_eligibility()
+        # bulk_create sends no signals; move the availability rollups by hand
+        record_bulk_change(
+            DonorProfile,
+            old_states,
+            [
+                tuple(getattr(instance, field) for field in tracked)
+                for instance in instances
+            ],
+        )
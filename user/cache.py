@@ -0,0 +1,94 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+# The dashboard shows the caller's own rows plus everyone else's pending
+# requests, so a cached response depends on two versions: one bumped when the
+# user's own requests/donations change and one bumped on any request change.
+# Both live in the default cache, which has to be shared by all server
+# processes (CACHE_URL) for a bump in one of them to reach the others.
+DASHBOARD_USER_VERSION_KEY = "dashboard:version:user:{user_id}"
+DASHBOARD_PENDING_VERSION_KEY = "dashboard:version:pending"
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, timeout=None)
+
+
+def dashboard_cache_key(user_id, full_path):
+    user_version = _get_version(DASHBOARD_USER_VERSION_KEY.format(user_id=user_id))
+    pending_version = _get_version(DASHBOARD_PENDING_VERSION_KEY)
+    digest = hashlib.md5(full_path.encode("utf-8")).hexdigest()
+    return f"dashboard:{user_id}:{user_version}:{pending_version}:{digest}"
+
+
+def get_cached_dashboard(key):
+    return cache.get(key)
+
+
+def set_cached_dashboard(key, data):
+    cache.set(key, data, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+
+
+def invalidate_user_dashboard(user_id):
+    _bump_version(DASHBOARD_USER_VERSION_KEY.format(user_id=user_id))
+
+
+def invalidate_pending_dashboards():
+    _bump_version(DASHBOARD_PENDING_VERSION_KEY)
+
+
+# Token authentication caches token -> user id, keyed by a digest of the
+# token so the cache never holds a usable credential, and keeps a user id ->
+# digest pointer so a user's entry can be dropped. The user itself is read
+# on every request, so changes such as deactivation apply however they are
+# made.
+TOKEN_KEY = "auth:token:{digest}"
+TOKEN_USER_KEY = "auth:user-token:{user_id}"
+
+
+def _token_cache():
+    return caches[settings.TOKEN_AUTH_CACHE]
+
+
+def _token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_cached_token_user_id(key):
+    return _token_cache().get(TOKEN_KEY.format(digest=_token_digest(key)))
+
+
+def set_cached_token(token):
+    digest = _token_digest(token.key)
+    _token_cache().set_many(
+        {
+            TOKEN_KEY.format(digest=digest): token.user_id,
+            TOKEN_USER_KEY.format(user_id=token.user_id): digest,
+        },
+        timeout=settings.TOKEN_AUTH_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_token(key):
+    _token_cache().delete(TOKEN_KEY.format(digest=_token_digest(key)))
+
+
+def invalidate_user_token(user_id):
+    token_cache = _token_cache()
+    user_key = TOKEN_USER_KEY.format(user_id=user_id)
+    digest = token_cache.get(user_key)
+    if digest is not None:
+        token_cache.delete_many([TOKEN_KEY.format(digest=digest), user_key])
@@ -9,3 +9,19 @@ BLOOD_GROUP = [
     ("AB-", "AB-"),
 ]
 GENDER_TYPE = [("Male", "Male"), ("Female", "Female")]
+
+# Donor blood groups each recipient group can safely receive, most preferred
+# first. Universal donors come last so they are saved for patients who need them.
+BLOOD_COMPATIBILITY = {
+    "A+": ["A+", "A-", "O+", "O-"],
+    "A-": ["A-", "O-"],
+    "B+": ["B+", "B-", "O+", "O-"],
+    "B-": ["B-", "O-"],
+    "O+": ["O+", "O-"],
+    "O-": ["O-"],
+    "AB+": ["AB+", "AB-", "A+", "A-", "B+", "B-", "O+", "O-"],
+    "AB-": ["AB-", "A-", "B-", "O-"],
+}
+
+# Minimum number of days between two whole-blood donations
+DONATION_COOLDOWN_DAYS = 90
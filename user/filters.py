@@ -1,15 +1,46 @@
 from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
 from .models import DonorProfile
 
 
+class UpperCharFilter(filters.CharFilter):
+    """
+    Case-insensitive exact match written as ``UPPER(field) = 'VALUE'``.
+
+    Unlike ``iexact`` (``LIKE`` on SQLite) this can use a functional index on
+    ``Upper(field)`` on every backend.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("lookup_expr", "upper")
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return super().filter(qs, value.upper())
+
+
 class DonorProfileFilter(filters.FilterSet):
-    blood_group = filters.CharFilter(field_name="blood_group", lookup_expr="iexact")
-    district = filters.CharFilter(field_name="district", lookup_expr="iexact")
+    # Blood groups are stored as the upper-case BLOOD_GROUP codes, so an exact
+    # match on the normalised input keeps the plain donor_match_idx usable.
+    blood_group = filters.CharFilter(
+        field_name="blood_group", method="filter_blood_group"
+    )
+    district = UpperCharFilter(field_name="district")
     date_of_donation = filters.DateFilter(
         field_name="date_of_donation", lookup_expr="exact"
     )
-    donor_type = filters.CharFilter(field_name="donor_type", lookup_expr="iexact")
+    donor_type = UpperCharFilter(field_name="donor_type")
+    # ?eligible=true: available and out of the post-donation cooldown
+    eligible = filters.BooleanFilter(method="filter_eligible")
 
     class Meta:
         model = DonorProfile
         fields = ["blood_group", "district", "date_of_donation", "donor_type"]
+
+    def filter_blood_group(self, queryset, name, value):
+        return queryset.filter(**{name: value.upper()})
+
+    def filter_eligible(self, queryset, name, value):
+        return queryset.eligible() if value else queryset.ineligible()
@@ -0,0 +1,121 @@
+"""
+Geohashes and great-circle distances, for proximity search without PostGIS.
+
+A geohash interleaves longitude and latitude bits, so the points of one cell
+share a prefix. Stored as an integer, every cell at any precision is one
+contiguous range of values, and a plain B-tree index answers "every donor
+in these cells" with one range scan per cell on SQLite and Postgres alike.
+"""
+
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+# 45 bits, the 9 base32 characters of a textual geohash: cells of about
+# 4.8 m x 4.8 m
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+# Cells a search circle is covered with: more cells hug the circle tighter
+# and read fewer rows outside it, at the cost of more index ranges
+MAX_COVERING_CELLS = 32
+
+
+def _bits(precision):
+    """(longitude bits, latitude bits) of a cell; longitude gets the odd one."""
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def geohash(latitude, longitude, precision=PRECISION):
+    """The cell containing the point, as an integer; None without a point."""
+    if latitude is None or longitude is None:
+        return None
+    lon_bits, lat_bits = _bits(precision)
+    x = min(int((longitude + 180) / 360 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    y = min(int((latitude + 90) / 180 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    value = 0
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            value = value << 1 | x >> (lon_bits - 1 - bit // 2) & 1
+        else:
+            value = value << 1 | y >> (lat_bits - 1 - bit // 2) & 1
+    return value
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1)
+        * math.cos(phi2)
+        * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def distance_km(latitude, longitude):
+    """Haversine distance from the point to each row's latitude/longitude."""
+    phi = math.radians(latitude)
+    a = Power(Sin((Radians(F("latitude")) - Value(phi)) / 2), 2) + Value(
+        math.cos(phi)
+    ) * Cos(Radians(F("latitude"))) * Power(
+        Sin((Radians(F("longitude")) - Value(math.radians(longitude))) / 2), 2
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(
+        Least(Sqrt(a), Value(1.0)), output_field=FloatField()
+    )
+
+
+def covering_ranges(latitude, longitude, radius_km):
+    """
+    Half-open ``(low, high)`` ranges of PRECISION geohashes that together
+    contain every point within ``radius_km`` of the point.
+
+    The circle's bounding box (clamped at the poles and the antimeridian) is
+    covered with the cells of the finest precision that needs at most
+    MAX_COVERING_CELLS of them, and cells adjacent in geohash order are merged
+    into one range.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angle)
+    # Widest longitude span of the circle, at the latitude its edge touches
+    ratio = math.sin(angle) / max(math.cos(math.radians(latitude)), 1e-12)
+    delta_lon = math.degrees(math.asin(ratio)) if ratio < 1 else 180.0
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+    west = max(longitude - delta_lon, -180.0)
+    east = min(longitude + delta_lon, 180.0)
+
+    precision = PRECISION
+    while precision > 1:
+        lon_bits, lat_bits = _bits(precision)
+        width, height = 360 / (1 << lon_bits), 180 / (1 << lat_bits)
+        columns = int(east // width - west // width) + 1
+        rows = int(north // height - south // height) + 1
+        if columns * rows <= MAX_COVERING_CELLS:
+            break
+        precision -= 1
+    lon_bits, lat_bits = _bits(precision)
+    width, height = 360 / (1 << lon_bits), 180 / (1 << lat_bits)
+
+    cells = set()
+    lat = south
+    while True:
+        lon = west
+        while True:
+            cells.add(geohash(min(lat, north), min(lon, east), precision))
+            if lon >= east:
+                break
+            lon += width
+        if lat >= north:
+            break
+        lat += height
+
+    shift = 5 * (PRECISION - precision)
+    ranges = []
+    for cell in sorted(cells):
+        if ranges and ranges[-1][1] == cell << shift:
+            ranges[-1] = (ranges[-1][0], (cell + 1) << shift)
+        else:
+            ranges.append((cell << shift, (cell + 1) << shift))
+    return ranges
@@ -0,0 +1,122 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, to, html_body="", body=""):
+    """Store an email in the outbox; the worker command delivers it later."""
+    return OutgoingEmail.objects.create(
+        subject=subject, to=to, body=body, html_body=html_body
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2 x base, 4 x base, ..."""
+    return datetime.timedelta(
+        seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    )
+
+
+def claim_batch(batch_size):
+    """
+    Lock and lease up to ``batch_size`` due emails.
+
+    Leasing pushes ``next_attempt_at`` forward so concurrent workers skip the
+    rows without keeping a transaction open during SMTP delivery. If a worker
+    dies mid-batch the lease simply expires and the rows are retried.
+    """
+    now = timezone.now()
+    lease = now + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            next_attempt_at=lease
+        )
+    for email in batch:
+        email.next_attempt_at = lease
+    return batch
+
+
+def renew_lease(email):
+    """
+    Lease ``email`` afresh as its delivery starts, unless its lease ran out
+    and another worker has claimed it since; returns whether it is still ours.
+    """
+    lease = timezone.now() + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+    renewed = OutgoingEmail.objects.filter(
+        pk=email.pk,
+        status=OutgoingEmail.PENDING,
+        next_attempt_at=email.next_attempt_at,
+    ).update(next_attempt_at=lease)
+    email.next_attempt_at = lease
+    return bool(renewed)
+
+
+def send_queued_emails(batch_size=50):
+    """Deliver one batch over a single SMTP connection. Returns (sent, failed)."""
+    return send_batch(claim_batch(batch_size))
+
+
+def send_batch(batch):
+    """
+    Deliver claimed emails, renewing each one's lease as its send starts: a
+    slow SMTP server can outlast the batch's lease, and emails another worker
+    has claimed by then are skipped rather than sent twice.
+    """
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        for email in batch:
+            if not renew_lease(email):
+                continue
+            message = EmailMultiAlternatives(
+                email.subject, email.body, to=[email.to], connection=connection
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, "text/html")
+            try:
+                # No-op while the connection is up; reconnects after a failure
+                connection.open()
+                message.send()
+            except Exception as e:
+                logger.warning(f"Error sending email {email.pk}: {e}")
+                # Drop a possibly broken connection; the next send reopens it.
+                connection.close()
+                email.attempts += 1
+                email.last_error = str(e)
+                if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    email.status = OutgoingEmail.FAILED
+                else:
+                    email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                email.save(
+                    update_fields=[
+                        "attempts",
+                        "last_error",
+                        "status",
+                        "next_attempt_at",
+                    ]
+                )
+                failed += 1
+            else:
+                email.status = OutgoingEmail.SENT
+                email.sent_at = timezone.now()
+                email.attempts += 1
+                email.save(update_fields=["status", "sent_at", "attempts"])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
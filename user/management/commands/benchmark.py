@@ -0,0 +1,232 @@
+import datetime
+import json
+import platform
+import statistics
+import time
+from collections import Counter
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from blood.models import BloodRequest, Donation
+from user.cache import invalidate_user_dashboard, invalidate_user_token
+from user.models import DonorProfile
+from .seed_data import SEED_PASSWORD, SEED_PREFIX, seed_usernames
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(int(len(ordered) * fraction + 0.5) - 1, 0)]
+
+
+def summarize(latencies, elapsed, queries=None):
+    latencies = sorted(latencies)
+    summary = {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.9) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+    if queries is not None:
+        summary["queries"] = {
+            "min": min(queries),
+            "max": max(queries),
+            "mean": round(statistics.fmean(queries), 2),
+        }
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the main endpoints in-process through the full middleware "
+        "stack and report throughput, latency percentiles and query counts "
+        "as JSON. Run seed_data first. Writes are rolled back afterwards. "
+        "With --compare, prints the change against an earlier result."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument(
+            "--login-requests",
+            type=int,
+            default=10,
+            help="Logins are dominated by password hashing; run fewer",
+        )
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--only", nargs="+", metavar="NAME", help="Run only these benchmarks"
+        )
+        parser.add_argument(
+            "--uncached-auth",
+            action="store_true",
+            help="Look the token up on every request, like stock TokenAuthentication",
+        )
+        parser.add_argument("--output", help="Write the JSON result to this file")
+        parser.add_argument("--compare", help="Earlier JSON result to compare with")
+
+    def handle(self, *args, **options):
+        username = seed_usernames(1)[0]
+        try:
+            self.user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError("No seeded data; run manage.py seed_data first.")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Token "
+            + Token.objects.get_or_create(user=self.user)[0].key
+        )
+        benchmarks = self.get_benchmarks()
+        unknown = set(options["only"] or []) - set(benchmarks)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+        results = {}
+        # Every request misses the dashboard cache, like a cold page load,
+        invalidate_user_dashboard(self.user.pk)
+        # and no request is throttled
+        overrides = {"DASHBOARD_CACHE_TIMEOUT": 0, "THROTTLE_RATES": {}}
+        if options["uncached_auth"]:
+            invalidate_user_token(self.user.pk)
+            overrides["TOKEN_AUTH_CACHE_TIMEOUT"] = 0
+        with override_settings(**overrides), transaction.atomic():
+            for name, (method, url_or_factory) in benchmarks.items():
+                if options["only"] and name not in options["only"]:
+                    continue
+                count = options["login_requests" if name == "login" else "requests"]
+                results[name] = self.run(
+                    method, url_or_factory, count, options["warmup"]
+                )
+            # Accepted requests, donations, sessions and tokens are not kept
+            transaction.set_rollback(True)
+
+        report = {"meta": self.get_meta(options), "results": results}
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                self.compare(json.load(file)["results"], results)
+
+    def get_benchmarks(self):
+        """{name: (method, url or callable returning (url, data))}."""
+        top_district = (
+            DonorProfile.objects.values("district")
+            .annotate(donors=Count("pk"))
+            .order_by("-donors")
+            .values_list("district", flat=True)
+            .first()
+        )
+        donors = reverse("donor-list")
+        return {
+            "dashboard": ("get", reverse("user_dashboard")),
+            "donors": ("get", donors),
+            "donors?district": ("get", f"{donors}?district={top_district}"),
+            "donors?blood_group": ("get", f"{donors}?blood_group=O-"),
+            "donors?eligible": ("get", f"{donors}?eligible=true"),
+            "donors?search": ("get", f"{donors}?search={top_district}"),
+            "blood_requests": (
+                "get",
+                reverse("blood_requests-list-list") + "?status=pending",
+            ),
+            "accept": ("post", self.accept_request),
+            "login": ("post", self.login_request),
+        }
+
+    def accept_request(self):
+        requester = (
+            User.objects.filter(username__startswith=SEED_PREFIX)
+            .exclude(pk=self.user.pk)[:1]
+            .get()
+        )
+        blood_request = BloodRequest.objects.create(
+            requester=requester,
+            blood_group="A+",
+            request_date=timezone.localdate(),
+            status="pending",
+        )
+        return (
+            reverse("accept_request", args=[blood_request.pk]),
+            {"donation_date": timezone.localdate().isoformat()},
+        )
+
+    def login_request(self):
+        return (
+            reverse("login"),
+            {"username": self.user.username, "password": SEED_PASSWORD},
+        )
+
+    def run(self, method, url_or_factory, count, warmup):
+        """Time ``count`` requests after ``warmup`` untimed ones."""
+        latencies, queries, statuses = [], [], Counter()
+        elapsed = 0.0
+        for index in range(warmup + count):
+            if callable(url_or_factory):
+                # Building the request (e.g. creating a pending blood request
+                # to accept) is not timed
+                url, data = url_or_factory()
+            else:
+                url, data = url_or_factory, None
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(self.client, method)(url, data)
+                latency = time.perf_counter() - started
+            if index < warmup:
+                continue
+            elapsed += latency
+            latencies.append(latency)
+            queries.append(len(captured))
+            statuses[str(response.status_code)] += 1
+        summary = summarize(latencies, elapsed, queries)
+        summary["status"] = dict(statuses)
+        return summary
+
+    def get_meta(self, options):
+        return {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "requests": options["requests"],
+            "warmup": options["warmup"],
+            "uncached_auth": options["uncached_auth"],
+            "rows": {
+                "users": User.objects.count(),
+                "donors": DonorProfile.objects.count(),
+                "blood_requests": BloodRequest.objects.count(),
+                "donations": Donation.objects.count(),
+            },
+        }
+
+    def compare(self, baseline, results):
+        """Print the relative change of each benchmark present in both runs."""
+        self.stderr.write(
+            f"{'benchmark':<22}{'p50 ms':>18}{'p99 ms':>18}{'rps':>18}{'queries':>10}"
+        )
+        for name, new in results.items():
+            old = baseline.get(name)
+            if old is None:
+                continue
+
+            def change(key):
+                before, after = old[key], new[key]
+                delta = (after - before) / before * 100 if before else 0.0
+                return f"{after:>9} ({delta:+5.1f}%)"
+
+            queries = f"{old['queries']['max']}->{new['queries']['max']}"
+            self.stderr.write(
+                f"{name:<22}{change('p50_ms'):>18}{change('p99_ms'):>18}"
+                f"{change('rps'):>18}{queries:>10}"
+            )
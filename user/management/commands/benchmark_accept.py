@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from blood.models import BloodRequest, Donation
+from blood.views import AcceptRequestAPIView
+from .seed_data import seed_usernames
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure accepts per second with concurrent donors: each thread "
+        "accepting requests of its own (distinct), or every thread racing "
+        "for the same requests (contended), where each request must end up "
+        "with exactly one donation. Meant for Postgres; SQLite serializes "
+        "the writes. Run seed_data first; the requests and donations made "
+        "are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 16])
+        parser.add_argument(
+            "--requests", type=int, default=25, help="Requests per thread"
+        )
+
+    def handle(self, *args, **options):
+        threads = max(options["threads"])
+        users = list(User.objects.filter(username__in=seed_usernames(threads + 1)))
+        if len(users) < threads + 1:
+            raise CommandError("Not enough seeded users; run manage.py seed_data.")
+        self.requester, self.donors = users[0], users[1:]
+        self.view = AcceptRequestAPIView.as_view()
+        self.factory = APIRequestFactory()
+
+        results = {}
+        with override_settings(THROTTLE_RATES={}):
+            for count in options["threads"]:
+                results[f"distinct/{count}"] = self.run(
+                    count, options["requests"], contended=False
+                )
+            results[f"contended/{threads}"] = self.run(
+                threads, options["requests"], contended=True
+            )
+
+        report = {"meta": {"database": connection.vendor}, "results": results}
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, threads, per_thread, contended):
+        # Donations don't point at their request; the new ones are counted
+        last = Donation.objects.order_by("-pk").values_list("pk", flat=True).first()
+        pending = BloodRequest.objects.bulk_create(
+            BloodRequest(
+                requester=self.requester,
+                blood_group="A+",
+                request_date=timezone.localdate(),
+                status="pending",
+            )
+            for _ in range(per_thread if contended else threads * per_thread)
+        )
+        pks = [blood_request.pk for blood_request in pending]
+        if contended:
+            targets = [pks] * threads
+        else:
+            targets = [pks[i::threads] for i in range(threads)]
+
+        statuses = []
+        barrier = threading.Barrier(threads + 1)
+
+        def accept_all(donor, targets):
+            barrier.wait()
+            try:
+                for pk in targets:
+                    statuses.append(self.accept(donor, pk))
+            finally:
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=accept_all, args=(self.donors[i], targets[i]))
+            for i in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        donations = Donation.objects.filter(
+            donor__in=self.donors[:threads], pk__gt=last or 0
+        )
+        result = {
+            "threads": threads,
+            "attempts": len(statuses),
+            "rps": round(len(statuses) / elapsed, 1),
+            "requests": len(pks),
+            "donations": donations.count(),
+            "status": sorted(set(statuses)),
+        }
+        donations.delete()
+        BloodRequest.objects.filter(pk__in=pks).delete()
+        return result
+
+    def accept(self, donor, pk):
+        request = self.factory.post(
+            "/", {"donation_date": timezone.localdate().isoformat()}, format="json"
+        )
+        force_authenticate(request, donor)
+        return self.view(request, request_id=pk).status_code
@@ -0,0 +1,174 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from .benchmark import summarize
+from .seed_data import SEED_PASSWORD, seed_usernames
+
+# Environment each mode runs under (see DATABASES in settings)
+MODES = {
+    "no-reuse": {"DATABASE_CONN_MAX_AGE": "0", "DATABASE_POOL": "0"},
+    "persistent": {"DATABASE_CONN_MAX_AGE": "600", "DATABASE_POOL": "0"},
+    "pool": {"DATABASE_CONN_MAX_AGE": "0", "DATABASE_POOL": "1"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what opening a database connection per request costs the "
+        "login and dashboard endpoints: the WSGI handler (which closes "
+        "connections at the end of each request unless CONN_MAX_AGE keeps "
+        "them) is driven without reuse, with persistent connections and with "
+        "psycopg's pool. Run seed_data first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=MODES, help="Run a single mode")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--login-requests", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=4)
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            self.stdout.write(json.dumps(self.run_mode(options)))
+            return
+
+        rows = {}
+        for mode, variables in MODES.items():
+            if mode == "pool" and not self.pool_available():
+                self.stderr.write("Skipping pool: needs Postgres and psycopg[pool].")
+                continue
+            # The connection settings are read once, at startup
+            output = subprocess.run(
+                [sys.executable, sys.argv[0], "benchmark_connections", "--mode", mode]
+                + [
+                    f"--{name.replace('_', '-')}={options[name]}"
+                    for name in ("requests", "login_requests", "concurrency")
+                ],
+                env=dict(os.environ, **variables),
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            rows[mode] = json.loads(output.splitlines()[-1])
+
+        self.stdout.write(
+            f"{'endpoint':<12}{'mode':<12}{'rps':>9}{'p50 ms':>10}"
+            f"{'p99 ms':>10}{'connects':>10}"
+        )
+        for name in ("connect", "login", "dashboard"):
+            for mode, results in rows.items():
+                row = results[name]
+                self.stdout.write(
+                    f"{name:<12}{mode:<12}{row.get('rps', ''):>9}"
+                    f"{row['p50_ms']:>10}{row['p99_ms']:>10}"
+                    f"{row.get('connections', ''):>10}"
+                )
+
+    def pool_available(self):
+        return connection.vendor == "postgresql" and all(
+            importlib.util.find_spec(name) for name in ("psycopg", "psycopg_pool")
+        )
+
+    def run_mode(self, options):
+        try:
+            user = User.objects.get(username=seed_usernames(1)[0])
+        except User.DoesNotExist:
+            raise CommandError("No seeded data; run manage.py seed_data first.")
+        token = Token.objects.get_or_create(user=user)[0].key
+        # Every request misses the dashboard cache and queries the database,
+        # and no login is throttled
+        settings.DASHBOARD_CACHE_TIMEOUT = 0
+        settings.THROTTLE_RATES = {}
+        connection.close()
+        return {
+            "connect": self.time_connect(),
+            "login": self.run_wsgi(
+                "POST",
+                reverse("login"),
+                {},
+                json.dumps({"username": user.username, "password": SEED_PASSWORD}),
+                options["login_requests"],
+                options["concurrency"],
+            ),
+            "dashboard": self.run_wsgi(
+                "GET",
+                reverse("user_dashboard"),
+                {"HTTP_AUTHORIZATION": f"Token {token}"},
+                "",
+                options["requests"],
+                options["concurrency"],
+            ),
+        }
+
+    def time_connect(self, samples=20):
+        """Latency of opening (and health checking) a fresh connection."""
+        latencies = []
+        for _ in range(samples):
+            connection.close()
+            started = time.perf_counter()
+            connection.ensure_connection()
+            latencies.append(time.perf_counter() - started)
+        connection.close()
+        summary = summarize(latencies, sum(latencies))
+        del summary["rps"]
+        return summary
+
+    def run_wsgi(self, method, path, headers, body, requests, concurrency):
+        application = get_wsgi_application()
+        body = body.encode()
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        def request(_):
+            environ = {
+                "REQUEST_METHOD": method,
+                "PATH_INFO": path,
+                "SERVER_NAME": "testserver",
+                "SERVER_PORT": "80",
+                "CONTENT_TYPE": "application/json",
+                "CONTENT_LENGTH": str(len(body)),
+                "wsgi.url_scheme": "http",
+                "wsgi.input": BytesIO(body),
+                "wsgi.errors": sys.stderr,
+                **headers,
+            }
+            statuses = []
+            started = time.perf_counter()
+            response = application(
+                environ, lambda status, headers: statuses.append(status)
+            )
+            b"".join(response)
+            # Sends request_finished, which closes or keeps the connection
+            response.close()
+            elapsed = time.perf_counter() - started
+            if not statuses[0].startswith("200"):
+                raise CommandError(f"{path} returned {statuses[0]}")
+            return elapsed
+
+        connection_created.connect(count)
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = list(pool.map(request, range(requests)))
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count)
+        summary = summarize(latencies, elapsed)
+        summary["connections"] = len(opened)
+        return summary
@@ -0,0 +1,121 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from blood.models import BloodCompatibility
+from user.geo import distance_km
+from user.models import DonorProfile
+from .benchmark import summarize
+from .seed_data import (
+    BLOOD_GROUP_WEIGHTS,
+    DISTRICT_CENTRES,
+    DISTRICT_WEIGHTS,
+    LOCATION_SPREAD,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time nearest-N compatible donor queries at random points around the "
+        "seeded districts and report latency percentiles as JSON. With "
+        "--scan, also time the same query without the geohash index and "
+        "check both return the same donors. Run seed_data first, e.g. with "
+        "--users=1000000 --donor-ratio=1 for a million donors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--radius", type=float, default=10, help="km")
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scan",
+            action="store_true",
+            help="Compare with sorting every compatible donor by distance",
+        )
+
+    def handle(self, *args, **options):
+        located = DonorProfile.objects.filter(geohash__isnull=False).count()
+        if not located:
+            raise CommandError("No donors with a location; run seed_data first.")
+        points = self.get_points(options["queries"], options["seed"])
+
+        results, answers = {}, {}
+        variants = {"geohash": self.nearest}
+        if options["scan"]:
+            variants["scan"] = self.scan
+        for name, search in variants.items():
+            results[name], answers[name] = self.run(search, points, options)
+        if options["scan"]:
+            results["scan"]["mismatches"] = sum(
+                indexed != scanned
+                for indexed, scanned in zip(answers["geohash"], answers["scan"])
+            )
+
+        report = {
+            "meta": {
+                "database": connection.vendor,
+                "donors": DonorProfile.objects.count(),
+                "located_donors": located,
+                "radius_km": options["radius"],
+                "limit": options["limit"],
+            },
+            "results": results,
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def get_points(self, count, seed):
+        """(latitude, longitude, recipient group) near the seeded districts."""
+        generator = random.Random(seed)
+        districts = generator.choices(
+            list(DISTRICT_WEIGHTS), weights=DISTRICT_WEIGHTS.values(), k=count
+        )
+        groups = generator.choices(
+            list(BLOOD_GROUP_WEIGHTS), weights=BLOOD_GROUP_WEIGHTS.values(), k=count
+        )
+        return [
+            (
+                generator.gauss(DISTRICT_CENTRES[district][0], LOCATION_SPREAD),
+                generator.gauss(DISTRICT_CENTRES[district][1], LOCATION_SPREAD),
+                group,
+            )
+            for district, group in zip(districts, groups)
+        ]
+
+    def candidates(self, group):
+        return DonorProfile.objects.eligible().filter(
+            blood_group__in=BloodCompatibility.objects.filter(
+                recipient_group=group
+            ).values("donor_group")
+        )
+
+    def nearest(self, latitude, longitude, group, options):
+        return self.candidates(group).nearest(
+            latitude, longitude, limit=options["limit"], radius_km=options["radius"]
+        )
+
+    def scan(self, latitude, longitude, group, options):
+        return list(
+            self.candidates(group)
+            .filter(latitude__isnull=False)
+            .annotate(distance_km=distance_km(latitude, longitude))
+            .filter(distance_km__lte=options["radius"])
+            .order_by("distance_km", "id")[: options["limit"]]
+        )
+
+    def run(self, search, points, options):
+        latencies, queries, found, answers = [], [], [], []
+        for latitude, longitude, group in points:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                donors = search(latitude, longitude, group, options)
+                latencies.append(time.perf_counter() - started)
+            queries.append(len(captured))
+            found.append(len(donors))
+            answers.append([donor.pk for donor in donors])
+        summary = summarize(latencies, sum(latencies), queries)
+        summary["mean_found"] = round(sum(found) / len(found), 2)
+        return summary, answers
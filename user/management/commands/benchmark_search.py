@@ -0,0 +1,82 @@
+import json
+import statistics
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+from user.models import DonorProfile
+from user.search import SEARCH_RANK_LIMIT
+from .seed_data import seed_usernames
+
+# A common district, a blood group with one, two rare words, a misspelt
+# district and a word nobody matches
+QUERIES = [
+    "dhaka",
+    "o- dhaka",
+    "faridpur emergency",
+    "chatogram",
+    "nowhere",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the first page of donor searches as the donor count grows. "
+        "With --users, seed_data --clear reseeds each of those user counts "
+        "in turn (replacing seeded rows); without it the data already there "
+        "is measured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, nargs="+", help="Seed and measure these sizes"
+        )
+        parser.add_argument("--queries", nargs="+", default=QUERIES)
+        parser.add_argument(
+            "--repeat", type=int, default=15, help="Median of this many runs"
+        )
+
+    def handle(self, *args, **options):
+        results = []
+        for users in options["users"] or [None]:
+            if users is not None:
+                call_command("seed_data", users=users, clear=True, stdout=StringIO())
+            if connection.vendor in ("postgresql", "sqlite"):
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            results.append(self.measure(options["queries"], options["repeat"]))
+
+        report = {
+            "meta": {"database": connection.vendor, "rank_limit": SEARCH_RANK_LIMIT},
+            "results": results,
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def measure(self, queries, repeat):
+        try:
+            user = User.objects.get(username=seed_usernames(1)[0])
+        except User.DoesNotExist:
+            raise CommandError("No seeded data; run manage.py seed_data first.")
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse("donor-list")
+        timings = {}
+        for text in queries:
+            latencies = []
+            for _ in range(repeat + 1):
+                started = time.perf_counter()
+                response = client.get(url, {"search": text})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f"{text!r}: HTTP {response.status_code}")
+            # The first run warms the caches up
+            timings[text] = {
+                "p50_ms": round(statistics.median(latencies[1:]) * 1000, 1),
+                "rows": len(response.data["results"]),
+            }
+        return {"donors": DonorProfile.objects.count(), "queries": timings}
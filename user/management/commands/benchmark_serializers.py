@@ -0,0 +1,100 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from blood.models import BloodRequest, Donation
+from blood.serializers import BloodRequestSerializer, DonationSerializer
+from rokto_dan.renderers import FastJSONRenderer, orjson
+from rokto_dan.values import ValuesSerializer
+from user.serializers import UserSerializer
+from user.views import DonorViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare list serialization through ModelSerializers and DRF's JSON "
+        "renderer with ValuesSerializer rows and FastJSONRenderer: rows per "
+        "second to fetch, serialize and render a page of each list, and "
+        "whether both render the same bytes. Run seed_data first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Best of this many runs"
+        )
+
+    def handle(self, *args, **options):
+        lists = {
+            "donors": (
+                DonorViewSet.queryset.order_by("id"),
+                DonorViewSet.serializer_class,
+            ),
+            "blood_requests": (
+                BloodRequest.objects.order_by("-request_date", "-id"),
+                BloodRequestSerializer,
+            ),
+            "donations": (
+                Donation.objects.order_by("-donation_date", "-id"),
+                DonationSerializer,
+            ),
+            "users": (
+                User.objects.only(*UserSerializer.Meta.fields).order_by("id"),
+                UserSerializer,
+            ),
+        }
+        if not DonorViewSet.queryset.exists():
+            raise CommandError("No donors; run manage.py seed_data first.")
+
+        results = {}
+        for name, (queryset, serializer_class) in lists.items():
+            queryset = queryset[: options["rows"]]
+            values = ValuesSerializer(serializer_class)
+            serializer, slow = self.best(
+                options["repeat"],
+                lambda: list(queryset.all()),
+                lambda rows: serializer_class(rows, many=True).data,
+                JSONRenderer().render,
+            )
+            fast_timings, fast = self.best(
+                options["repeat"],
+                lambda: list(values.rows(queryset)),
+                values.to_representation,
+                FastJSONRenderer().render,
+            )
+            results[name] = {
+                "rows": serializer.pop("rows"),
+                "serializer": serializer,
+                "values": {key: fast_timings[key] for key in serializer},
+                "same_bytes": fast == slow,
+            }
+
+        report = {
+            "meta": {"database": connection.vendor, "orjson": orjson is not None},
+            "results": results,
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def best(self, repeat, fetch, serialize, render):
+        """Rows per second of each step, the best of ``repeat`` runs."""
+        best = {}
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = fetch()
+            fetched = time.perf_counter()
+            data = serialize(rows)
+            serialized = time.perf_counter()
+            rendered = render(data)
+            finished = time.perf_counter()
+            for step, seconds in [
+                ("fetch", fetched - started),
+                ("serialize", serialized - fetched),
+                ("render", finished - serialized),
+                ("total", finished - started),
+            ]:
+                best[step] = max(best.get(step, 0), round(len(rows) / seconds))
+        best["rows"] = len(rows)
+        return best, rendered
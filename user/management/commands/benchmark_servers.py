@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from .benchmark import summarize
+
+MODES = ("wsgi", "asgi")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare latency (p50/p99), throughput and database connections "
+        "opened per request of the read endpoints served by the WSGI handler "
+        "with sync views and the ASGI handler with the async views, "
+        "in-process and against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=MODES, help="Run a single mode")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--username", required=True, help="User to act as")
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            results = self.run_mode(options)
+            self.stdout.write(json.dumps(results))
+            return
+
+        # Each mode runs in its own process, since ASYNC_VIEWS picks the URLs
+        rows = {}
+        for mode in MODES:
+            env = dict(os.environ, ASYNC_VIEWS="1" if mode == "asgi" else "0")
+            if mode == "asgi" and connection.vendor == "postgresql":
+                # The async views need pooled connections there
+                env["DATABASE_POOL"] = "1"
+            output = subprocess.run(
+                [sys.executable, sys.argv[0], "benchmark_servers", "--mode", mode]
+                + [
+                    f"--{name}={options[name]}"
+                    for name in ("requests", "concurrency", "username")
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            rows[mode] = json.loads(output.splitlines()[-1])
+
+        self.stdout.write(
+            f"{'endpoint':<30}{'mode':<6}{'rps':>9}{'p50 ms':>10}{'p99 ms':>10}"
+            f"{'conns/req':>11}"
+        )
+        for name in rows["wsgi"]:
+            for mode in MODES:
+                row = rows[mode][name]
+                self.stdout.write(
+                    f"{name:<30}{mode:<6}{row['rps']:>9}"
+                    f"{row['p50_ms']:>10}{row['p99_ms']:>10}"
+                    f"{row['connections']:>11}"
+                )
+
+    def get_paths(self, user):
+        return {
+            "dashboard": reverse("user_dashboard"),
+            "donors": reverse("donor-list"),
+            "donors?district": reverse("donor-list") + "?district=dhaka",
+            "profile": reverse("user_profile", args=[user.pk]),
+        }
+
+    def run_mode(self, options):
+        if settings.ASYNC_VIEWS != (options["mode"] == "asgi"):
+            raise CommandError("Set ASYNC_VIEWS=1 for asgi and 0 for wsgi.")
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        token, _ = Token.objects.get_or_create(user=user)
+        # Every request misses the dashboard cache, like a cold page load
+        settings.DASHBOARD_CACHE_TIMEOUT = 0
+
+        run = self.run_wsgi if options["mode"] == "wsgi" else self.run_asgi
+        connection_created.connect(self.count_connection)
+        results = {}
+        for name, path in self.get_paths(user).items():
+            opened = self.opened_connections()
+            results[name] = run(
+                path, token.key, options["requests"], options["concurrency"]
+            )
+            results[name]["connections"] = round(
+                (self.opened_connections() - opened) / options["requests"], 2
+            )
+        return results
+
+    connects = 0
+
+    def count_connection(self, sender, connection, **kwargs):
+        # Pooled connections are counted by their pool, which reuses them
+        if "pool" not in connection.settings_dict.get("OPTIONS", {}):
+            self.connects += 1
+
+    def opened_connections(self):
+        """Database connections opened so far, by Django or by the pools."""
+        opened = self.connects
+        for alias in connections:
+            if "pool" in connections[alias].settings_dict.get("OPTIONS", {}):
+                opened += connections[alias].pool.get_stats()["connections_num"]
+        return opened
+
+    def run_wsgi(self, path, token, requests, concurrency):
+        application = get_wsgi_application()
+        url = urlsplit(path)
+
+        def request(_):
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": url.path,
+                "QUERY_STRING": url.query,
+                "SERVER_NAME": "testserver",
+                "SERVER_PORT": "80",
+                "HTTP_AUTHORIZATION": f"Token {token}",
+                "wsgi.url_scheme": "http",
+                "wsgi.input": BytesIO(),
+                "wsgi.errors": sys.stderr,
+            }
+            statuses = []
+            started = time.perf_counter()
+            body = application(environ, lambda status, headers: statuses.append(status))
+            b"".join(body)
+            body.close()
+            elapsed = time.perf_counter() - started
+            if not statuses[0].startswith("200"):
+                raise CommandError(f"{path} returned {statuses[0]}")
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(request, range(requests)))
+        return summarize(latencies, time.perf_counter() - started)
+
+    def run_asgi(self, path, token, requests, concurrency):
+        return asyncio.run(self._run_asgi(path, token, requests, concurrency))
+
+    async def _run_asgi(self, path, token, requests, concurrency):
+        application = get_asgi_application()
+        url = urlsplit(path)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": url.path,
+            "query_string": url.query.encode(),
+            "headers": [
+                (b"host", b"testserver"),
+                (b"authorization", f"Token {token}".encode()),
+            ],
+            "server": ("testserver", 80),
+        }
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request():
+            messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The client never disconnects; Django stops listening when
+                # the response is sent
+                await asyncio.Future()
+
+            statuses = []
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(dict(scope), receive, send)
+                elapsed = time.perf_counter() - started
+            if statuses[0] != 200:
+                raise CommandError(f"{path} returned {statuses[0]}")
+            return elapsed
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(request() for _ in range(requests)))
+        return summarize(latencies, time.perf_counter() - started)
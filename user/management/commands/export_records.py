@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from blood.bulk import DONATION_EXPORT_FIELDS
+from blood.models import Donation
+from rokto_dan.bulk import CSV, JSONL, stream_rows
+from user.bulk import DONOR_EXPORT_FIELDS
+from user.models import DonorProfile
+
+
+class Command(BaseCommand):
+    help = "Stream donor profiles or donations to stdout as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=["donations", "donors"])
+        parser.add_argument("--type", choices=[CSV, JSONL], default=CSV)
+        parser.add_argument("--district", help="Only export donors of a district")
+
+    def handle(self, *args, **options):
+        if options["model"] == "donors":
+            queryset, fields = DonorProfile.objects.all(), DONOR_EXPORT_FIELDS
+            if options["district"]:
+                queryset = queryset.filter(district__upper=options["district"].upper())
+        else:
+            queryset, fields = Donation.objects.all(), DONATION_EXPORT_FIELDS
+
+        for line in stream_rows(queryset.order_by("pk"), fields, options["type"]):
+            self.stdout.write(line, ending="")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from blood.bulk import DonationImporter
+from rokto_dan.bulk import detect_format, read_rows
+from user.bulk import DonorImporter
+
+IMPORTERS = {"donors": DonorImporter, "donations": DonationImporter}
+
+
+class Command(BaseCommand):
+    help = "Bulk import donor profiles or donations from CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(IMPORTERS))
+        parser.add_argument("path", help="A .csv, .jsonl or .ndjson file")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options["model"]](chunk_size=options["chunk_size"])
+        with open(options["path"], "rb") as stream:
+            result = importer.run(
+                read_rows(stream, detect_format(name=options["path"]))
+            )
+
+        for error in result["errors"]:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            f"Imported {result['imported']} {options['model']}, "
+            f"{len(result['errors'])} rows rejected"
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from user.models import DonorProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every donor's last_donation_date and eligible_from from "
+        "date_of_donation and the recorded donations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        changed = DonorProfile.objects.rebuild_eligibility(options["batch_size"])
+        self.stdout.write(f"Repaired {changed} donor profiles")
@@ -0,0 +1,255 @@
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from blood.models import BloodRequest, Donation
+from blood.stats import rebuild_rollups
+from user.constants import DONATION_COOLDOWN_DAYS, GENDER_TYPE
+from user.geo import geohash
+from user.models import DonorProfile, UserProfile
+
+# Seeded users are named f"{SEED_PREFIX}{index:06d}" and share one password,
+# so benchmarks can log in as any of them
+SEED_PREFIX = "seed-"
+SEED_PASSWORD = "seed-password"
+
+# Approximate ABO/Rh distribution of Bangladesh, in percent
+BLOOD_GROUP_WEIGHTS = {
+    "B+": 32.0,
+    "O+": 30.0,
+    "A+": 24.0,
+    "AB+": 9.0,
+    "O-": 1.5,
+    "B-": 1.5,
+    "A-": 1.5,
+    "AB-": 0.5,
+}
+
+# Districts roughly weighted by population, so a few are large and most small
+DISTRICT_WEIGHTS = {
+    "Dhaka": 25,
+    "Chattogram": 12,
+    "Gazipur": 6,
+    "Narayanganj": 5,
+    "Cumilla": 5,
+    "Mymensingh": 5,
+    "Sylhet": 4,
+    "Rajshahi": 4,
+    "Khulna": 4,
+    "Bogura": 3,
+    "Rangpur": 3,
+    "Barishal": 3,
+    "Jessore": 2,
+    "Cox's Bazar": 2,
+    "Dinajpur": 2,
+    "Tangail": 2,
+    "Noakhali": 2,
+    "Faridpur": 1,
+    "Pabna": 1,
+    "Kushtia": 1,
+}
+
+# Approximate district centres; people are scattered around them
+DISTRICT_CENTRES = {
+    "Dhaka": (23.8103, 90.4125),
+    "Chattogram": (22.3569, 91.7832),
+    "Gazipur": (23.9999, 90.4203),
+    "Narayanganj": (23.6238, 90.5000),
+    "Cumilla": (23.4607, 91.1809),
+    "Mymensingh": (24.7471, 90.4203),
+    "Sylhet": (24.8949, 91.8687),
+    "Rajshahi": (24.3745, 88.6042),
+    "Khulna": (22.8456, 89.5403),
+    "Bogura": (24.8465, 89.3773),
+    "Rangpur": (25.7439, 89.2752),
+    "Barishal": (22.7010, 90.3535),
+    "Jessore": (23.1664, 89.2081),
+    "Cox's Bazar": (21.4272, 92.0058),
+    "Dinajpur": (25.6217, 88.6354),
+    "Tangail": (24.2513, 89.9167),
+    "Noakhali": (22.8696, 91.0995),
+    "Faridpur": (23.6071, 89.8429),
+    "Pabna": (24.0064, 89.2372),
+    "Kushtia": (23.9013, 89.1204),
+}
+# Degrees of scatter around the centre (about 9 km), and the share of donors
+# and requests that give a location at all
+LOCATION_SPREAD = 0.08
+LOCATION_RATIO = 0.9
+
+DONOR_TYPES = {"regular": 70, "occasional": 25, "emergency": 5}
+REQUEST_STATUSES = {"fulfilled": 70, "pending": 20, "canceled": 10}
+# How many requests a user has made, and donations a donor has recorded
+REQUEST_COUNTS = {0: 70, 1: 20, 2: 7, 3: 3}
+DONATION_COUNTS = {0: 40, 1: 25, 2: 15, 3: 10, 4: 6, 5: 4}
+
+
+def seed_usernames(count):
+    return [f"{SEED_PREFIX}{index:06d}" for index in range(count)]
+
+
+class Generator:
+    """Draws every value from one seeded random.Random, in a fixed order."""
+
+    def __init__(self, seed, today):
+        self.random = random.Random(seed)
+        self.today = today
+
+    def pick(self, weights):
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def days_ago(self, low, high):
+        return self.today - datetime.timedelta(days=self.random.randint(low, high))
+
+    def mobile_number(self):
+        return "01" + "".join(str(self.random.randint(0, 9)) for _ in range(9))
+
+    def location(self, district):
+        """(latitude, longitude) near the district's centre, or (None, None)."""
+        if self.random.random() >= LOCATION_RATIO:
+            return None, None
+        latitude, longitude = DISTRICT_CENTRES[district]
+        return (
+            round(self.random.gauss(latitude, LOCATION_SPREAD), 6),
+            round(self.random.gauss(longitude, LOCATION_SPREAD), 6),
+        )
+
+    def donation_dates(self):
+        """Most recent first, at least the cooldown apart."""
+        dates, day = [], self.days_ago(0, 200)
+        for _ in range(self.pick(DONATION_COUNTS)):
+            dates.append(day)
+            gap = self.random.randint(DONATION_COOLDOWN_DAYS, 400)
+            day -= datetime.timedelta(days=gap)
+        return dates
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a deterministic synthetic dataset: users with profiles, "
+        "donors, blood requests and donations with realistic blood group and "
+        "district distributions. The same --seed and --today give the same "
+        "rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--donor-ratio",
+            type=float,
+            default=0.6,
+            help="Share of users with a donor profile",
+        )
+        parser.add_argument(
+            "--today",
+            type=datetime.date.fromisoformat,
+            help="Date the generated history ends on (default: today)",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete previously seeded users and their rows first",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        generator = Generator(options["seed"], options["today"] or timezone.localdate())
+        batch_size = options["batch_size"]
+        usernames = seed_usernames(options["users"])
+
+        with transaction.atomic():
+            seeded = User.objects.filter(username__startswith=SEED_PREFIX)
+            if options["clear"]:
+                seeded.delete()
+            elif seeded.exists():
+                raise CommandError("Seeded users already exist; pass --clear.")
+            # Hashing once keeps seeding fast; every user gets the same hash
+            password = make_password(SEED_PASSWORD)
+            users = User.objects.bulk_create(
+                (
+                    User(
+                        username=username,
+                        email=f"{username}@example.com",
+                        first_name="Seed",
+                        last_name=username.removeprefix(SEED_PREFIX),
+                        password=password,
+                    )
+                    for username in usernames
+                ),
+                batch_size=batch_size,
+            )
+
+            profiles, donors, requests, donations = [], [], [], []
+            for user in users:
+                blood_group = generator.pick(BLOOD_GROUP_WEIGHTS)
+                district = generator.pick(DISTRICT_WEIGHTS)
+                profiles.append(
+                    UserProfile(
+                        user=user,
+                        mobile_number=generator.mobile_number(),
+                        blood_group=blood_group,
+                        gender=generator.random.choice(GENDER_TYPE)[0],
+                    )
+                )
+                if generator.random.random() < options["donor_ratio"]:
+                    dates = generator.donation_dates()
+                    latitude, longitude = generator.location(district)
+                    donors.append(
+                        DonorProfile(
+                            user=user,
+                            blood_group=blood_group,
+                            district=district,
+                            donor_type=generator.pick(DONOR_TYPES),
+                            is_available=generator.random.random() < 0.8,
+                            # Some donors report their last donation by hand
+                            date_of_donation=(
+                                dates[0]
+                                if dates and generator.random.random() < 0.3
+                                else None
+                            ),
+                            latitude=latitude,
+                            longitude=longitude,
+                            geohash=geohash(latitude, longitude),
+                        )
+                    )
+                    donations.extend(
+                        Donation(donor=user, blood_group=blood_group, donation_date=day)
+                        for day in dates
+                    )
+                for _ in range(generator.pick(REQUEST_COUNTS)):
+                    latitude, longitude = generator.location(district)
+                    requests.append(
+                        BloodRequest(
+                            requester=user,
+                            # Patients mostly need the common groups too
+                            blood_group=generator.pick(BLOOD_GROUP_WEIGHTS),
+                            district=district,
+                            request_date=generator.days_ago(0, 365),
+                            status=generator.pick(REQUEST_STATUSES),
+                            latitude=latitude,
+                            longitude=longitude,
+                        )
+                    )
+
+            UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+            DonorProfile.objects.bulk_create(donors, batch_size=batch_size)
+            BloodRequest.objects.bulk_create(requests, batch_size=batch_size)
+            Donation.objects.bulk_create(donations, batch_size=batch_size)
+
+            # bulk_create bypasses save() and the signals that keep these
+            # denormalized columns and rollups current (geohash is set above)
+            DonorProfile.objects.filter(
+                user__username__startswith=SEED_PREFIX
+            ).rebuild_eligibility(batch_size=batch_size)
+            rebuild_rollups()
+
+        self.stdout.write(
+            f"Seeded {len(users)} users, {len(donors)} donors, "
+            f"{len(requests)} blood requests and {len(donations)} donations "
+            f"(password {SEED_PASSWORD!r})."
+        )
@@ -0,0 +1,110 @@
+import asyncio
+import datetime
+import time
+import tracemalloc
+
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from blood.events import get_backend
+from blood.models import BloodRequest
+from user.constants import BLOOD_GROUP
+from user.models import DonorProfile
+
+USERNAME_PREFIX = "stream-loadtest-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many idle blood request streams open in this process, publish "
+        "one request that matches all of them and report connection memory "
+        "and fan-out latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=5000)
+        parser.add_argument("--district", default="Dhaka")
+
+    def handle(self, *args, **options):
+        tokens = self.create_donors(options["district"])
+        try:
+            asyncio.run(self.run(tokens, options["connections"], options["district"]))
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def create_donors(self, district):
+        """One donor per blood group; connections are spread over them."""
+        tokens = []
+        with transaction.atomic():
+            for code, _ in BLOOD_GROUP:
+                user = User.objects.create_user(f"{USERNAME_PREFIX}{code}")
+                DonorProfile.objects.create(
+                    user=user, blood_group=code, district=district, donor_type="test"
+                )
+                tokens.append(Token.objects.create(user=user).key)
+        return tokens
+
+    async def open_stream(self, application, token):
+        communicator = ApplicationCommunicator(
+            application,
+            {
+                "type": "http",
+                "method": "GET",
+                "path": reverse("blood_request_stream"),
+                "query_string": b"",
+                "headers": [(b"authorization", f"Token {token}".encode())],
+            },
+        )
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(timeout=30)
+        if start["status"] != 200:
+            raise RuntimeError(f"Stream returned {start['status']}")
+        await communicator.receive_output(timeout=30)  # retry: frame
+        return communicator
+
+    async def run(self, tokens, connections, district):
+        application = get_asgi_application()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        communicators = []
+        for index in range(connections):
+            communicators.append(
+                await self.open_stream(application, tokens[index % len(tokens)])
+            )
+        opened = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        self.stdout.write(
+            f"Opened {connections} streams in {opened:.2f}s, "
+            f"{memory / connections / 1024:.1f} KiB per connection, "
+            f"{get_backend().count()} subscribed"
+        )
+
+        requester = await User.objects.acreate(username=f"{USERNAME_PREFIX}requester")
+        started = time.perf_counter()
+        # AB+ can receive from every group, so the request reaches everyone.
+        # Saving it publishes the event through the post_save receiver.
+        await BloodRequest.objects.acreate(
+            requester=requester,
+            blood_group="AB+",
+            district=district,
+            request_date=datetime.date.today(),
+            status="pending",
+        )
+        await asyncio.gather(
+            *(communicator.receive_output(timeout=30) for communicator in communicators)
+        )
+        delivered = time.perf_counter() - started
+        self.stdout.write(
+            f"Delivered to {connections} streams in {delivered * 1000:.1f}ms"
+        )
+
+        for communicator in communicators:
+            await communicator.send_input({"type": "http.disconnect"})
+        await asyncio.gather(*(communicator.wait(30) for communicator in communicators))
+        self.stdout.write(f"{get_backend().count()} subscribed after disconnect")
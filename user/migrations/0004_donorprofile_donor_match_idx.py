@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_userprofile_gender'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(fields=['blood_group', 'is_available', 'date_of_donation'], name='donor_match_idx'),
+        ),
+    ]
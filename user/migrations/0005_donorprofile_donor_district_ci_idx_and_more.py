@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:29
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_donorprofile_donor_match_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(django.db.models.functions.text.Upper('district'), models.F('blood_group'), models.F('is_available'), name='donor_district_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(django.db.models.functions.text.Upper('donor_type'), name='donor_type_ci_idx'),
+        ),
+    ]
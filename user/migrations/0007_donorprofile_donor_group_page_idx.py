@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0006_outgoingemail"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="donorprofile",
+            index=models.Index(
+                fields=["blood_group", "id"], name="donor_group_page_idx"
+            ),
+        ),
+    ]
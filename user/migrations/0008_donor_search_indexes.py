@@ -0,0 +1,62 @@
+from django.db import migrations
+from ._sqlite_fts import SQLITE_BACKWARD, SQLITE_FORWARD
+
+
+def postgres_indexes():
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models.functions import Upper
+
+    # The vector expression must stay identical to user.search.search_vector()
+    return [
+        GinIndex(
+            SearchVector("district", "donor_type", config="simple"),
+            name="donor_search_vector_idx",
+        ),
+        GinIndex(
+            OpClass(Upper("district"), name="gin_trgm_ops"),
+            name="donor_district_trgm_idx",
+        ),
+    ]
+
+
+def pg_trgm_available(cursor):
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    return cursor.fetchone() is not None
+
+
+def forward(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        model = apps.get_model("user", "DonorProfile")
+        vector_index, trigram_index = postgres_indexes()
+        schema_editor.add_index(model, vector_index)
+        with schema_editor.connection.cursor() as cursor:
+            # Fuzzy district matching is skipped where pg_trgm is unavailable
+            if pg_trgm_available(cursor):
+                schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                schema_editor.add_index(model, trigram_index)
+
+
+def backward(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        for index in postgres_indexes():
+            schema_editor.execute(f"DROP INDEX IF EXISTS {index.name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0007_donorprofile_donor_group_page_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
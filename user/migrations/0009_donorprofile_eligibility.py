@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:59
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+from ._sqlite_fts import sqlite_fts_operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0008_donor_search_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Adding eligible_from rebuilds user_donorprofile on SQLite
+    operations = sqlite_fts_operations(
+        migrations.RemoveIndex(
+            model_name="donorprofile",
+            name="donor_match_idx",
+        ),
+        migrations.AddField(
+            model_name="donorprofile",
+            name="eligible_from",
+            field=models.DateField(default=datetime.date(1, 1, 1), editable=False),
+        ),
+        migrations.AddField(
+            model_name="donorprofile",
+            name="last_donation_date",
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="donorprofile",
+            index=models.Index(
+                fields=["blood_group", "is_available", "eligible_from"],
+                name="donor_match_idx",
+            ),
+        ),
+    )
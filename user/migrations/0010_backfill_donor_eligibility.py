@@ -0,0 +1,46 @@
+import datetime
+
+from django.db import migrations
+from django.db.models import Max
+
+# Frozen copy of user.constants.DONATION_COOLDOWN_DAYS at the time of writing
+DONATION_COOLDOWN_DAYS = 90
+
+
+def backfill(apps, schema_editor):
+    DonorProfile = apps.get_model("user", "DonorProfile")
+    rows = (
+        DonorProfile.objects.annotate(recorded=Max("user__donations__donation_date"))
+        .order_by("pk")
+        .values_list("pk", "date_of_donation", "recorded")
+    )
+    last_pk = 0
+    while batch := list(rows.filter(pk__gt=last_pk)[:1000]):
+        profiles = []
+        for pk, reported, recorded in batch:
+            latest = max(filter(None, [reported, recorded]), default=None)
+            if latest is not None:
+                profiles.append(
+                    DonorProfile(
+                        pk=pk,
+                        last_donation_date=latest,
+                        eligible_from=latest
+                        + datetime.timedelta(days=DONATION_COOLDOWN_DAYS),
+                    )
+                )
+        DonorProfile.objects.bulk_update(
+            profiles, ["last_donation_date", "eligible_from"]
+        )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0009_donorprofile_eligibility"),
+        ("blood", "0005_bloodrequest_request_status_group_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:10
+
+import django.utils.timezone
+from django.db import migrations, models
+from ._sqlite_fts import sqlite_fts_operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0010_backfill_donor_eligibility"),
+    ]
+
+    # Adding updated_at rebuilds user_donorprofile on SQLite
+    operations = sqlite_fts_operations(
+        migrations.AddField(
+            model_name="donorprofile",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    )
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import IntegrityError, migrations
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+# Registration checks ``email__upper``; this index makes that check a seek and
+# closes the race between the check and the INSERT. Users without an email
+# (blank is allowed on auth.User) are left out; the predicate is spelled the
+# way the ORM renders ~Q(email=""), so SQLite can match it to the query.
+CREATE_INDEX = """
+    CREATE UNIQUE INDEX user_email_ci_unique ON auth_user (UPPER(email))
+    WHERE NOT (email = '')
+"""
+DROP_INDEX = "DROP INDEX user_email_ci_unique"
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Registration used to compare emails case-sensitively, so a database may
+    hold addresses that differ only by case. Name them rather than let the
+    index fail on the first one; which account keeps an address is for an
+    admin to decide.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    duplicates = (
+        User.objects.exclude(email="")
+        .values(normalized=Upper("email"))
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+        .values_list("normalized", flat=True)
+    )
+    users = (
+        User.objects.annotate(normalized=Upper("email"))
+        .filter(normalized__in=list(duplicates))
+        .order_by("normalized", "pk")
+        .values_list("pk", "username", "email")
+    )
+    if users:
+        listed = "\n".join(
+            f"  id={pk} username={username!r} email={email!r}"
+            for pk, username, email in users
+        )
+        raise IntegrityError(
+            "Users share an email address up to case; change or clear the "
+            f"emails of all but one of each, then migrate again:\n{listed}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0011_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
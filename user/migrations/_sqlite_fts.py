@@ -0,0 +1,80 @@
+"""
+SQLite FTS5 index over donor district/donor_type (see user.search).
+
+The triggers live on user_donorprofile. SQLite schema changes that Django
+implements by rebuilding the table (most AddField/AlterField operations)
+drop them, so migrations that alter DonorProfile must end with
+``restore_sqlite_fts_triggers``; use ``sqlite_fts_operations()`` around the
+schema operations to cover both directions.
+"""
+
+from django.db import migrations
+
+SQLITE_FTS_TABLE = "user_donorprofile_fts"
+
+# External-content FTS5 table over district/donor_type, kept in sync by
+# triggers. The trigram tokenizer gives case-insensitive substring matching.
+SQLITE_CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5(
+        district, donor_type,
+        content='user_donorprofile', content_rowid='id', tokenize='trigram'
+    )
+"""
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER user_donorprofile_fts_insert AFTER INSERT ON user_donorprofile
+    BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, district, donor_type)
+        VALUES (new.id, new.district, new.donor_type);
+    END
+    """,
+    f"""
+    CREATE TRIGGER user_donorprofile_fts_delete AFTER DELETE ON user_donorprofile
+    BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, district, donor_type)
+        VALUES ('delete', old.id, old.district, old.donor_type);
+    END
+    """,
+    f"""
+    CREATE TRIGGER user_donorprofile_fts_update
+    AFTER UPDATE OF district, donor_type ON user_donorprofile
+    BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, district, donor_type)
+        VALUES ('delete', old.id, old.district, old.donor_type);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, district, donor_type)
+        VALUES (new.id, new.district, new.donor_type);
+    END
+    """,
+]
+
+SQLITE_REBUILD = (
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"
+)
+
+SQLITE_FORWARD = [SQLITE_CREATE_TABLE, *SQLITE_TRIGGERS, SQLITE_REBUILD]
+
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS user_donorprofile_fts_insert",
+    "DROP TRIGGER IF EXISTS user_donorprofile_fts_delete",
+    "DROP TRIGGER IF EXISTS user_donorprofile_fts_update",
+]
+
+SQLITE_BACKWARD = [*SQLITE_DROP_TRIGGERS, f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}"]
+
+
+def restore_sqlite_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in [*SQLITE_DROP_TRIGGERS, *SQLITE_TRIGGERS, SQLITE_REBUILD]:
+        schema_editor.execute(statement)
+
+
+def sqlite_fts_operations(*operations):
+    """``operations`` plus trigger restores that run after applying and after
+    unapplying them."""
+    return [
+        migrations.RunPython(migrations.RunPython.noop, restore_sqlite_fts_triggers),
+        *operations,
+        migrations.RunPython(restore_sqlite_fts_triggers, migrations.RunPython.noop),
+    ]
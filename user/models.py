@@ -1,7 +1,17 @@
+import datetime
+
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import DEFERRED
+from django.db.models import Case, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .constants import BLOOD_GROUP, GENDER_TYPE
-from django.db.models.signals import post_save
+from .constants import BLOOD_GROUP, DONATION_COOLDOWN_DAYS, GENDER_TYPE
+from .geo import covering_ranges, distance_km, geohash
+from django.db.models.signals import post_delete, post_init, post_save
+from rest_framework.authtoken.models import Token
+from .cache import invalidate_token
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 
@@ -13,20 +23,173 @@ class UserProfile(models.Model):
     mobile_number = models.CharField(max_length=12)
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP)
     gender = models.CharField(max_length=10, choices=GENDER_TYPE, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username} Profile"
 
-    # Signal to create UserProfile whenever a new User is created
+    # Signal to create UserProfile whenever a new User is created, with the
+    # fields registration collected (see RegistrationSerializer.create)
     @receiver(post_save, sender=User)
     def create_user_profile(sender, instance, created, **kwargs):
         if created:
-            UserProfile.objects.create(user=instance)
+            UserProfile.objects.create(
+                user=instance, **getattr(instance, "_profile_fields", {})
+            )
 
-    # Signal to save the UserProfile whenever a User is saved
-    @receiver(post_save, sender=User)
-    def save_user_profile(sender, instance, **kwargs):
-        instance.user_profile.save()
+
+# eligible_from of donors with no known donation, so that "can give today"
+# is always the plain range predicate eligible_from <= today
+NEVER_DONATED = datetime.date.min
+
+
+def eligible_from(last_donation_date):
+    """First day a donor who last gave on ``last_donation_date`` may give again."""
+    if last_donation_date is None:
+        return NEVER_DONATED
+    return last_donation_date + datetime.timedelta(days=DONATION_COOLDOWN_DAYS)
+
+
+def latest_donation_dates(user):
+    """
+    ``recorded``/``archived``: subqueries for the latest donation date of
+    ``user`` (e.g. an OuterRef) among the recorded and the archived donations.
+    Each is one index lookup, where a Max over both relations would join them
+    into a row for every pair of the user's donations.
+    """
+    return {
+        name: Subquery(
+            User._meta.get_field(relation)
+            .related_model.objects.filter(donor=user)
+            .order_by("-donation_date")
+            .values("donation_date")[:1]
+        )
+        for name, relation in [
+            ("recorded", "donations"),
+            ("archived", "archived_donations"),
+        ]
+    }
+
+
+# Radius the nearest-donor search starts with, and the largest it may grow to
+NEAREST_START_KM = 2
+NEAREST_MAX_KM = 100
+
+
+class DonorProfileQuerySet(models.QuerySet):
+    def eligible(self, today=None):
+        """Available donors whose cooldown has ended (uses donor_match_idx)."""
+        return self.filter(
+            is_available=True, eligible_from__lte=today or timezone.localdate()
+        )
+
+    def ineligible(self, today=None):
+        return self.exclude(
+            is_available=True, eligible_from__lte=today or timezone.localdate()
+        )
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Donors within ``radius_km`` of the point, annotated with distance_km.
+        The geohash ranges covering the circle are read through donor_geo_idx
+        and the distance drops the corners.
+        """
+        cells = Q()
+        for low, high in covering_ranges(latitude, longitude, radius_km):
+            cells |= Q(geohash__gte=low, geohash__lt=high)
+        return (
+            self.filter(cells)
+            .annotate(distance_km=distance_km(latitude, longitude))
+            .filter(distance_km__lte=radius_km)
+        )
+
+    def nearest(self, latitude, longitude, limit=10, radius_km=NEAREST_MAX_KM):
+        """
+        The ``limit`` donors closest to the point and at most ``radius_km``
+        away, nearest first. The search starts at NEAREST_START_KM and widens
+        fourfold until it holds ``limit`` donors, so in a dense area only the
+        first few cells are read.
+        """
+        search_km = min(NEAREST_START_KM, radius_km)
+        while True:
+            donors = list(
+                self.within(latitude, longitude, search_km).order_by(
+                    "distance_km", "id"
+                )[:limit]
+            )
+            # Every donor closer than search_km was considered
+            if len(donors) == limit or search_km >= radius_km:
+                return donors
+            search_km = min(search_km * 4, radius_km)
+
+    def record_donations(self, dates):
+        """
+        Fold ``{user_id: donation_date}`` into last_donation_date/eligible_from
+        with a single UPDATE. Rows that already have a later date are left
+        alone, so concurrent or out-of-order donations never move it back.
+        """
+        if not dates:
+            return 0
+        newer = Q()
+        for user_id, date in dates.items():
+            newer |= Q(user_id=user_id) & (
+                Q(last_donation_date__isnull=True) | Q(last_donation_date__lt=date)
+            )
+        return self.filter(newer).update(
+            updated_at=timezone.now(),
+            last_donation_date=Case(
+                *(
+                    When(user_id=user_id, then=Value(date))
+                    for user_id, date in dates.items()
+                )
+            ),
+            eligible_from=Case(
+                *(
+                    When(user_id=user_id, then=Value(eligible_from(date)))
+                    for user_id, date in dates.items()
+                )
+            ),
+        )
+
+    def rebuild_eligibility(self, batch_size=1000):
+        """
+        Recompute last_donation_date/eligible_from from date_of_donation and
+        the recorded donations, archived ones included, in keyset batches of
+        one grouped query and one bulk_update each. Returns the number of
+        profiles that changed.
+        """
+        rows = (
+            self.annotate(**latest_donation_dates(OuterRef("user_id")))
+            .order_by("pk")
+            .values_list(
+                "pk",
+                "date_of_donation",
+                "recorded",
+                "archived",
+                "last_donation_date",
+                "eligible_from",
+            )
+        )
+        changed, last_pk = 0, 0
+        while batch := list(rows.filter(pk__gt=last_pk)[:batch_size]):
+            stale, now = [], timezone.now()
+            for pk, reported, recorded, archived, last_date, eligible in batch:
+                latest = max(filter(None, [reported, recorded, archived]), default=None)
+                if (latest, eligible_from(latest)) != (last_date, eligible):
+                    stale.append(
+                        self.model(
+                            pk=pk,
+                            last_donation_date=latest,
+                            eligible_from=eligible_from(latest),
+                            updated_at=now,
+                        )
+                    )
+            self.model.objects.bulk_update(
+                stale, ["last_donation_date", "eligible_from", "updated_at"]
+            )
+            changed += len(stale)
+            last_pk = batch[-1][0]
+        return changed
 
 
 class DonorProfile(models.Model):
@@ -40,6 +203,157 @@ class DonorProfile(models.Model):
         max_length=50
     )  # Example: 'regular', 'emergency', etc.
     is_available = models.BooleanField(default=True)  # Ensure this field is defined
+    # Latest of date_of_donation and the user's recorded donations, and the
+    # day the cooldown after it ends. Kept current by save() and the Donation
+    # signals; ``manage.py rebuild_eligibility`` repairs them.
+    last_donation_date = models.DateField(null=True, blank=True, editable=False)
+    eligible_from = models.DateField(default=NEVER_DONATED, editable=False)
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
+    # user.geo.geohash of latitude/longitude, kept current by save()
+    geohash = models.BigIntegerField(null=True, blank=True, editable=False)
+    # Validator for conditional GETs; .update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DonorProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Donor matching: compatible group, available, out of cooldown
+            models.Index(
+                fields=["blood_group", "is_available", "eligible_from"],
+                name="donor_match_idx",
+            ),
+            # ?blood_group= listings, already in keyset (id) order
+            models.Index(fields=["blood_group", "id"], name="donor_group_page_idx"),
+            # DonorProfileFilter compares UPPER(district)/UPPER(donor_type)
+            models.Index(
+                Upper("district"),
+                "blood_group",
+                "is_available",
+                name="donor_district_ci_idx",
+            ),
+            models.Index(Upper("donor_type"), name="donor_type_ci_idx"),
+            # Proximity search: geohash ranges, then match filters in the index
+            models.Index(
+                fields=["geohash", "blood_group", "is_available", "eligible_from"],
+                name="donor_geo_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.blood_group}"
+
+    def save(self, *args, **kwargs):
+        reported = self.__dict__.get("date_of_donation", DEFERRED)
+        if self._state.adding or reported != self._reported_donation:
+            # A corrected or cleared date_of_donation may have been the
+            # latest, so start over from it and the user's donations, as
+            # rebuild_eligibility does (for a new profile: the donations
+            # recorded before the user became a donor)
+            latest = [self.date_of_donation]
+            latest += (
+                User.objects.filter(pk=self.user_id)
+                .annotate(**latest_donation_dates(OuterRef("pk")))
+                .values_list("recorded", "archived")
+                .first()
+                or []
+            )
+        else:
+            latest = [self.last_donation_date, self.date_of_donation]
+        latest = max(filter(None, latest), default=None)
+        changed = {"updated_at"}
+        if latest != self.last_donation_date:
+            self.last_donation_date = latest
+            self.eligible_from = eligible_from(latest)
+            changed |= {"last_donation_date", "eligible_from"}
+        position = geohash(self.latitude, self.longitude)
+        if position != self.geohash:
+            self.geohash = position
+            changed.add("geohash")
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, *changed}
+        super().save(*args, **kwargs)
+        self._reported_donation = self.date_of_donation
+
+
+@receiver(post_init, sender=DonorProfile)
+def remember_reported_donation(sender, instance, **kwargs):
+    instance._reported_donation = instance.__dict__.get("date_of_donation", DEFERRED)
+
+
+# Profiles render the user's username (and donors the email), so a change to
+# either must move their updated_at (and so their ETags). Other User saves,
+# such as login updating last_login, write nothing to the profile tables.
+PROFILE_USER_FIELDS = ("username", "email")
+
+
+def profile_user_state(user):
+    """The loaded username/email of ``user``, or None if either is deferred."""
+    if all(field in user.__dict__ for field in PROFILE_USER_FIELDS):
+        return tuple(user.__dict__[field] for field in PROFILE_USER_FIELDS)
+    return None
+
+
+@receiver(post_init, sender=User)
+def remember_profile_user_state(sender, instance, **kwargs):
+    instance._profile_user_state = profile_user_state(instance)
+
+
+@receiver(post_save, sender=User)
+def touch_profiles(sender, instance, created, update_fields, **kwargs):
+    old, new = instance._profile_user_state, profile_user_state(instance)
+    instance._profile_user_state = new
+    if created or (old is not None and old == new):
+        return
+    if update_fields is not None and not set(PROFILE_USER_FIELDS) & set(update_fields):
+        return
+    now = timezone.now()
+    UserProfile.objects.filter(user=instance).update(updated_at=now)
+    DonorProfile.objects.filter(user=instance).update(updated_at=now)
+
+
+class OutgoingEmail(models.Model):
+    """Outbox row; delivered by the ``send_queued_email`` worker command."""
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    subject = models.CharField(max_length=255)
+    to = models.EmailField()
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=[(PENDING, "Pending"), (SENT, "Sent"), (FAILED, "Failed")],
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
+
+
+# Logout deletes the token; forget it in the authentication cache too
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
@@ -0,0 +1,196 @@
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Upper
+from django.db.models.lookups import GreaterThanOrEqual
+from rest_framework import filters
+from .constants import BLOOD_GROUP
+
+BLOOD_GROUP_CODES = {code for code, _ in BLOOD_GROUP}
+
+# Created by migration 0008 on SQLite; kept in sync with triggers
+SQLITE_FTS_TABLE = "user_donorprofile_fts"
+
+# Minimum share of the search text's trigrams a donor must contain (SQLite)
+SEARCH_SIMILARITY_THRESHOLD = 0.3
+
+# Searches matching more donors than this are listed in id order: ranking
+# would score and sort every match before the first page could be cut, and
+# among that many matches the rank tells little apart
+SEARCH_RANK_LIMIT = 1000
+
+_pg_trgm_installed = {}
+
+
+def trigrams(word):
+    word = word.lower()
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+def search_vector():
+    """Must match the GIN index expression created by migration 0008."""
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector("district", "donor_type", config="simple")
+
+
+def has_pg_trgm(alias):
+    """Whether the pg_trgm extension exists; looked up once per database."""
+    if alias not in _pg_trgm_installed:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _pg_trgm_installed[alias] = cursor.fetchone() is not None
+    return _pg_trgm_installed[alias]
+
+
+def postgres_search(queryset, words):
+    """
+    Every word matched by full text on district/donor_type, or by trigrams
+    to a fuzzy district; returns the matches and their rank, or no rank
+    when more than SEARCH_RANK_LIMIT donors match.
+    """
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import (
+        SearchQuery,
+        SearchRank,
+        SearchVectorExact,
+        TrigramSimilarity,
+    )
+
+    vector = search_vector()
+    fuzzy = has_pg_trgm(queryset.db)
+    condition, ranks = Q(), []
+    for word in words:
+        query = SearchQuery(word, config="simple")
+        matches = Q(SearchVectorExact(vector, query))
+        ranks.append(SearchRank(vector, query))
+        if fuzzy:
+            text = Value(word.upper())
+            matches |= Q(TrigramSimilar(Upper("district"), text))
+            ranks.append(TrigramSimilarity(Upper("district"), text))
+        condition &= matches
+
+    # ts_rank is a float4; as float8 it survives the keyset cursor round trip
+    rank = Cast(sum(ranks[1:], ranks[0]), output_field=FloatField())
+    matches = queryset.filter(condition)
+    if matches.values("pk")[: SEARCH_RANK_LIMIT + 1].count() > SEARCH_RANK_LIMIT:
+        return matches, None
+    return matches, rank
+
+
+def word_similarity(grams):
+    """The share of ``grams`` found in district or donor type."""
+    hits = [
+        Case(
+            When(Q(district__icontains=gram) | Q(donor_type__icontains=gram), then=1),
+            default=0,
+        )
+        for gram in grams
+    ]
+    return Cast(sum(hits[1:], hits[0]), FloatField()) / len(grams)
+
+
+def sqlite_search(queryset, words):
+    """
+    FTS5 trigram search that tolerates typos; returns the matches and their
+    rank, or no rank when the index finds more than SEARCH_RANK_LIMIT
+    candidates.
+
+    For every word, the FTS index finds donors sharing any of its trigrams;
+    the word's similarity is the fraction of them found in district/donor
+    type, like pg_trgm's, and must reach SEARCH_SIMILARITY_THRESHOLD. The
+    rank is the mean similarity. Words shorter than a trigram are matched
+    with ``icontains``. The candidates' ids are read once, so the ranked
+    query looks them up by primary key instead of querying FTS again.
+    """
+    grams = [sorted(trigrams(word)) for word in words]
+    if not any(grams):
+        # Every word is shorter than a trigram; nothing the index can answer
+        return fallback_search(queryset, words)
+
+    match = " AND ".join(
+        "({})".format(
+            " OR ".join('"{}"'.format(gram.replace('"', '""')) for gram in word)
+        )
+        for word in grams
+        if word
+    )
+    candidates = queryset.filter(
+        id__in=RawSQL(
+            f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s",
+            [match],
+        )
+    )
+    ids = list(candidates.values_list("pk", flat=True)[: SEARCH_RANK_LIMIT + 1])
+    ranked = len(ids) <= SEARCH_RANK_LIMIT
+    queryset = queryset.filter(pk__in=ids) if ranked else candidates
+    similarities = []
+    for word, word_grams in zip(words, grams):
+        if not word_grams:
+            queryset = queryset.filter(
+                Q(district__icontains=word) | Q(donor_type__icontains=word)
+            )
+            continue
+        similarity = word_similarity(word_grams)
+        similarities.append(similarity)
+        queryset = queryset.filter(
+            GreaterThanOrEqual(similarity, SEARCH_SIMILARITY_THRESHOLD)
+        )
+    if not ranked:
+        return queryset, None
+    return queryset, sum(similarities[1:], similarities[0]) / len(similarities)
+
+
+def fallback_search(queryset, words):
+    """``icontains`` on every word; the matches are not ranked."""
+    for word in words:
+        queryset = queryset.filter(
+            Q(district__icontains=word) | Q(donor_type__icontains=word)
+        )
+    return queryset, None
+
+
+SEARCH_BACKENDS = {"postgresql": postgres_search, "sqlite": sqlite_search}
+
+
+class DonorSearchFilter(filters.SearchFilter):
+    """
+    Indexed, ranked replacement for SearchFilter on donor profiles.
+
+    Terms that are blood group codes become an exact ``blood_group`` filter,
+    the rest are matched against district and donor type through Postgres
+    full-text/trigram indexes or a SQLite FTS5 table, instead of
+    ``icontains`` scans. As with SearchFilter, a donor must match every
+    term. Dates are not searched; ``?date_of_donation=`` filters on them.
+    Results are ordered by relevance, unless more than SEARCH_RANK_LIMIT
+    donors match, which each backend finds out with one bounded query; then
+    they keep the paginator's id order, which the first page can stop early
+    on.
+    ``get_ordering`` hands the ordering to the keyset paginator.
+    """
+
+    def split_terms(self, request):
+        groups, words = [], []
+        for term in self.get_search_terms(request):
+            if term.upper() in BLOOD_GROUP_CODES:
+                groups.append(term.upper())
+            else:
+                words.append(term)
+        return groups, words
+
+    def filter_queryset(self, request, queryset, view):
+        groups, words = self.split_terms(request)
+        if groups:
+            queryset = queryset.filter(blood_group__in=groups)
+        if not words:
+            return queryset
+        vendor = connections[queryset.db].vendor
+        matches, rank = SEARCH_BACKENDS.get(vendor, fallback_search)(queryset, words)
+        if rank is None:
+            return matches
+        return matches.annotate(search_rank=rank)
+
+    def get_ordering(self, request, queryset, view):
+        if "search_rank" in queryset.query.annotations:
+            return ("-search_rank", "id")
+        return None
@@ -1,9 +1,29 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import DonorProfile, UserProfile
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from blood.models import BloodRequest
+from .models import NEAREST_MAX_KM, DonorProfile, UserProfile
 from .constants import BLOOD_GROUP, GENDER_TYPE
 
 
+class LocationMixin:
+    """Validation for models with an optional latitude/longitude pair."""
+
+    def validate(self, data):
+        data = super().validate(data)
+        location = [
+            data.get(field, getattr(self.instance, field, None))
+            for field in ("latitude", "longitude")
+        ]
+        if location.count(None) == 1:
+            raise serializers.ValidationError(
+                "latitude and longitude must be given together."
+            )
+        return data
+
+
 # Serializer for the User model
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -41,23 +61,43 @@ class RegistrationSerializer(serializers.ModelSerializer):
         ]
         extra_kwargs = {
             "password": {"write_only": True},
+            # Uniqueness is checked with the email in validate(), in one query
+            "username": {"validators": [UnicodeUsernameValidator()]},
         }
 
     def validate(self, data):
-        """Ensure passwords match and email is unique."""
+        """Ensure passwords match and the username and email are free."""
         if data["password"] != data["confirm_password"]:
             raise serializers.ValidationError({"password": "Passwords don't match."})
 
-        if User.objects.filter(email=data["email"]).exists():
-            raise serializers.ValidationError({"email": "Email already exists."})
+        errors = self.taken(data)
+        if errors:
+            raise serializers.ValidationError(errors)
 
         return data
 
-    def create(self, validated_data):
-        """Create a new user with the validated data."""
-        validated_data.pop("confirm_password")  # Remove confirm_password field
+    def taken(self, data):
+        """
+        Errors for a username or (case-insensitive) email already in use,
+        checked with one query over the username and UPPER(email) indexes.
+        """
+        email = (data.get("email") or "").upper()
+        query = Q(username=data["username"])
+        if email:
+            # ~Q(email="") matches the partial user_email_ci_unique index
+            query |= Q(email__upper=email) & ~Q(email="")
+        errors = {}
+        for username, other_email in User.objects.filter(query).values_list(
+            "username", "email"
+        )[:2]:
+            if username == data["username"]:
+                errors["username"] = "A user with that username already exists."
+            if email and other_email.upper() == email:
+                errors["email"] = "Email already exists."
+        return errors
 
-        # Create and save the user
+    def create(self, validated_data):
+        """Create the user and, through post_save, its profile."""
         user = User(
             username=validated_data["username"],
             first_name=validated_data["first_name"],
@@ -66,9 +106,20 @@ class RegistrationSerializer(serializers.ModelSerializer):
         )
         user.set_password(validated_data["password"])
         user.is_active = False  # Account is inactive until email verification
-        user.save()
-
-        # Save additional fields like mobile_number and blood_group in a related model
+        # Inserted with the profile row by create_user_profile
+        user._profile_fields = {
+            "mobile_number": validated_data["mobile_number"],
+            "blood_group": validated_data["blood_group"],
+        }
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # Registered concurrently after validate() checked
+            raise serializers.ValidationError(
+                self.taken(validated_data)
+                or {"username": "A user with that username already exists."}
+            )
         return user
 
 
@@ -79,7 +130,7 @@ class UserLoginSerializer(serializers.Serializer):
 
 
 # Serializer for DonorProfile, including nested fields for user details
-class DonorProfileSerializer(serializers.ModelSerializer):
+class DonorProfileSerializer(LocationMixin, serializers.ModelSerializer):
     username = serializers.CharField(source="user.username", read_only=True)
     email = serializers.EmailField(source="user.email", read_only=True)
 
@@ -92,8 +143,11 @@ class DonorProfileSerializer(serializers.ModelSerializer):
             "blood_group",
             "district",
             "date_of_donation",
+            "last_donation_date",
             "donor_type",
             "is_available",
+            "latitude",
+            "longitude",
         ]
 
     def create(self, validated_data):
@@ -110,3 +164,46 @@ class DonorProfileSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         return instance
+
+
+class NearbyDonorSerializer(DonorProfileSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(DonorProfileSerializer.Meta):
+        fields = DonorProfileSerializer.Meta.fields + ["distance_km"]
+
+
+# Query parameters of the nearby donors endpoint
+class NearbyDonorsQuerySerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    # Search around this request's location, for donors who can give to it
+    blood_request = serializers.PrimaryKeyRelatedField(
+        queryset=BloodRequest.objects.all(), required=False
+    )
+    # Only donors who can give to this group
+    recipient_group = serializers.ChoiceField(choices=BLOOD_GROUP, required=False)
+    radius = serializers.FloatField(min_value=0, max_value=NEAREST_MAX_KM, default=10)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def to_internal_value(self, data):
+        data = data.copy()
+        if "recipient_group" in data:
+            data["recipient_group"] = data["recipient_group"].upper()
+        return super().to_internal_value(data)
+
+    def validate(self, data):
+        blood_request = data.get("blood_request")
+        if blood_request is not None:
+            if blood_request.latitude is None:
+                raise serializers.ValidationError(
+                    {"blood_request": "This blood request has no location."}
+                )
+            data.setdefault("latitude", blood_request.latitude)
+            data.setdefault("longitude", blood_request.longitude)
+            data.setdefault("recipient_group", blood_request.blood_group)
+        elif "latitude" not in data or "longitude" not in data:
+            raise serializers.ValidationError(
+                "Give latitude and longitude, or a blood_request with a location."
+            )
+        return data
@@ -1,3 +1,1599 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import random
+import re
+import socketserver
+import threading
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import StreamingHttpResponse
+from django.core.management import call_command
+from django.contrib.auth.tokens import default_token_generator
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.utils.translation import gettext_lazy
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase, force_authenticate
+from blood.models import BloodRequest, Donation
+from rokto_dan.asyncviews import run_concurrently
+from rokto_dan.bulk import stream_rows
+from rokto_dan.metrics import HISTOGRAMS
+from rokto_dan.middleware import CompressionMiddleware, brotli
+from rokto_dan.renderers import FastJSONRenderer
+from rokto_dan.routers import RoutingState, current_state
+from rokto_dan.throttling import TokenBucketThrottle
+from rokto_dan.values import ValuesSerializer
+from .bulk import DONOR_EXPORT_FIELDS, DonorImporter
+from .constants import BLOOD_GROUP
+from .geo import covering_ranges, geohash, haversine_km
+from .mail import claim_batch, send_batch, send_queued_emails
+from .models import DonorProfile, OutgoingEmail, UserProfile
+from .serializers import RegistrationSerializer, UserProfileSerializer
+from .views import (
+    AsyncDonorListAPIView,
+    AsyncUserDashboardAPIView,
+    AsyncUserProfileAPIView,
+)
+
+
+class UserDashboardAPIViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("donor", "donor@example.com")
+        self.other = User.objects.create_user("other", "other@example.com")
+        self.client.force_authenticate(self.user)
+        self.url = reverse("user_dashboard")
+
+    def create_requests(self, requester, count, status="pending"):
+        start = datetime.date(2024, 1, 1)
+        BloodRequest.objects.bulk_create(
+            BloodRequest(
+                requester=requester,
+                blood_group="A+",
+                request_date=start + datetime.timedelta(days=i % 30),
+                status=status,
+            )
+            for i in range(count)
+        )
+
+    def test_pending_requests_only_lists_pending_requests_of_others(self):
+        self.create_requests(self.other, 2)
+        self.create_requests(self.other, 3, status="fulfilled")
+        self.create_requests(self.user, 1)
+
+        response = self.client.get(self.url)
+
+        pending = response.data["pending_requests"]["results"]
+        self.assertEqual(len(pending), 2)
+        self.assertTrue(all(row["status"] == "pending" for row in pending))
+        self.assertEqual(len(response.data["my_requests"]["results"]), 1)
+
+    def test_sections_are_cursor_paginated(self):
+        self.create_requests(self.other, 45)
+
+        seen = []
+        url = self.url + "?page_size=20"
+        while url:
+            cache.clear()
+            section = self.client.get(url).data["pending_requests"]
+            self.assertLessEqual(len(section["results"]), 20)
+            seen.extend(row["id"] for row in section["results"])
+            url = section["next"]
+
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+    def test_query_count_does_not_grow_with_table_size(self):
+        self.create_requests(self.other, 5)
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+        cache.clear()
+        self.create_requests(self.other, 500)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data["pending_requests"]["results"]), 20)
+
+    def test_response_is_cached_until_user_rows_change(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Donation.objects.create(
+                donor=self.user, blood_group="A+", donation_date=datetime.date.today()
+            )
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["my_donations"]["results"]), 1)
+
+    def test_new_pending_request_invalidates_cached_dashboards(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            BloodRequest.objects.create(
+                requester=self.other,
+                blood_group="O-",
+                request_date=datetime.date.today(),
+                status="pending",
+            )
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["pending_requests"]["results"]), 1)
+
+
+class ListQueryCountTests(APITestCase):
+    """Every list endpoint costs the same number of queries at any table size."""
+
+    sizes = [1, 100, 10000]
+
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer")
+        self.client.force_authenticate(self.viewer)
+        self.created = 0
+
+    def create_rows(self, count):
+        """Top the tables up to ``count`` users, donors, requests and donations."""
+        start, self.created = self.created, count
+        users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com")
+            for i in range(start, count)
+        )
+        DonorProfile.objects.bulk_create(
+            DonorProfile(user=user, blood_group="A+", district="Dhaka")
+            for user in users
+        )
+        BloodRequest.objects.bulk_create(
+            BloodRequest(
+                requester=user,
+                blood_group="A+",
+                request_date=datetime.date(2024, 1, 1),
+                status="pending",
+            )
+            for user in users
+        )
+        Donation.objects.bulk_create(
+            Donation(
+                donor=user, blood_group="A+", donation_date=datetime.date(2024, 1, 1)
+            )
+            for user in users
+        )
+
+    def assertConstantQueries(self, url_name, queries):
+        url = reverse(url_name)
+        for size in self.sizes:
+            self.create_rows(size)
+            with self.subTest(rows=size), self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    # Conditional lists build their ETag from the page query's own rows
+
+    def test_donors(self):
+        self.assertConstantQueries("donor-list", 1)
+
+    def test_users(self):
+        self.assertConstantQueries("user-list", 1)
+
+    def test_blood_requests(self):
+        self.assertConstantQueries("blood_requests-list-list", 1)
+
+    def test_donations(self):
+        self.assertConstantQueries("donations-list-list", 1)
+
+
+class FastSerializationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com")
+        self.client.force_authenticate(self.viewer)
+        for i, (group, district) in enumerate(
+            [("A+", "Dhaka"), ("O-", "ঢাকা"), ("B+", "Sylhet\u2028Town")]
+        ):
+            user = User.objects.create_user(f"donor{i}", f"donor{i}@example.com")
+            DonorProfile.objects.create(
+                user=user,
+                blood_group=group,
+                district=district,
+                donor_type="regular",
+                date_of_donation=datetime.date(2024, 1, i + 1) if i else None,
+                latitude=23.8103 + i / 3 if i != 1 else None,
+                longitude=90.4125 - i / 7 if i != 1 else None,
+            )
+            for requester in [user, self.viewer]:
+                BloodRequest.objects.create(
+                    requester=requester,
+                    blood_group=group,
+                    district=district,
+                    request_date=datetime.date(2024, 5, i + 1),
+                    status="pending",
+                    details="«urgent»" if i else None,
+                )
+            Donation.objects.create(
+                donor=user if i else self.viewer,
+                blood_group=group,
+                donation_date=datetime.date(2024, 4, i + 1),
+            )
+
+    def get(self, url):
+        cache.clear()
+        return self.client.get(url, HTTP_ACCEPT="application/json").content
+
+    def test_lists_render_the_same_bytes_as_the_serializers(self):
+        urls = [
+            reverse("donor-list"),
+            reverse("donor-list") + "?search=dhaka&page_size=1",
+            reverse("user-list") + "?page_size=2",
+            reverse("blood_requests-list-list"),
+            reverse("donations-list-list"),
+            reverse("user_dashboard") + "?page_size=2",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                fast = self.get(url)
+                # Following the cursor works from rows as from instances
+                next_page = json.loads(fast).get("next")
+                if next_page:
+                    fast += self.get(next_page)
+                with override_settings(FAST_LIST_SERIALIZATION=False), mock.patch(
+                    "rokto_dan.renderers.orjson", None
+                ):
+                    slow = self.get(url)
+                    if next_page:
+                        slow += self.get(next_page)
+                self.assertEqual(fast, slow)
+
+    def test_renderer_matches_drf(self):
+        payload = {
+            "date": datetime.date(2024, 5, 1),
+            "utc": datetime.datetime(2024, 5, 1, 6, 30, 1, 250, tzinfo=datetime.UTC),
+            "dhaka": datetime.datetime(
+                2024, 5, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=6))
+            ),
+            "naive": datetime.datetime(2024, 5, 1, 6, 30),
+            "decimal": Decimal("1.5"),
+            "lazy": gettext_lazy("Email already exists."),
+            "text": "ঢাকা \u2028\u2029 «»",
+            "rows": (1, 2.5, None, True),
+            "error": ErrorDetail("Invalid", code="invalid"),
+        }
+        self.assertEqual(
+            FastJSONRenderer().render(payload), JSONRenderer().render(payload)
+        )
+        indented = FastJSONRenderer().render(payload, "application/json; indent=2")
+        self.assertEqual(
+            indented, JSONRenderer().render(payload, "application/json; indent=2")
+        )
+        # Not representable by orjson: rendered by DRF
+        self.assertEqual(FastJSONRenderer().render({1: 2**70}), b'{"1":%d}' % 2**70)
+
+    def test_non_finite_floats_are_refused_like_drf(self):
+        for value in [float("nan"), float("-inf"), Decimal("Infinity")]:
+            with self.subTest(value=value):
+                payload = {"rows": [{"latitude": value, "district": None}]}
+                with self.assertRaisesMessage(ValueError, "not JSON compliant"):
+                    JSONRenderer().render(payload)
+                with self.assertRaisesMessage(ValueError, "not JSON compliant"):
+                    FastJSONRenderer().render(payload)
+
+    def test_unsupported_fields_are_refused(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "UserProfileSerializer"):
+            ValuesSerializer(UserProfileSerializer)
+
+
+class CompressionTests(APITestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer")
+        self.client.force_authenticate(self.viewer)
+        users = User.objects.bulk_create(
+            User(username=f"donor{i}", email=f"donor{i}@example.com") for i in range(50)
+        )
+        DonorProfile.objects.bulk_create(
+            DonorProfile(user=user, blood_group="A+", district="Dhaka")
+            for user in users
+        )
+        self.url = reverse("donor-list") + "?page_size=50"
+
+    def test_large_responses_are_gzipped_with_a_weak_etag(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertLess(len(response.content), len(plain.content) / 4)
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response["ETag"], "W/" + plain["ETag"])
+        response = self.client.get(
+            self.url,
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_encoding_is_negotiated(self):
+        for accept_encoding, coding in [
+            ("", None),
+            ("gzip;q=0, identity", None),
+            ("deflate, *;q=0.5", "gzip"),
+            ("br;q=0.5, gzip", "gzip"),
+            ("br, gzip;q=0.9", "br" if brotli else "gzip"),
+        ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get(
+                    self.url, HTTP_ACCEPT_ENCODING=accept_encoding
+                )
+                self.assertEqual(response.get("Content-Encoding"), coding)
+
+    def test_small_responses_and_event_streams_are_not_compressed(self):
+        response = self.client.get(
+            reverse("donor-list") + "?page_size=1", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertNotIn("Content-Encoding", response)
+
+        events = StreamingHttpResponse(
+            iter([b"data: 1\n\n"] * 100), content_type="text/event-stream"
+        )
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        response = CompressionMiddleware(lambda request: events)(request)
+        self.assertNotIn("Content-Encoding", response)
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_when_preferred(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("viewer")
+        self.client.force_authenticate(self.user)
+        self.donors = [
+            DonorProfile.objects.create(
+                user=User.objects.create_user(f"donor{i}"),
+                blood_group="A+",
+                district=district,
+                donor_type="regular",
+            )
+            for i, district in enumerate(["Dhaka", "Dhaka", "Sylhet"])
+        ]
+
+    def assertNotModified(self, url, etag, queries=1):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_list_answers_304_until_a_row_changes(self):
+        url = reverse("donor-list")
+        etag = self.client.get(url)["ETag"]
+        # Only the page query; nothing is serialized
+        self.assertNotModified(url, etag)
+
+        self.donors[0].is_available = False
+        self.donors[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        self.donors[1].delete()
+        self.assertNotEqual(self.client.get(url)["ETag"], etag)
+
+    def test_list_pages_have_their_own_etags_and_no_last_modified(self):
+        url = reverse("donor-list") + "?page_size=2"
+        first = self.client.get(url)
+        self.assertNotIn("Last-Modified", first)
+        second = self.client.get(first.data["next"])
+        self.assertNotEqual(second["ETag"], first["ETag"])
+
+        # A row deleted from the first page leaves the second one as it was
+        self.donors[0].delete()
+        response = self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=first["ETag"],
+            HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotModified(first.data["next"], second["ETag"])
+
+    def test_filtered_list_ignores_rows_outside_the_filter(self):
+        url = reverse("donor-list") + "?district=dhaka"
+        etag = self.client.get(url)["ETag"]
+        self.assertNotEqual(etag, self.client.get(reverse("donor-list"))["ETag"])
+
+        self.donors[2].is_available = False
+        self.donors[2].save()
+        self.assertNotModified(url, etag)
+
+    def test_username_change_changes_donor_etag(self):
+        url = reverse("donor-detail", args=[self.donors[0].pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, etag)
+
+        user = self.donors[0].user
+        user.username = "renamed"
+        user.save()
+        self.assertNotEqual(self.client.get(url)["ETag"], etag)
+
+    def test_if_modified_since(self):
+        url = reverse("user_profile", args=[self.donors[0].user_id])
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("donor")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.url = reverse("user-list")
+
+    def test_cached_token_skips_the_token_lookup(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse(any(Token._meta.db_table in query["sql"] for query in queries))
+
+    def test_cache_holds_no_token_or_password(self):
+        self.user.set_password("secret")
+        self.user.save()
+        self.client.get(self.url)
+        # The local memory cache keeps keys and pickled values as they are
+        stored = [key.encode() + value for key, value in cache._cache.items()]
+        self.assertTrue(stored)
+        for entry in stored:
+            self.assertNotIn(self.token.key.encode(), entry)
+            self.assertNotIn(self.user.password.encode(), entry)
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get(self.url)
+        self.client.get(reverse("logout"))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deactivation_invalidates_cached_token(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_queryset_deactivation_refuses_cached_token(self):
+        self.client.get(self.url)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class DonorBulkImportExportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", is_staff=True)
+        self.client.force_authenticate(self.admin)
+        User.objects.bulk_create(User(username=f"donor{i}") for i in range(3))
+
+    def test_csv_import_creates_and_updates_profiles_and_reports_bad_rows(self):
+        body = (
+            "username,blood_group,district,date_of_donation,donor_type\n"
+            "donor0,A+,Dhaka,,regular\n"
+            "donor1,XX,Dhaka,,regular\n"
+            "ghost,O-,Dhaka,,regular\n"
+            "donor2,B+,Sylhet,2024-03-01,emergency\n"
+        )
+        url = reverse("donor-bulk-import")
+
+        response = self.client.generic("POST", url, body, content_type="text/csv")
+
+        self.assertEqual(response.data["imported"], 2)
+        self.assertEqual([e["row"] for e in response.data["errors"]], [2, 3])
+        self.client.generic(
+            "POST",
+            url,
+            "username,blood_group,district,donor_type\n" "donor0,AB-,Khulna,regular\n",
+            content_type="text/csv",
+        )
+        donor = DonorProfile.objects.get(user__username="donor0")
+        self.assertEqual((donor.blood_group, donor.district), ("AB-", "Khulna"))
+        self.assertEqual(DonorProfile.objects.count(), 2)
+
+    def test_unreadable_upload_reports_what_was_imported(self):
+        header = b"username,blood_group,district,donor_type\n"
+        url = reverse("donor-bulk-import")
+        for name, bad_line in [
+            ("invalid UTF-8", b"donor2,O+,\xff\xfe,regular\n"),
+            ("oversized field", b"donor2,O+,%s,regular\n" % (b"x" * 2**18)),
+        ]:
+            with self.subTest(name), mock.patch.object(DonorImporter, "chunk_size", 1):
+                body = (
+                    header
+                    + b"donor0,A+,Dhaka,regular\n"
+                    + b"donor1,B+,Sylhet,regular\n"
+                    + bad_line
+                    + b"donor2,O+,Khulna,regular\n"
+                )
+                response = self.client.generic(
+                    "POST", url, body, content_type="text/csv"
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data["imported"], 2)
+                self.assertEqual(len(response.data["errors"]), 1)
+                self.assertIn("after row 2", response.data["errors"][0]["file"])
+                self.assertFalse(
+                    DonorProfile.objects.filter(user__username="donor2").exists()
+                )
+
+    def test_jsonl_export_renders_rows_like_json(self):
+        DonorProfile.objects.bulk_create(
+            DonorProfile(
+                user=user,
+                blood_group="A+",
+                district="ঢাকা",
+                date_of_donation=datetime.date(2024, 5, 1),
+            )
+            for user in User.objects.filter(username__startswith="donor")
+        )
+        queryset = DonorProfile.objects.order_by("pk")
+        rendered = b"".join(stream_rows(queryset, DONOR_EXPORT_FIELDS, "json"))
+        lines = b"".join(stream_rows(queryset, DONOR_EXPORT_FIELDS, "jsonl"))
+        self.assertEqual(b"[" + b",".join(lines.splitlines()) + b"]", rendered)
+
+    def test_jsonl_upload_and_filtered_streaming_export(self):
+        upload = io.BytesIO(
+            b'{"username": "donor0", "blood_group": "A+", "district": "Dhaka",'
+            b' "donor_type": "regular"}\n'
+            b'{"username": "donor1", "blood_group": "O+", "district": "Sylhet",'
+            b' "donor_type": "regular", "is_available": false}\n'
+        )
+        upload.name = "donors.jsonl"
+        self.client.post(reverse("donor-bulk-import"), {"file": upload})
+
+        response = self.client.get(reverse("donor-export"), {"district": "sylhet"})
+
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["username", "email", "blood_group"])
+        self.assertEqual(lines[1:], ["donor1,,O+,Sylhet,,regular,False"])
+
+    def test_json_export_streams_one_array_a_chunk_at_a_time(self):
+        DonorProfile.objects.bulk_create(
+            DonorProfile(user=user, blood_group="A+", district="Dhaka")
+            for user in User.objects.filter(username__startswith="donor")
+        )
+        queryset = DonorProfile.objects.order_by("pk")
+
+        chunks = list(stream_rows(queryset, DONOR_EXPORT_FIELDS, "json", chunk_size=2))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(
+            [row["username"] for row in json.loads(b"".join(chunks))],
+            ["donor0", "donor1", "donor2"],
+        )
+        self.assertEqual(
+            b"".join(stream_rows(queryset.none(), DONOR_EXPORT_FIELDS, "json")), b"[]"
+        )
+
+        response = self.client.get(
+            reverse("donor-export"), {"type": "json"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        rows = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(
+            rows[0],
+            {
+                "username": "donor0",
+                "email": "",
+                "blood_group": "A+",
+                "district": "Dhaka",
+                "date_of_donation": None,
+                "donor_type": "",
+                "is_available": True,
+            },
+        )
+
+    def test_bulk_endpoints_are_staff_only(self):
+        self.client.force_authenticate(User.objects.get(username="donor0"))
+        self.assertEqual(self.client.get(reverse("donor-export")).status_code, 403)
+
+
+class DonorSearchTests(APITestCase):
+    def setUp(self):
+        viewer = User.objects.create_user("viewer")
+        self.client.force_authenticate(viewer)
+        donors = [
+            ("A+", "Chittagong", "regular"),
+            ("O-", "Chittagong", "emergency"),
+            ("A+", "Dhaka", "regular"),
+            ("B+", "Chapai Nawabganj", "regular"),
+        ]
+        for i, (blood_group, district, donor_type) in enumerate(donors):
+            DonorProfile.objects.create(
+                user=User.objects.create_user(f"donor{i}"),
+                blood_group=blood_group,
+                district=district,
+                donor_type=donor_type,
+            )
+
+    def search(self, text, **params):
+        response = self.client.get(reverse("donor-list"), {"search": text, **params})
+        return [
+            (row["blood_group"], row["district"]) for row in response.data["results"]
+        ]
+
+    def test_blood_group_terms_filter_exactly(self):
+        self.assertEqual(self.search("a+ chittagong"), [("A+", "Chittagong")])
+
+    def test_district_search_is_ranked_and_case_insensitive(self):
+        results = self.search("CHITTAGONG")
+        self.assertEqual(results[:2], [("A+", "Chittagong"), ("O-", "Chittagong")])
+        self.assertNotIn(("A+", "Dhaka"), results)
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search("chittagong emergency"), [("O-", "Chittagong")])
+        self.assertEqual(self.search("emergency chittagong"), [("O-", "Chittagong")])
+        self.assertEqual(self.search("dhaka emergency"), [])
+        self.assertEqual(self.search("chapai nawabganj"), [("B+", "Chapai Nawabganj")])
+
+    def test_dates_are_not_searched(self):
+        DonorProfile.objects.update(date_of_donation=datetime.date(2024, 5, 1))
+        self.assertEqual(self.search("2024-05-01"), [])
+
+    def test_misspelt_district_still_matches(self):
+        if connection.vendor == "postgresql":
+            from .search import has_pg_trgm
+
+            if not has_pg_trgm(connection.alias):
+                self.skipTest("pg_trgm is not installed")
+        self.assertEqual(self.search("chitagong")[0][1], "Chittagong")
+
+    def test_common_searches_are_listed_in_id_order(self):
+        with mock.patch("user.search.SEARCH_RANK_LIMIT", 1):
+            first = self.client.get(
+                reverse("donor-list"), {"search": "chittagong", "page_size": 1}
+            ).data
+            second = self.client.get(first["next"]).data
+        self.assertLess(first["results"][0]["id"], second["results"][0]["id"])
+        self.assertIsNone(second["next"])
+        self.assertEqual(
+            [row["district"] for row in first["results"] + second["results"]],
+            ["Chittagong", "Chittagong"],
+        )
+
+    def test_ranked_results_paginate_without_gaps(self):
+        first = self.client.get(
+            reverse("donor-list"), {"search": "chittagong", "page_size": 1}
+        ).data
+        second = self.client.get(first["next"]).data
+        self.assertEqual(
+            {first["results"][0]["id"], second["results"][0]["id"]},
+            set(
+                DonorProfile.objects.filter(district="Chittagong").values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+
+class NearbyDonorTests(APITestCase):
+    # Dhaka; donors are placed by distance (km) north of it
+    origin = (23.8103, 90.4125)
+
+    def setUp(self):
+        self.user = User.objects.create_user("patient")
+        self.client.force_authenticate(self.user)
+        self.url = reverse("donor-nearby")
+
+    def donor(self, name, km, blood_group="O+", **fields):
+        latitude = self.origin[0] + km / 111.2 if km is not None else None
+        return DonorProfile.objects.create(
+            user=User.objects.create_user(name),
+            blood_group=blood_group,
+            district=fields.pop("district", "Dhaka"),
+            donor_type="regular",
+            latitude=latitude,
+            longitude=self.origin[1] if km is not None else None,
+            **fields,
+        )
+
+    def nearby(self, **params):
+        response = self.client.get(
+            self.url,
+            {"latitude": self.origin[0], "longitude": self.origin[1], **params},
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(row["username"], round(row["distance_km"])) for row in response.data]
+
+    def test_geohash_matches_the_textual_encoding(self):
+        alphabet = "0123456789bcdefghjkmnpqrstuvwxyz"
+        expected = 0
+        for character in "u4pruydqq":
+            expected = expected << 5 | alphabet.index(character)
+        self.assertEqual(geohash(57.64911, 10.40744), expected)
+        self.assertIsNone(geohash(None, 10.4))
+
+    def test_covering_ranges_contain_the_circle(self):
+        generator = random.Random(0)
+        for _ in range(200):
+            latitude = generator.uniform(-80, 80)
+            longitude = generator.uniform(-170, 170)
+            radius = generator.choice([0.2, 3, 25, 90])
+            ranges = covering_ranges(latitude, longitude, radius)
+            for _ in range(20):
+                point = (
+                    latitude + generator.uniform(-1, 1) * radius / 112,
+                    longitude + generator.uniform(-1, 1) * radius / 112,
+                )
+                if haversine_km(latitude, longitude, *point) <= radius:
+                    value = geohash(*point)
+                    self.assertTrue(any(low <= value < high for low, high in ranges))
+
+    def test_nearest_compatible_available_donors_first(self):
+        # Across the district border, but close
+        self.donor("neighbour", 3, district="Gazipur")
+        self.donor("near", 1)
+        self.donor("far", 40)
+        self.donor("incompatible", 2, blood_group="AB+")
+        self.donor("unavailable", 2, is_available=False)
+        self.donor("cooldown", 2, date_of_donation=timezone.localdate())
+        self.donor("unlocated", None)
+
+        self.assertEqual(
+            self.nearby(recipient_group="o+"), [("near", 1), ("neighbour", 3)]
+        )
+        self.assertEqual(
+            self.nearby(recipient_group="O+", radius=50),
+            [("near", 1), ("neighbour", 3), ("far", 40)],
+        )
+        self.assertEqual(
+            self.nearby(radius=50, limit=2), [("near", 1), ("incompatible", 2)]
+        )
+
+    def test_search_widens_until_limit_is_reached(self):
+        self.donor("near", 1)
+        self.donor("far", 30)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.nearby(radius=50, limit=1), [("near", 1)])
+        with CaptureQueriesContext(connection) as widened:
+            self.assertEqual(
+                self.nearby(radius=50, limit=2), [("near", 1), ("far", 30)]
+            )
+        # 2 km, 8 km, 32 km
+        self.assertEqual(len(widened), len(queries) + 2)
+
+    def test_around_a_blood_request(self):
+        self.donor("near", 1, blood_group="A+")
+        self.donor("other-group", 1, blood_group="B+")
+        requester = self.donor("requester", 0, blood_group="A+").user
+        blood_request = BloodRequest.objects.create(
+            requester=requester,
+            blood_group="A+",
+            request_date=datetime.date(2024, 5, 1),
+            status="pending",
+            latitude=self.origin[0],
+            longitude=self.origin[1],
+        )
+        response = self.client.get(self.url, {"blood_request": blood_request.pk})
+        self.assertEqual([row["username"] for row in response.data], ["near"])
+
+        blood_request.latitude = blood_request.longitude = None
+        blood_request.save()
+        response = self.client.get(self.url, {"blood_request": blood_request.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("blood_request", response.data)
+
+    def test_invalid_queries(self):
+        for params in [{}, {"latitude": 23.8}, {"latitude": 91, "longitude": 90}]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_moving_updates_the_geohash(self):
+        donor = self.donor("mover", 1)
+        self.assertEqual(donor.geohash, geohash(donor.latitude, donor.longitude))
+        response = self.client.patch(
+            reverse("donor-detail", args=[donor.pk]),
+            {"latitude": 22.3569, "longitude": 91.7832},
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        donor.refresh_from_db()
+        self.assertEqual(donor.geohash, geohash(22.3569, 91.7832))
+
+        response = self.client.patch(
+            reverse("donor-detail", args=[donor.pk]), {"latitude": ""}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Run EXPLAIN on every query behind the hot list endpoints and fail if any
+    of them reads a table with a sequential scan instead of an index.
+    """
+
+    rows = 5000
+    districts = [f"District{i}" for i in range(64)]
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = [code for code, _ in BLOOD_GROUP]
+        start = datetime.date(2024, 1, 1)
+        User.objects.bulk_create(User(username=f"user{i}") for i in range(cls.rows))
+        users = list(User.objects.order_by("id"))
+        DonorProfile.objects.bulk_create(
+            DonorProfile(
+                user=user,
+                blood_group=groups[i % len(groups)],
+                district=cls.districts[i % len(cls.districts)],
+                donor_type="regular" if i % 3 else "emergency",
+                is_available=bool(i % 4),
+                # A grid about 500 m apart around Dhaka
+                latitude=23.6 + i % 70 * 0.005,
+                longitude=90.2 + i // 70 * 0.005,
+                geohash=geohash(23.6 + i % 70 * 0.005, 90.2 + i // 70 * 0.005),
+            )
+            for i, user in enumerate(users)
+        )
+        BloodRequest.objects.bulk_create(
+            BloodRequest(
+                requester=users[(i * 7) % cls.rows],
+                blood_group=groups[i % len(groups)],
+                request_date=start + datetime.timedelta(days=i % 365),
+                status=(
+                    ["fulfilled", "canceled", "pending"][i % 3] if i % 20 else "pending"
+                ),
+            )
+            for i in range(cls.rows)
+        )
+        Donation.objects.bulk_create(
+            Donation(
+                donor=users[(i * 13) % cls.rows],
+                blood_group=groups[i % len(groups)],
+                donation_date=start + datetime.timedelta(days=i % 365),
+            )
+            for i in range(cls.rows)
+        )
+        cls.user = users[42]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def explain(self, sql, sort=True):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # A few thousand rows are cheap to scan, so make sequential
+                # scans prohibitively expensive: one still shows up only when
+                # no index can serve the query. Likewise sorts, where asked.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"SET LOCAL enable_sort = {'on' if sort else 'off'}")
+                cursor.execute("EXPLAIN " + sql)
+            elif connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            else:
+                self.skipTest(f"No plan check for {connection.vendor}")
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertIndexedQueries(self, url, params=None, status=200, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, **headers)
+        self.assertEqual(response.status_code, status)
+        self.assertNoSequentialScans(queries)
+        return response
+
+    def assertOrderedByIndex(self, url, params=None):
+        """Also no sort: the page is read in index order, LIMIT and all."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertNoSequentialScans(queries, ordered=True)
+        for query in queries.captured_queries:
+            plan = self.explain(query["sql"], sort=False)
+            self.assertNotRegex(
+                plan,
+                r"(?m)USE TEMP B-TREE FOR ORDER BY|^\s*(->\s*)?Sort\b",
+                f"Sorted rows in:\n{query['sql']}\n\nPlan:\n{plan}",
+            )
+        return response
+
+    def assertNoSequentialScans(self, queries, ordered=False):
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            plan = self.explain(query["sql"])
+            # SQLite: "SCAN table" without an index (FTS5 virtual tables are
+            # index lookups); Postgres: "Seq Scan on". System catalogs are fine.
+            # A SQLite table is stored in rowid order, so an unsorted SCAN
+            # under a LIMIT walks the primary key and stops at the page.
+            rowid_walk = ordered and " LIMIT " in query["sql"]
+            scans = [
+                scan.group()
+                for scan in re.finditer(
+                    r"^SCAN (?!.*(USING|VIRTUAL TABLE))(?:auth|user|blood)_.*$"
+                    r"|Seq Scan on (?:auth|user|blood)_\S+",
+                    plan,
+                    re.M,
+                )
+                if not (rowid_walk and scan.group().startswith("SCAN"))
+            ]
+            self.assertFalse(
+                scans, f"Sequential scan in:\n{query['sql']}\n\nPlan:\n{plan}"
+            )
+
+    def test_donor_filters(self):
+        url = reverse("donor-list")
+        self.assertIndexedQueries(url, {"blood_group": "a+"})
+        self.assertIndexedQueries(url, {"district": "district7"})
+        self.assertIndexedQueries(url, {"district": "DISTRICT7", "blood_group": "O-"})
+        self.assertIndexedQueries(url, {"donor_type": "Emergency"})
+        self.assertIndexedQueries(url, {"blood_group": "a+", "eligible": "true"})
+
+    def test_nearby_donors(self):
+        url = reverse("donor-nearby")
+        params = {"latitude": 23.75, "longitude": 90.35, "recipient_group": "A-"}
+        self.assertIndexedQueries(url, params)
+        self.assertIndexedQueries(url, {**params, "radius": 50, "limit": 50})
+
+    def test_donor_search(self):
+        url = reverse("donor-list")
+        self.assertIndexedQueries(url, {"search": "district7"})
+        self.assertIndexedQueries(url, {"search": "O- district7"})
+        self.assertIndexedQueries(url, {"search": "district7 emergency"})
+        # Too many matches to rank: the page is cut from the id index
+        with mock.patch("user.search.SEARCH_RANK_LIMIT", 10):
+            self.assertOrderedByIndex(url, {"search": "district7"})
+
+    def test_registration_uniqueness_check(self):
+        serializer = RegistrationSerializer(
+            data={
+                "username": "newcomer",
+                "first_name": "New",
+                "last_name": "Comer",
+                "email": "NewComer@Example.com",
+                "mobile_number": "01700000000",
+                "blood_group": "A+",
+                "password": "pw",
+                "confirm_password": "pw",
+            }
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(len(queries), 1)
+        self.assertNoSequentialScans(queries)
+
+    def test_blood_request_filters(self):
+        url = reverse("blood_requests-list-list")
+        self.assertIndexedQueries(url, {"status": "pending"})
+        self.assertIndexedQueries(url, {"status": "pending", "blood_group": "AB-"})
+
+    def test_unfiltered_lists(self):
+        for url_name in [
+            "blood_requests-list-list",
+            "donations-list-list",
+            "donor-list",
+            "user-list",
+        ]:
+            with self.subTest(url_name):
+                url = reverse(url_name)
+                page = self.assertOrderedByIndex(url, {"page_size": 100}).data
+                # Deep in the list, a page costs what the first one does
+                page = self.client.get(page["next"]).data
+                self.assertOrderedByIndex(page["next"])
+                self.assertOrderedByIndex(page["previous"])
+
+    def test_conditional_get(self):
+        url = reverse("blood_requests-list-list")
+        etag = self.client.get(url)["ETag"]
+        # The ETag comes from the page query alone
+        self.assertIndexedQueries(url, status=304, HTTP_IF_NONE_MATCH=etag)
+
+    def test_dashboard(self):
+        self.assertIndexedQueries(reverse("user_dashboard"))
+
+    def test_donor_matches(self):
+        blood_request = BloodRequest.objects.filter(blood_group="A-").first()
+        url = reverse("blood_requests-list-matches", args=[blood_request.pk])
+        self.assertIndexedQueries(url)
+
+
+class AsyncViewTests(TransactionTestCase):
+    """The ASGI variants must answer exactly like the views they stand in for."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("donor", "donor@example.com")
+        other = User.objects.create_user("other", "other@example.com")
+        for i, user in enumerate([self.user, other] * 15):
+            BloodRequest.objects.create(
+                requester=user,
+                blood_group=BLOOD_GROUP[i % 8][0],
+                request_date=datetime.date(2024, 1, 1 + i),
+                status="pending" if i % 3 else "fulfilled",
+            )
+            DonorProfile.objects.create(
+                user=User.objects.create_user(f"donor{i}"),
+                blood_group=BLOOD_GROUP[i % 8][0],
+                district="Dhaka" if i % 2 else "Sylhet",
+                donor_type="regular",
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.factory = AsyncRequestFactory()
+
+    async def call_async(self, view, path, headers=None, **kwargs):
+        request = self.factory.get(path, headers=headers)
+        force_authenticate(request, self.user)
+        response = await view.as_view()(request, **kwargs)
+        await sync_to_async(cache.clear)()
+        return response
+
+    def assertSameResponse(self, view, path, **kwargs):
+        expected = self.client.get(path)
+        cache.clear()
+        response = async_to_sync(self.call_async)(view, path, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.data, expected.data)
+
+    def test_dashboard(self):
+        url = reverse("user_dashboard")
+        self.assertSameResponse(AsyncUserDashboardAPIView, url + "?page_size=4")
+        cursor = self.client.get(url + "?page_size=4").data["pending_requests"]["next"]
+        self.assertSameResponse(AsyncUserDashboardAPIView, cursor)
+
+    def test_donor_list(self):
+        url = reverse("donor-list")
+        for query in ["?page_size=5", "?district=dhaka&blood_group=a%2B", "?search=o-"]:
+            with self.subTest(query=query):
+                self.assertSameResponse(AsyncDonorListAPIView, url + query)
+
+    def test_conditional_get(self):
+        for view, url, kwargs in [
+            (AsyncDonorListAPIView, reverse("donor-list"), {}),
+            (
+                AsyncUserProfileAPIView,
+                reverse("user_profile", args=[self.user.pk]),
+                {"user_id": self.user.pk},
+            ),
+        ]:
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                response = async_to_sync(self.call_async)(
+                    view, url, headers={"If-None-Match": etag}, **kwargs
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_profile(self):
+        url = reverse("user_profile", args=[self.user.pk])
+        self.assertSameResponse(AsyncUserProfileAPIView, url, user_id=self.user.pk)
+        url = reverse("user_profile", args=[0])
+        self.assertSameResponse(AsyncUserProfileAPIView, url, user_id=0)
+
+    def test_queries_run_concurrently_only_from_a_pool(self):
+        barrier = threading.Barrier(2, timeout=1)
+        calls = [(barrier.wait,), (barrier.wait,)]
+        # One by one, the first call waits for the second in vain
+        with self.assertRaises(threading.BrokenBarrierError):
+            async_to_sync(run_concurrently)(*calls)
+        barrier.reset()
+        # As configured with a pool: the worker threads' connections are
+        # handed back after each call rather than kept open
+        with mock.patch(
+            "rokto_dan.asyncviews._pooled", return_value=True
+        ), mock.patch.dict(connection.settings_dict, CONN_MAX_AGE=0):
+            async_to_sync(run_concurrently)(*calls)
+            self.assertSameResponse(
+                AsyncUserDashboardAPIView, reverse("user_dashboard")
+            )
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for histogram in HISTOGRAMS:
+            histogram.series.clear()
+        self.user = User.objects.create_user("donor")
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_records_queries_time_and_size_per_url_name(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("user_dashboard"))
+        # Read before the scrape request resets the connection's query log
+        query_count = len(queries)
+
+        metrics = self.scrape()
+        labels = 'view="user_dashboard",method="GET"'
+        self.assertIn(f"http_request_db_queries_count{{{labels}}} 1\n", metrics)
+        self.assertIn(
+            f"http_request_db_queries_sum{{{labels}}} {query_count}\n", metrics
+        )
+        self.assertIn(
+            f"http_response_size_bytes_sum{{{labels}}} {len(response.content)}\n",
+            metrics,
+        )
+        self.assertIn(
+            f'http_request_duration_seconds_bucket{{{labels},status="200",'
+            'le="+Inf"} 1\n',
+            metrics,
+        )
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get(reverse("user_dashboard"))
+        self.assertNotIn("user_dashboard", self.scrape())
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=1e-6)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs("rokto_dan.slow_requests") as logs:
+            self.client.get(reverse("user_dashboard"))
+        self.assertIn("(user_dashboard)", logs.output[0])
+        self.assertIn("blood_bloodrequest", logs.output[0])
+
+    def test_metrics_are_only_served_locally(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 404)
+
+
+class SeedAndBenchmarkTests(APITestCase):
+    def seed(self, *args):
+        call_command(
+            "seed_data", "--users=40", "--today=2025-01-01", *args, stdout=io.StringIO()
+        )
+        return (
+            list(
+                DonorProfile.objects.order_by("user__username").values_list(
+                    "user__username",
+                    "blood_group",
+                    "district",
+                    "is_available",
+                    "last_donation_date",
+                )
+            ),
+            list(
+                BloodRequest.objects.order_by(
+                    "requester__username", "request_date", "blood_group"
+                ).values_list(
+                    "requester__username", "blood_group", "request_date", "status"
+                )
+            ),
+        )
+
+    def test_seed_is_deterministic(self):
+        donors, requests = self.seed()
+        self.assertTrue(donors and requests)
+        self.assertEqual(self.seed("--clear"), (donors, requests))
+        self.assertNotEqual(self.seed("--clear", "--seed=1"), (donors, requests))
+
+    def test_benchmark_reports_json_and_keeps_no_writes(self):
+        self.seed()
+        requests = BloodRequest.objects.count()
+        out = io.StringIO()
+        call_command(
+            "benchmark",
+            "--requests=2",
+            "--warmup=0",
+            "--login-requests=1",
+            "--only",
+            "dashboard",
+            "donors?search",
+            "accept",
+            "login",
+            stdout=out,
+        )
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["meta"]["rows"]["users"], 40)
+        self.assertEqual(
+            set(report["results"]), {"dashboard", "donors?search", "accept", "login"}
+        )
+        for name, result in report["results"].items():
+            with self.subTest(name=name):
+                self.assertEqual(sum(result["status"].values()), result["requests"])
+                self.assertEqual(set(result["status"]), {"200"})
+                self.assertGreater(result["queries"]["min"], 0)
+        self.assertEqual(BloodRequest.objects.count(), requests)
+
+    def test_serializer_benchmark_renders_the_same_bytes(self):
+        self.seed()
+        out = io.StringIO()
+        call_command("benchmark_serializers", "--rows=20", "--repeat=1", stdout=out)
+
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual(
+            set(results), {"donors", "blood_requests", "donations", "users"}
+        )
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertTrue(result["same_bytes"])
+                self.assertGreater(result["rows"], 0)
+
+
+class RegistrationTests(APITestCase):
+    def setUp(self):
+        # Registrations are throttled per email address
+        cache.clear()
+
+    def register(self, username, email):
+        return self.client.post(
+            reverse("user_register"),
+            {
+                "username": username,
+                "first_name": "Test",
+                "last_name": "User",
+                "email": email,
+                "mobile_number": "01700000000",
+                "blood_group": "B-",
+                "password": "correct-horse-battery",
+                "confirm_password": "correct-horse-battery",
+            },
+        )
+
+    def test_profile_is_inserted_with_registration_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.register("alice", "alice@example.com")
+
+        self.assertEqual(response.status_code, 201)
+        profile = UserProfile.objects.get(user__username="alice")
+        self.assertEqual(
+            (profile.mobile_number, profile.blood_group), ("01700000000", "B-")
+        )
+        self.assertFalse(profile.user.is_active)
+        profile_writes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if "user_userprofile" in query["sql"]
+        ]
+        self.assertEqual(len(profile_writes), 1)
+        self.assertTrue(profile_writes[0].startswith("INSERT"))
+
+    def test_username_and_case_insensitive_email_must_be_free(self):
+        self.register("alice", "alice@example.com")
+
+        response = self.register("bob", "ALICE@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"email": ["Email already exists."]})
+
+        response = self.register("alice", "other@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), ["username"])
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_database_enforces_case_insensitive_email(self):
+        User.objects.create_user("alice", "alice@example.com")
+        # Users without an email do not collide
+        User.objects.create_user("nobody1")
+        User.objects.create_user("nobody2")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user("alice2", "Alice@Example.com")
+
+    def test_login_and_activation_do_not_write_profiles(self):
+        self.register("alice", "alice@example.com")
+        user = User.objects.get(username="alice")
+        DonorProfile.objects.create(
+            user=user, blood_group="B-", district="Dhaka", donor_type="regular"
+        )
+        uid = urlsafe_base64_encode(force_bytes(user.pk))
+        token = default_token_generator.make_token(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("activate", args=[uid, token]))
+            response = self.client.post(
+                reverse("login"),
+                {"username": "alice", "password": "correct-horse-battery"},
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in queries.captured_queries
+                if "_userprofile" in query["sql"] or "_donorprofile" in query["sql"]
+            ]
+        )
+
+    def test_username_change_touches_profiles(self):
+        user = User.objects.create_user("alice")
+        before = UserProfile.objects.get(user=user).updated_at
+        user.username = "alicia"
+        user.save()
+        self.assertGreater(UserProfile.objects.get(user=user).updated_at, before)
+
+
+@override_settings(
+    THROTTLE_RATES={"login_ip": "3/min", "login_user": "2/min", "register_ip": "1/h"}
+)
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        User.objects.create_user("donor", password="secret-password")
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(
+            TokenBucketThrottle, "timer", staticmethod(lambda: self.now)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, username="donor", address="10.0.0.1"):
+        return self.client.post(
+            reverse("login"),
+            {"username": username, "password": "wrong-password"},
+            REMOTE_ADDR=address,
+        )
+
+    def test_refused_logins_cost_no_query_or_password_hash(self):
+        for address in ["10.0.0.1", "10.0.0.2"]:
+            self.assertEqual(self.login(address=address).status_code, 401)
+
+        with mock.patch("user.views.authenticate") as authenticate:
+            with self.assertNumQueries(0):
+                response = self.login(address="10.0.0.3")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+        authenticate.assert_not_called()
+        # Basic auth credentials are not checked either
+        self.client.credentials(HTTP_AUTHORIZATION="Basic ZG9ub3I6eA==")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.login(address="10.0.0.4").status_code, 429)
+
+    def test_buckets_are_per_address_and_per_username_and_refill(self):
+        for username in ["a", "b", "c"]:
+            self.assertEqual(self.login(username).status_code, 401)
+        self.assertEqual(self.login("d").status_code, 429)
+        self.assertEqual(self.login("d", address="10.0.0.2").status_code, 401)
+        # Refused requests take tokens from the other buckets too
+        self.assertEqual(self.login("d", address="10.0.0.3").status_code, 429)
+
+        # A token comes back every 20 seconds per address, 30 per username
+        self.now += 20
+        self.assertEqual(self.login("e").status_code, 401)
+        self.assertEqual(self.login("f").status_code, 429)
+        self.now += 60
+        for username in ["d", "g", "h"]:
+            self.assertEqual(self.login(username).status_code, 401)
+
+    def test_registration_is_throttled_per_address(self):
+        response = self.client.post(reverse("user_register"), {})
+        self.assertEqual(response.status_code, 400)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse("user_register"), {})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "3600")
+
+
+class DummySMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for smtplib: records messages, optionally refuses."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost dummy SMTP")
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("RCPT") and self.server.refuse:
+                self.reply("550 mailbox unavailable")
+            elif command == "DATA":
+                self.reply("354 end with <CR><LF>.<CR><LF>")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.messages.append(data)
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class DummySMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), DummySMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refuse = False
+
+
+class EmailOutboxTests(APITestCase):
+    def setUp(self):
+        self.server = DummySMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        smtp_settings = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.server.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+        )
+        smtp_settings.enable()
+        self.addCleanup(smtp_settings.disable)
+
+    def register(self, username):
+        return self.client.post(
+            reverse("user_register"),
+            {
+                "username": username,
+                "first_name": "Test",
+                "last_name": "User",
+                "email": f"{username}@example.com",
+                "mobile_number": "01700000000",
+                "blood_group": "A+",
+                "password": "correct-horse-battery",
+                "confirm_password": "correct-horse-battery",
+            },
+        )
+
+    def test_registration_queues_email_without_smtp(self):
+        response = self.register("alice")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.server.connections, 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to, "alice@example.com")
+        self.assertIn("/users/users/activate/", email.html_body)
+
+    def test_worker_sends_batch_over_one_connection(self):
+        for i in range(3):
+            OutgoingEmail.objects.create(
+                subject="Hi", to=f"user{i}@example.com", html_body="<p>Hi</p>"
+            )
+
+        call_command("send_queued_email", stdout=io.StringIO())
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertFalse(
+            OutgoingEmail.objects.exclude(status=OutgoingEmail.SENT).exists()
+        )
+
+    def test_emails_claimed_by_another_worker_are_not_sent_twice(self):
+        for i in range(2):
+            OutgoingEmail.objects.create(subject="Hi", to=f"user{i}@example.com")
+        slow_batch = claim_batch(2)
+        # The slow worker's lease runs out and another worker takes over
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_emails(), (2, 0))
+
+        self.assertEqual(send_batch(slow_batch), (0, 0))
+        self.assertEqual(len(self.server.messages), 2)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=60)
+    def test_failed_sends_back_off_then_give_up(self):
+        self.server.refuse = True
+        email = OutgoingEmail.objects.create(subject="Hi", to="bob@example.com")
+
+        with self.assertLogs("user.mail", "WARNING"):
+            call_command("send_queued_email", stdout=io.StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs("user.mail", "WARNING"):
+            call_command("send_queued_email", stdout=io.StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.FAILED)
+        self.assertEqual(self.server.messages, [])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    A second alias on the test database stands in for the replica; rows are
+    committed, so both connections see them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the runner set up its databases, so allowed by hand
+        primary = connections["default"].settings_dict
+        connections.settings["replica"] = {
+            **primary,
+            "TEST": {**primary["TEST"], "MIRROR": "default"},
+        }
+        cls.databases = {*cls.databases, "replica"}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("donor", password="secret-password")
+        self.other = User.objects.create_user("other")
+        DonorProfile.objects.create(
+            user=self.other, blood_group="O+", district="Dhaka", donor_type="regular"
+        )
+        self.client = APIClient()
+
+    def get(self, path, user):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0].key}"
+        )
+        with CaptureQueriesContext(
+            connections["default"]
+        ) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_safe_requests_read_from_the_replica(self):
+        primary, replica = self.get(reverse("donor-list"), self.user)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_user_reads_own_writes_after_login(self):
+        response = self.client.post(
+            reverse("login"), {"username": "donor", "password": "secret-password"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        primary, replica = self.get(reverse("user_dashboard"), self.user)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        # Other users are not pinned
+        primary, replica = self.get(reverse("user_dashboard"), self.other)
+        self.assertEqual(primary, 0)
+
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            self.client.post(
+                reverse("login"), {"username": "donor", "password": "secret-password"}
+            )
+        primary, replica = self.get(reverse("user_dashboard"), self.user)
+        self.assertEqual(primary, 0)
+
+    def test_writes_and_reads_outside_requests_use_the_primary(self):
+        state = RoutingState(RequestFactory().get("/"))
+        token = current_state.set(state)
+        try:
+            donor = DonorProfile.objects.get()
+            self.assertEqual(donor._state.db, "replica")
+            # Related rows follow the instance they were read through
+            self.assertEqual(donor.user.username, "other")
+            donor.district = "Sylhet"
+            donor.save()
+            self.assertEqual(donor._state.db, "default")
+            self.assertTrue(state.pinned)
+            self.assertEqual(DonorProfile.objects.get()._state.db, "default")
+        finally:
+            current_state.reset(token)
+        self.assertEqual(DonorProfile.objects.get()._state.db, "default")
@@ -1,5 +1,7 @@
 from rest_framework.routers import DefaultRouter
+from django.conf import settings
 from django.urls import path, include
+from rokto_dan.asyncviews import read_async
 from . import views
 
 # Create a new router instance
@@ -22,3 +24,24 @@ urlpatterns = [
     ),
     path("", include(router.urls)),  # Include router URLs
 ]
+
+if settings.ASYNC_VIEWS:
+    # Same routes, answered by the async variants; matched before the ones
+    # above, so reverse() still finds the original names.
+    urlpatterns[:0] = [
+        path("dashboard/", views.AsyncUserDashboardAPIView.as_view()),
+        path(
+            "profile/<int:user_id>/",
+            read_async(
+                views.AsyncUserProfileAPIView.as_view(),
+                views.UserProfileAPIView.as_view(),
+            ),
+        ),
+        path(
+            "donors/",
+            read_async(
+                views.AsyncDonorListAPIView.as_view(),
+                views.DonorViewSet.as_view({"get": "list", "post": "create"}),
+            ),
+        ),
+    ]
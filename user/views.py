@@ -1,13 +1,15 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.models import User
-from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
-from rest_framework import viewsets, status, filters
+from rest_framework import generics, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -19,11 +21,33 @@ from .serializers import (
     UserSerializer,
     UserLoginSerializer,
     DonorProfileSerializer,
+    NearbyDonorSerializer,
+    NearbyDonorsQuerySerializer,
     UserProfileSerializer,
 )
 from .filters import DonorProfileFilter
-from blood.models import BloodRequest, Donation
+from .search import DonorSearchFilter
+from .bulk import DONOR_EXPORT_FIELDS, DonorImporter
+from rokto_dan.asyncviews import AsyncAPIView, run_concurrently
+from rokto_dan.bulk import BulkImportExportMixin
+from rokto_dan.throttling import AddressThrottle, UserThrottle
+from rokto_dan.values import ValuesListMixin, get_values_serializer
+from rokto_dan.conditional import (
+    ConditionalGetMixin,
+    not_modified,
+    object_validators,
+    set_validators,
+)
+from blood.models import BloodCompatibility, BloodRequest, Donation
 from blood.serializers import BloodRequestSerializer, DonationSerializer
+from blood.pagination import BloodRequestPagination, DonationPagination
+from .mail import queue_email
+from .cache import (
+    dashboard_cache_key,
+    get_cached_dashboard,
+    set_cached_dashboard,
+    set_cached_token,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -34,37 +58,83 @@ class UserDashboardAPIView(APIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BloodRequestSerializer
 
-    def get(self, request, *args, **kwargs):
-        user = request.user
-
-        # Fetch the user's own blood requests
-        user_requests = BloodRequest.objects.filter(requester=user)
-        user_requests_serializer = BloodRequestSerializer(user_requests, many=True)
+    # Each section is paginated independently, so every section gets its own
+    # cursor parameter, e.g. ``?pending_requests_cursor=...``.
+    sections = {
+        "my_requests": (BloodRequestPagination, BloodRequestSerializer),
+        "my_donations": (DonationPagination, DonationSerializer),
+        "pending_requests": (BloodRequestPagination, BloodRequestSerializer),
+    }
+
+    def get_section_querysets(self, user):
+        return {
+            # The user's own blood requests
+            "my_requests": BloodRequest.objects.filter(requester=user),
+            # The user's own donations
+            "my_donations": Donation.objects.filter(donor=user),
+            # Pending blood requests from everyone else
+            "pending_requests": BloodRequest.objects.filter(status="pending").exclude(
+                requester=user
+            ),
+        }
 
-        # Fetch the user's own donations
-        user_donations = Donation.objects.filter(donor=user)
-        user_donations_serializer = DonationSerializer(user_donations, many=True)
+    def get_section(self, name, queryset, request):
+        pagination_class, serializer_class = self.sections[name]
+        paginator = pagination_class()
+        paginator.cursor_query_param = f"{name}_cursor"
+        values = get_values_serializer(serializer_class)
+        if values is not None:
+            queryset = values.rows(queryset, paginator.ordering)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if values is not None:
+            data = values.to_representation(page)
+        else:
+            data = serializer_class(page, many=True).data
+        return paginator.get_paginated_response(data).data
 
-        # Fetch all pending blood requests (excluding the user's own requests)
-        pending_requests = BloodRequest.objects.exclude(requester=user)
-        pending_requests_serializer = BloodRequestSerializer(
-            pending_requests, many=True
-        )
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        cache_key = dashboard_cache_key(user.pk, request.get_full_path())
+        data = get_cached_dashboard(cache_key)
+        if data is not None:
+            return Response(data)
 
-        # Combine all the data
         data = {
-            "my_requests": user_requests_serializer.data,
-            "my_donations": user_donations_serializer.data,
-            "pending_requests": pending_requests_serializer.data,
+            name: self.get_section(name, queryset, request)
+            for name, queryset in self.get_section_querysets(user).items()
         }
+        set_cached_dashboard(cache_key, data)
+        return Response(data)
 
+
+# ASGI variant of the dashboard; with pooled connections the three sections
+# are queried at once
+class AsyncUserDashboardAPIView(AsyncAPIView, UserDashboardAPIView):
+    async def get(self, request, *args, **kwargs):
+        user = request.user
+        cache_key = await sync_to_async(dashboard_cache_key)(
+            user.pk, request.get_full_path()
+        )
+        data = await sync_to_async(get_cached_dashboard)(cache_key)
+        if data is not None:
+            return Response(data)
+
+        sections = self.get_section_querysets(user)
+        pages = await run_concurrently(
+            *(
+                (self.get_section, name, queryset, request)
+                for name, queryset in sections.items()
+            )
+        )
+        data = dict(zip(sections, pages))
+        await sync_to_async(set_cached_dashboard)(cache_key, data)
         return Response(data)
 
 
 # Read-only ViewSet for listing users, accessible only to admin users
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class UserViewSet(ValuesListMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = User.objects.all()
+    queryset = User.objects.only("id", "username", "first_name", "last_name", "email")
     serializer_class = UserSerializer
 
     def get(self, request, user_id):
@@ -86,13 +156,16 @@ class UserProfileAPIView(APIView):
     def get(self, request, user_id, *args, **kwargs):
         try:
             user_profile = UserProfile.objects.get(user__id=user_id)
-            serializer = UserProfileSerializer(user_profile)
-            return Response(serializer.data)
         except UserProfile.DoesNotExist:
             return Response(
                 {"error": "UserProfile not found."},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        validators = object_validators(request, user_profile)
+        response = not_modified(request, *validators)
+        if response is None:
+            response = Response(UserProfileSerializer(user_profile).data)
+        return set_validators(response, *validators)
 
     def post(self, request, *args, **kwargs):
         serializer = UserProfileSerializer(data=request.data)
@@ -102,38 +175,61 @@ class UserProfileAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# ASGI variant of UserProfileAPIView.get
+class AsyncUserProfileAPIView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, user_id, *args, **kwargs):
+        try:
+            user_profile = await UserProfile.objects.select_related("user").aget(
+                user__id=user_id
+            )
+        except UserProfile.DoesNotExist:
+            return Response(
+                {"error": "UserProfile not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        validators = object_validators(request, user_profile)
+        response = not_modified(request, *validators)
+        if response is None:
+            response = Response(UserProfileSerializer(user_profile).data)
+        return set_validators(response, *validators)
+
+
 # API View for User Registration with Email Confirmation
 class UserRegistrationApiView(APIView):
     serializer_class = RegistrationSerializer
+    # Every registration sends an email
+    throttle_classes = [AddressThrottle, UserThrottle]
+    throttle_scope = "register"
+    throttle_user_field = "email"
+
+    def perform_authentication(self, request):
+        # Throttle before authenticating: credentials sent along are not
+        # needed, and checking Basic auth would hash a password
+        pass
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            token = default_token_generator.make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            confirm_link = request.build_absolute_uri(
-                reverse("activate", kwargs={"uid64": uid, "token": token})
-            )
-            email_subject = "Confirm Your Email"
-            email_body = render_to_string(
-                "confirm_email.html", {"confirm_link": confirm_link}
-            )
-
-            try:
-                email = EmailMultiAlternatives(email_subject, "", to=[user.email])
-                email.attach_alternative(email_body, "text/html")
-                email.send()
-                return Response(
-                    {"message": "Check your email for confirmation."},
-                    status=status.HTTP_201_CREATED,
+            # The user row and its confirmation email are committed together;
+            # the send_queued_email worker delivers the email, so registration
+            # never waits on (or fails because of) the SMTP server.
+            with transaction.atomic():
+                user = serializer.save()
+                token = default_token_generator.make_token(user)
+                uid = urlsafe_base64_encode(force_bytes(user.pk))
+                confirm_link = request.build_absolute_uri(
+                    reverse("activate", kwargs={"uid64": uid, "token": token})
                 )
-            except Exception as e:
-                logger.error(f"Error sending email: {e}")
-                return Response(
-                    {"error": "Failed to send confirmation email."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                email_body = render_to_string(
+                    "confirm_email.html", {"confirm_link": confirm_link}
                 )
+                queue_email("Confirm Your Email", user.email, html_body=email_body)
+            return Response(
+                {"message": "Check your email for confirmation."},
+                status=status.HTTP_201_CREATED,
+            )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -148,7 +244,7 @@ def activate(request, uid64, token):
 
     if user is not None and default_token_generator.check_token(user, token):
         user.is_active = True
-        user.save()
+        user.save(update_fields=["is_active"])
         return redirect("login")
     else:
         return redirect("user_register")
@@ -156,6 +252,15 @@ def activate(request, uid64, token):
 
 # API View for User Login with Token Authentication
 class UserLoginApiView(APIView):
+    throttle_classes = [AddressThrottle, UserThrottle]
+    throttle_scope = "login"
+    throttle_user_field = "username"
+
+    def perform_authentication(self, request):
+        # A refused attempt costs no password hash or query (see
+        # UserRegistrationApiView)
+        pass
+
     def post(self, request):
         serializer = UserLoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -166,6 +271,10 @@ class UserLoginApiView(APIView):
             if user:
                 token, _ = Token.objects.get_or_create(user=user)
                 login(request, user)
+                # The next request authenticates before the router knows its
+                # user, so it could look a new token up on a lagging replica
+                token.user = user
+                set_cached_token(token)
                 return Response(
                     {"token": token.key, "user_id": user.id}, status=status.HTTP_200_OK
                 )
@@ -188,10 +297,77 @@ class UserLogoutView(APIView):
 
 
 # ViewSet for Managing Donor Profiles with Filtering and Search Capabilities
-class DonorViewSet(viewsets.ModelViewSet):
-    queryset = DonorProfile.objects.all()
+class DonorViewSet(ConditionalGetMixin, BulkImportExportMixin, viewsets.ModelViewSet):
+    # The serializer reads user.username/user.email, so join them in
+    queryset = DonorProfile.objects.select_related("user").only(
+        "id",
+        "blood_group",
+        "district",
+        "date_of_donation",
+        "last_donation_date",
+        "donor_type",
+        "is_available",
+        "latitude",
+        "longitude",
+        "updated_at",
+        "user__username",
+        "user__email",
+    )
     serializer_class = DonorProfileSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, DonorSearchFilter]
     filterset_class = DonorProfileFilter
-    search_fields = ["blood_group", "district", "date_of_donation", "donor_type"]
+    # Searched through indexes by DonorSearchFilter; blood group codes in the
+    # search terms are matched exactly
+    search_fields = ["district", "donor_type"]
+    importer_class = DonorImporter
+    export_fields = DONOR_EXPORT_FIELDS
+    export_filename = "donors"
+
+    @action(detail=False, methods=["get"])
+    def nearby(self, request):
+        """
+        The nearest available donors out of cooldown, within ``radius`` km of
+        ``latitude``/``longitude`` or of ``blood_request``'s location, who can
+        give to ``recipient_group`` (default: the blood request's group).
+        """
+        query = NearbyDonorsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        donors = self.get_queryset().eligible()
+        if "recipient_group" in params:
+            donors = donors.filter(
+                blood_group__in=BloodCompatibility.objects.filter(
+                    recipient_group=params["recipient_group"]
+                ).values("donor_group")
+            )
+        if "blood_request" in params:
+            donors = donors.exclude(user_id=params["blood_request"].requester_id)
+        donors = donors.nearest(
+            params["latitude"],
+            params["longitude"],
+            limit=params["limit"],
+            radius_km=params["radius"],
+        )
+        return Response(NearbyDonorSerializer(donors, many=True).data)
+
+
+# ASGI variant of the donor listing (DonorViewSet.list)
+class AsyncDonorListAPIView(
+    AsyncAPIView, ConditionalGetMixin, generics.GenericAPIView
+):
+    queryset = DonorViewSet.queryset
+    serializer_class = DonorViewSet.serializer_class
+    permission_classes = DonorViewSet.permission_classes
+    filter_backends = DonorViewSet.filter_backends
+    filterset_class = DonorViewSet.filterset_class
+    search_fields = DonorViewSet.search_fields
+
+    async def get(self, request, *args, **kwargs):
+        # Filter backends may look things up (e.g. installed extensions)
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        values = get_values_serializer(self.get_serializer_class())
+        if values is not None:
+            queryset = self.get_list_rows(values, queryset)
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        return self.conditional_list_response(values, page, True)